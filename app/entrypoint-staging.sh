@@ -18,4 +18,4 @@ echo "--------------------------------"
 ## Start App (already in /app)
 #/bin/bash -c 'source /app/.env_staging && python src/main.py'
 
-/bin/bash -c 'source /app/.env_staging && python manage.py run -h 0.0.0.0'
+/bin/bash -c 'source /app/.env_staging && exec python manage.py serve --bind 0.0.0.0:5000 --pid /tmp/yabook.pid'
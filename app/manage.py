@@ -1,10 +1,21 @@
+import sys
+import json
+import time
 import unittest
 
+import click
+
 # import coverage
 from flask.cli import FlaskGroup
 
 from project import create_app
-# from project.api.models import User   ## seeding
+from project.api.utils.mail import run_mail_worker
+from project.api.utils.database import db
+from project.api.utils.seed import seed_db, SEED_PASSWORD
+from project.api.utils.search import create_search_index
+from project.api.utils.schema import upgrade_schema
+from project.api.models.catalog_stats import rebuild as rebuild_catalog_stats
+from project.api.utils.bench import bench_app, compare, format_report
 
 app = create_app()
 cli = FlaskGroup(create_app=create_app)
@@ -25,20 +36,51 @@ cli = FlaskGroup(create_app=create_app)
 #     db.create_all()
 #     db.session.commit()
 
-# @cli.command()
-# def seed_db():
-#     """Seeds the database."""
-#     db.session.add(User(
-#         username='michael',
-#         email='michael@reallynotreal.com',
-#         password='greaterthaneight'
-#     ))
-#     db.session.add(User(
-#         username='michaelherman',
-#         email='michael@mherman.org',
-#         password='greaterthaneight'
-#     ))
-#     db.session.commit()
+@cli.command()
+@click.option('--authors', type=int, default=1000, help='Authors to generate')
+@click.option('--books-per-author', type=int, default=10, help='Books per author')
+@click.option('--users', type=int, default=100, help='Verified users to generate')
+@click.option('--seed', type=int, default=42, help='Random seed (same seed, same data set)')
+@click.option('--chunk-size', type=int, default=10000, help='Rows per COPY / executemany')
+@click.option('--password', default=SEED_PASSWORD, help='Password of every generated user')
+@click.option('--hash-each', is_flag=True,
+              help='One pbkdf2 hash per user instead of a single shared (pre-computed) one')
+@click.option('--user-prefix', default='user', help='Usernames are <prefix><n>')
+def seed(authors, books_per_author, users, seed, chunk_size, password, hash_each, user_prefix):
+    """ Bulk loads a synthetic catalog into the configured database"""
+    db.create_all()
+    start = time.perf_counter()
+    inserted = seed_db(authors, books_per_author, users, seed=seed, chunk_size=chunk_size,
+                       password=password, hash_each=hash_each, user_prefix=user_prefix,
+                       progress=lambda done: print(f"\r{done}", end='', flush=True))
+    elapsed = time.perf_counter() - start
+    total = sum(inserted.values())
+    print(f"\n=> {inserted} in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)")
+
+
+@cli.command('upgrade-schema')
+def upgrade_db_schema():
+    """ Adds the columns and indexes missing from a database created by an earlier version"""
+    db.create_all()
+    with db.engine.begin() as connection:
+        upgrade_schema(connection)
+    print("=> schema up to date")
+
+
+@cli.command('search-index')
+def search_index():
+    """ Creates (or rebuilds) the full-text search index of an existing database"""
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    print("=> search index ready")
+
+
+@cli.command('stats-rebuild')
+def stats_rebuild():
+    """ Recomputes the catalog statistics (for a database populated before them)"""
+    with db.engine.begin() as connection:
+        rebuild_catalog_stats(connection)
+    print("=> catalog statistics rebuilt")
 
 
 @cli.command()
@@ -51,6 +93,78 @@ def test():
     return 1
 
 
+@cli.command()
+@click.option('--bind', default=app.config['YABOOK_SERVE_BIND'], help='host:port to listen on')
+@click.option('--workers', type=int, default=int(app.config['YABOOK_SERVE_WORKERS']),
+              help='Number of worker processes')
+@click.option('--threads', type=int, default=int(app.config['YABOOK_SERVE_THREADS']),
+              help='Threads per worker (> 1 selects the gthread worker class)')
+@click.option('--worker-class', type=click.Choice(['sync', 'gthread', 'gevent']),
+              default=app.config['YABOOK_SERVE_WORKER_CLASS'],
+              help='gevent => cooperative (greenlet) workers, psycopg2 patched by psycogreen')
+@click.option('--timeout', type=int, default=30, help='Seconds before a silent worker is restarted')
+@click.option('--graceful-timeout', type=int, default=30,
+              help='Seconds given to in-flight requests on reload / shutdown')
+@click.option('--max-requests', type=int, default=0,
+              help='Recycle a worker after that many requests (0: never)')
+@click.option('--pid', 'pidfile', default=None, help='PID file (kill -HUP $(cat pidfile) to reload)')
+@click.option('--preload/--no-preload', default=False,
+              help='Load the app once in the master before forking the workers '
+                   '(HUP then no longer loads new code, see utils/server.py)')
+def serve(bind, workers, threads, worker_class, timeout, graceful_timeout, max_requests,
+          pidfile, preload):
+    """ Runs the app under a prefork multi-worker WSGI server (gunicorn)"""
+    from project.api.utils.server import serve as gunicorn_serve
+
+    gunicorn_serve(create_app, bind=bind, workers=workers, threads=threads,
+                   worker_class=worker_class, timeout=timeout,
+                   graceful_timeout=graceful_timeout, max_requests=max_requests,
+                   pidfile=pidfile, preload=preload)
+
+
+@cli.command('mail-worker')
+@click.option('--once', is_flag=True, help='Deliver one batch and exit')
+@click.option('--interval', type=float, default=None, help='Seconds between polls of an empty outbox')
+def mail_worker(once, interval):
+    """ Delivers the e-mail outbox (one SMTP connection per batch)"""
+    run_mail_worker(once=once, interval=interval)
+
+
+@cli.command()
+@click.option('--authors', type=int, default=50, help='Authors in the seeded data set')
+@click.option('--books-per-author', type=int, default=20, help='Books per author')
+@click.option('--users', type=int, default=5, help='Verified users (login scenario)')
+@click.option('--iterations', type=int, default=200, help='Requests per scenario')
+@click.option('--scenario', 'only', multiple=True, help='Run only this scenario (repeatable)')
+@click.option('--db-url', default=None,
+              help='Scratch database to seed (default: a throw-away SQLite file)')
+@click.option('--output', default='bench.json', help='Where the JSON report is written')
+@click.option('--compare', 'baseline', type=click.Path(exists=True), default=None,
+              help='Baseline report, exits 1 on regression')
+@click.option('--threshold', type=float, default=0.2,
+              help='Tolerated p95 / throughput degradation vs the baseline (0.2 = 20%)')
+def bench(authors, books_per_author, users, iterations, only, db_url, output, baseline,
+          threshold):
+    """ Seeds a data set and benchmarks every route through the test client"""
+    report = bench_app(create_app, db_url=db_url, authors=authors,
+                       books_per_author=books_per_author, users=users,
+                       iterations=iterations, only=only)
+    print(format_report(report))
+
+    with open(output, 'w') as out:
+        json.dump(report, out, indent=2)
+    print(f"=> report written to {output}")
+
+    if baseline:
+        with open(baseline) as infile:
+            regressions = compare(report, json.load(infile), threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"=> no regression vs {baseline}")
+
+
 # @cli.command()
 # def cov():
 #     """Runs the unit tests with coverage."""
@@ -1,14 +1,22 @@
 import os, sys, logging
 
-from flask import Flask, jsonify, Blueprint, request
-from flask_jwt_extended import JWTManager
-from flask_swagger import swagger
+from flask import Flask, jsonify, Blueprint, request, g, Response
+from flask_jwt_extended import JWTManager, jwt_required
 from flask_swagger_ui import get_swaggerui_blueprint
 
-from project.api.utils.database import db
+from project.api.utils.database import db, engine_options, pool_stats
 from project.api.utils.responses import response_with
 from project.api.utils import responses as resp
 from project.api.utils.mail import mail
+from project.api.utils.cache import cache
+from project.api.utils.hashing import hasher
+from project.api.utils.timing import start_timing, finish_timing
+from project.api.utils.metrics import metrics
+from project.api.utils.json_encoding import json_provider
+from project.api.utils.revocation import revocation
+from project.api.utils.compression import compression
+from project.api.utils.spec import api_spec
+from project.api.utils.schema import upgrade_schema
 
 from project.api.routes.authors import author_routes
 from project.api.routes.books import book_routes
@@ -35,12 +43,21 @@ def create_app():
         app.config.from_object(DevelopmentConfig())
         print("=> DEBUG: ", app.config)
 
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
     app.register_blueprint(author_routes, url_prefix=app.config['URL_PREFIX'] + 'authors')
     app.register_blueprint(book_routes, url_prefix=app.config['URL_PREFIX'] + 'books')
     app.register_blueprint(user_routes, url_prefix=app.config['URL_PREFIX'] + 'users')
 
+    @app.before_request
+    def start_request_timing():
+        start_timing()
+
     @app.after_request
     def add_header(response):
+        response = compression.process(response)
+        response = finish_timing(response)
+        metrics.record_request(response, g.get('request_duration'))
         return response
 
     @app.errorhandler(400)
@@ -55,24 +72,57 @@ def create_app():
 
     @app.errorhandler(500)
     def server_error(err):
-        logging.error(e)
+        logging.error(err)
         return response_with(resp.SERVER_ERROR_500)
 
     @app.route("/api/spec")
     def spec():
-        swag = swagger(app, prefix=app.config['URL_PREFIX'])
-        swag['info']['base'] = request.host_url  # "http://localhost:5000"
-        swag['info']['version'] = app.config['API_VER']
-        swag['info']['title'] = app.config['APP_NAME']
-        return jsonify(swag)
+        return api_spec.response()  # built once, only the host url is per request
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    ## operational stats (topology, load, hit rates) are for the operators only
+    @app.route("/api/cache/stats")
+    @jwt_required
+    def cache_stats():
+        return response_with(resp.SUCCESS_200, value={'cache': cache.stats()})
+
+    @app.route("/api/db/stats")
+    @jwt_required
+    def db_stats():
+        return response_with(resp.SUCCESS_200, value={'pool': pool_stats(db.engine)})
+
+    @app.route("/api/hashing/stats")
+    @jwt_required
+    def hashing_stats():
+        return response_with(resp.SUCCESS_200, value={'hashing': hasher.stats()})
+
+    @app.route("/api/revocation/stats")
+    @jwt_required
+    def revocation_stats():
+        return response_with(resp.SUCCESS_200, value={'revocation': revocation.stats()})
+
+    @app.route("/api/compression/stats")
+    @jwt_required
+    def compression_stats():
+        return response_with(resp.SUCCESS_200, value={'compression': compression.stats()})
 
     jwt = JWTManager(app)
     mail.init_app(app)
+    cache.init_app(app)
+    hasher.init_app(app)
+    metrics.init_app(app)
+    json_provider.init_app(app)
+    revocation.init_app(app, jwt)
+    compression.init_app(app)
 
     swaggerui_blueprint = get_swaggerui_blueprint('/api/docs', '/api/spec',
                                                   config={'app_name': app.config['APP_NAME']})
     app.register_blueprint(swaggerui_blueprint,
                            url_prefix='/api/docs') # SWAGGER_URL)  # where is it define?
+    api_spec.init_app(app)  # every route is registered by now
 
 
     if os.environ.get('FLASK_ENV') != 'testing':
@@ -80,6 +130,8 @@ def create_app():
 
         with app.app_context():
             db.create_all()
+            with db.engine.begin() as connection:
+                upgrade_schema(connection)
 
     ## Using the expired_token_loader decorator, we will now call
     ## this function whenever an expired but otherwise valid access
@@ -93,5 +145,9 @@ def create_app():
         }
         return response_with(resp.UNAUTHORIZED_401, value)
 
+    @jwt.revoked_token_loader
+    def revoked_token_callback():
+        return response_with(resp.UNAUTHORIZED_401, {'msg': 'The token has been revoked'})
+
     app.shell_context_processor({'app': app, 'db': db})
     return app
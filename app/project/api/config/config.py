@@ -18,9 +18,41 @@ class Config(object):
     CSRF_ENABLED = False # Because API
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     YABOOK_ITEMS_PER_PAGE = 3
+    YABOOK_MAX_ITEMS_PER_PAGE = 100  # upper bound for ?limit= (cursor mode)
+    YABOOK_MAX_IDS_PER_REQUEST = 100  # upper bound for ?ids= (multi-get)
+    YABOOK_BULK_CHUNK_SIZE = 1000    # rows per executemany in bulk endpoints
+    YABOOK_BULK_MAX_ROWS = 100000    # rows per bulk request
+    YABOOK_EXPORT_BATCH_SIZE = 1000  # rows fetched / written at once by export endpoints
+
+    YABOOK_CACHE_BACKEND = assign_with_default('YABOOK_CACHE_BACKEND', 'local')  # local | redis | null
+    YABOOK_CACHE_MAX_ENTRIES = 1024  # local backend only (LRU bound)
+    YABOOK_CACHE_TTL = 300           # seconds
+    YABOOK_CACHE_REDIS_URL = assign_with_default('YABOOK_CACHE_REDIS_URL', None)
+
+    YABOOK_HASH_WORKERS = assign_with_default('YABOOK_HASH_WORKERS', 2)  # 0 => inline
+    YABOOK_HASH_MAX_PENDING = 16     # queued + running hash jobs before answering 503
+    YABOOK_HASH_TIMEOUT = 5.0        # seconds
+    YABOOK_HASH_RETRY_AFTER = 1      # seconds, Retry-After of the 503
 
     EMAIL_TOKEN_EXP = assign_with_default('EMAIL_TOKEN_EXP', 3600)
 
+    YABOOK_JSON_ENCODER = assign_with_default('YABOOK_JSON_ENCODER', 'auto')  # auto | orjson | stdlib
+
+    YABOOK_SPEC_EAGER = assign_with_default('YABOOK_SPEC_EAGER', '') == '1'  # build at startup
+
+    YABOOK_COMPRESS = True            # negotiated br / gzip Content-Encoding
+    YABOOK_COMPRESS_MIN_SIZE = 500    # bytes, smaller bodies are sent as is
+    YABOOK_COMPRESS_LEVEL = assign_with_default('YABOOK_COMPRESS_LEVEL', 6)  # gzip, 1-9
+    YABOOK_COMPRESS_BROTLI = True     # when the brotli package is installed
+    YABOOK_COMPRESS_BROTLI_QUALITY = assign_with_default('YABOOK_COMPRESS_BROTLI_QUALITY', 4)  # 0-11
+    YABOOK_COMPRESS_CACHE_ENTRIES = 64  # precompressed bodies kept (LRU), 0 => none
+
+    YABOOK_SERVER_TIMING = True      # Server-Timing header (db, dump, total) on every response
+    YABOOK_TIMING_LOG_SAMPLE = assign_with_default('YABOOK_TIMING_LOG_SAMPLE', 0.0)  # fraction logged
+
+    YABOOK_METRICS_DIR = assign_with_default('YABOOK_METRICS_DIR', None)  # shared by workers
+    YABOOK_METRICS_FLUSH_INTERVAL = 1.0  # seconds between two snapshots of a worker
+
     URL_PREFIX = '/api/'
     HOST = '0.0.0.0'  ## Externalized
     PORT = 5000
@@ -29,10 +61,30 @@ class Config(object):
 
     SQLALCHEMY_DATABASE_URI = assign_or_raise('DB_URL')
 
+    ## engine / pool (PostgreSQL) - the DB role is capped at 128 connections, keep
+    ## workers x (POOL_SIZE + MAX_OVERFLOW) below that
+    YABOOK_DB_POOL_SIZE = assign_with_default('YABOOK_DB_POOL_SIZE', 5)
+    YABOOK_DB_MAX_OVERFLOW = assign_with_default('YABOOK_DB_MAX_OVERFLOW', 5)
+    YABOOK_DB_POOL_TIMEOUT = 10      # seconds waiting for a connection before giving up
+    YABOOK_DB_POOL_RECYCLE = 1800    # seconds
+    YABOOK_DB_POOL_PRE_PING = True
+    YABOOK_DB_PGBOUNCER = assign_with_default('YABOOK_DB_PGBOUNCER', '') == '1'  # transaction mode
+
+    ## manage.py serve (gunicorn)
+    YABOOK_SERVE_BIND = assign_with_default('YABOOK_SERVE_BIND', '0.0.0.0:5000')
+    YABOOK_SERVE_WORKERS = assign_with_default('WEB_CONCURRENCY', 2)
+    YABOOK_SERVE_THREADS = assign_with_default('YABOOK_SERVE_THREADS', 1)
+    YABOOK_SERVE_WORKER_CLASS = assign_with_default('YABOOK_SERVE_WORKER_CLASS', 'sync')
+
     JWT_ACCESS_TOKEN_EXPIRES = assign_with_default('JWT_ACCESS_TOKEN_EXPIRES', 600)
     JWT_REFRESH_TOKEN_EXPIRES = assign_with_default('JWT_REFRESH_TOKEN_EXPIRES', 86400)
 
     JWT_SECRET_KEY = assign_or_raise('JWT_SECRET_KEY')
+    JWT_BLACKLIST_ENABLED = True     # revoked tokens (logout), see utils/revocation.py
+    JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
+    YABOOK_REVOCATION_REFRESH = 1.0  # seconds before a worker sees another worker's revocations
+    YABOOK_REVOCATION_MARGIN = 60    # seconds of revocations re-read on refresh (late commits)
+    YABOOK_REVOCATION_PRUNE_INTERVAL = 3600  # seconds between two deletions of expired rows
     SECRET_KEY = assign_or_raise('SECRET_KEY')
     SECURITY_PASSWORD_SALT= assign_or_raise('SECURITY_PASSWORD_SALT')
 
@@ -44,6 +96,12 @@ class Config(object):
     MAIL_USE_TLS        = True
     MAIL_USE_SSL        = False
 
+    YABOOK_MAIL_BATCH_SIZE = 50      # e-mails sent per SMTP connection by the mail worker
+    YABOOK_MAIL_MAX_ATTEMPTS = 5
+    YABOOK_MAIL_BACKOFF = 30         # seconds, doubled on each failed attempt
+    YABOOK_MAIL_MAX_BACKOFF = 3600
+    YABOOK_MAIL_POLL_INTERVAL = 5    # seconds between two polls of an empty outbox
+
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -78,5 +136,6 @@ class TestingConfig(Config):
     MAIL_USE_SSL= False
 
     JWT_ACCESS_TOKEN_EXPIRES=60
+    YABOOK_HASH_WORKERS = 0  # inline, no process pool per test app
     # not yet
     # UPLOAD_FOLDER= 'images'
@@ -2,6 +2,7 @@ from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
 from project.api.utils.database import db
+from project.api.utils.timing import TimedSchemaMixin
 from project.api.models.books import BookSchema
 
 ## Author Model
@@ -13,8 +14,11 @@ class Author(db.Model):
     last_name = db.Column(db.String(20))
 
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+    version = db.Column(db.Integer, nullable=False, server_default='1')  # row version (ETag)
     books = db.relationship('Book', backref='Author', cascade="all, delete-orphan")
 
+    __mapper_args__ = {'version_id_col': version}
+
     def __init__(self, first_name, last_name, books=[]):
         self.first_name = first_name
         self.last_name = last_name
@@ -26,12 +30,13 @@ class Author(db.Model):
         return self
 
 ## Author Serialization
-class AuthorSchema(ModelSchema):
+class AuthorSchema(TimedSchemaMixin, ModelSchema):
     class Meta(ModelSchema.Meta):
         model = Author
         sqla_session = db.session
 
     id = fields.Number(dump_only=True)
+    version = fields.Integer(dump_only=True)
     first_name = fields.String(required=True)
     last_name = fields.String(required=True)
     created = fields.String(dump_only=True)
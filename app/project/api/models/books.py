@@ -1,7 +1,9 @@
+from sqlalchemy import event, DDL
 from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
 from project.api.utils.database import db
+from project.api.utils.timing import TimedSchemaMixin
 
 ## Book Model
 class Book(db.Model):
@@ -10,7 +12,22 @@ class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(50))
     year = db.Column(db.Integer)
-    author_id = db.Column(db.Integer, db.ForeignKey('authors.id'))
+    # active history: moving a book outdates its previous author too (see change_counters)
+    author_id = db.column_property(db.Column(db.Integer, db.ForeignKey('authors.id')),
+                                   active_history=True)
+    version = db.Column(db.Integer, nullable=False, server_default='1')  # row version (ETag)
+
+    __mapper_args__ = {'version_id_col': version}
+
+    # one index per filter / sort combination allowed by the list endpoint:
+    # [author_id =] [year range | title prefix] ORDER BY <sort column>, id
+    __table_args__ = (
+        db.Index('ix_books_author_id', 'author_id', 'id'),
+        db.Index('ix_books_author_year', 'author_id', 'year', 'id'),
+        db.Index('ix_books_author_title', 'author_id', 'title', 'id'),
+        db.Index('ix_books_year', 'year', 'id'),
+        db.Index('ix_books_title', 'title', 'id'),
+    )
 
     def __init__(self, title, year, author_id=None):
         self.title = title
@@ -23,13 +40,26 @@ class Book(db.Model):
         return self
 
 
+# PostgreSQL: ?title_prefix= is a LIKE 'prefix%' (see prefix_match), only a
+# text_pattern_ops index serves it under a non-C collation - sorting by title still
+# needs the plain ones above
+PATTERN_INDEXES = (('ix_books_title_pattern', 'title text_pattern_ops, id'),
+                   ('ix_books_author_title_pattern', 'author_id, title text_pattern_ops, id'))
+
+for _name, _columns in PATTERN_INDEXES:
+    event.listen(Book.__table__, 'after_create',
+                 DDL(f'CREATE INDEX IF NOT EXISTS {_name} ON books ({_columns})')
+                 .execute_if(dialect='postgresql'))
+
+
 ## Book Serialization
-class BookSchema(ModelSchema):
+class BookSchema(TimedSchemaMixin, ModelSchema):
     class Meta(ModelSchema.Meta):
         model = Book
         sqla_session = db.session
 
     id = fields.Number(dump_only=True)
+    version = fields.Integer(dump_only=True)
     title = fields.String(required=True)
     year = fields.Integer(required=True)
     author_id = fields.Integer(required=True)
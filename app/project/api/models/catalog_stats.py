@@ -0,0 +1,208 @@
+from collections import Counter
+
+from sqlalchemy import event, func, case, inspect, text
+
+from project.api.utils.database import db
+
+## Catalog statistics maintained incrementally, in the same transaction as the writes:
+## the ORM writes through the after_flush hook below, Core bulk inserts through
+## record_inserts. Reading them is a primary key lookup, never a GROUP BY over books.
+
+class CatalogTotal(db.Model):
+    __tablename__ = 'catalog_totals'
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class BookYearCount(db.Model):
+    __tablename__ = 'book_year_counts'
+
+    year = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class AuthorStats(db.Model):
+    __tablename__ = 'author_stats'
+
+    author_id = db.Column(db.Integer, db.ForeignKey('authors.id', ondelete='CASCADE'),
+                          primary_key=True)
+    book_count = db.Column(db.BigInteger, nullable=False, default=0)
+    first_year = db.Column(db.Integer)
+    last_year = db.Column(db.Integer)
+
+
+def _upsert_supported(connection):
+    "INSERT ... ON CONFLICT DO UPDATE: PostgreSQL, SQLite >= 3.24"
+    dialect = connection.dialect
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= (3, 24, 0)
+    return dialect.name == 'postgresql'
+
+
+## The first writes of a key are concurrent => a single upsert statement where supported,
+## UPDATE then INSERT otherwise (two transactions may then both INSERT, one fails)
+
+def _add(connection, model, key, delta):
+    "col = col + delta, the row is created when it does not exist yet"
+    table = model.__table__
+    pk = table.primary_key.columns.values()[0]
+    col = table.c.value if model is CatalogTotal else table.c.count
+    if _upsert_supported(connection):
+        connection.execute(text(
+            f"INSERT INTO {table.name} ({pk.name}, {col.name}) VALUES (:key, :delta) "
+            f"ON CONFLICT ({pk.name}) DO UPDATE "
+            f"SET {col.name} = {table.name}.{col.name} + excluded.{col.name}"),
+            key=key, delta=delta)
+        return
+
+    res = connection.execute(table.update().where(pk == key).values({col: col + delta}))
+    if res.rowcount == 0:
+        connection.execute(table.insert().values({pk.name: key, col.name: delta}))
+
+
+# NULL years (no year, or only removals) compare false => the stored bound is kept
+AUTHOR_STATS_UPSERT = text(
+    "INSERT INTO author_stats (author_id, book_count, first_year, last_year) "
+    "VALUES (:author_id, :count, :first, :last) "
+    "ON CONFLICT (author_id) DO UPDATE SET "
+    "book_count = author_stats.book_count + excluded.book_count, "
+    "first_year = CASE WHEN author_stats.first_year IS NULL "
+    "OR excluded.first_year < author_stats.first_year "
+    "THEN excluded.first_year ELSE author_stats.first_year END, "
+    "last_year = CASE WHEN author_stats.last_year IS NULL "
+    "OR excluded.last_year > author_stats.last_year "
+    "THEN excluded.last_year ELSE author_stats.last_year END")
+
+
+def _record(connection, added=(), removed=(), authors=0, removed_authors=()):
+    """
+    added / removed: (author_id, year) of the books inserted / deleted - an update is a
+    removal of the old values plus an addition of the new ones
+    """
+    table = AuthorStats.__table__
+    years = Counter(year for _, year in added if year is not None)
+    years.subtract(year for _, year in removed if year is not None)
+    for year, delta in sorted(years.items()):  # stable order => no lock inversion
+        if delta:
+            _add(connection, BookYearCount, year, delta)
+
+    for name, delta in (('books', len(added) - len(removed)), ('authors', authors)):
+        if delta:
+            _add(connection, CatalogTotal, name, delta)
+
+    per_author = {}
+    for author_id, year in added:
+        if author_id is not None:
+            count, first, last = per_author.get(author_id, (0, None, None))
+            if year is not None:
+                first = year if first is None else min(first, year)
+                last = year if last is None else max(last, year)
+            per_author[author_id] = (count + 1, first, last)
+
+    shrunk = set()
+    for author_id, _ in removed:
+        if author_id is not None and author_id not in removed_authors:
+            count, first, last = per_author.get(author_id, (0, None, None))
+            per_author[author_id] = (count - 1, first, last)
+            shrunk.add(author_id)
+
+    upsert = _upsert_supported(connection)
+    for author_id in sorted(per_author):
+        count, first, last = per_author[author_id]
+        if upsert:
+            connection.execute(AUTHOR_STATS_UPSERT, author_id=author_id, count=count,
+                               first=first, last=last)
+            continue
+
+        values = {'book_count': table.c.book_count + count}
+        if first is not None:
+            values['first_year'] = case([(table.c.first_year.is_(None), first),
+                                         (table.c.first_year > first, first)],
+                                        else_=table.c.first_year)
+            values['last_year'] = case([(table.c.last_year.is_(None), last),
+                                        (table.c.last_year < last, last)],
+                                       else_=table.c.last_year)
+        res = connection.execute(table.update().where(table.c.author_id == author_id).values(values))
+        if res.rowcount == 0:
+            connection.execute(table.insert().values(author_id=author_id, book_count=count,
+                                                     first_year=first, last_year=last))
+
+    # a removed book may have been the first / last one: one (author_id, year) index probe
+    books = db.Model.metadata.tables['books']
+    for author_id in sorted(shrunk):
+        first, last = connection.execute(
+            db.select([func.min(books.c.year), func.max(books.c.year)])
+            .where(books.c.author_id == author_id)).first()
+        connection.execute(table.update().where(table.c.author_id == author_id)
+                           .values(first_year=first, last_year=last))
+
+    if removed_authors:
+        connection.execute(table.delete().where(table.c.author_id.in_(sorted(removed_authors))))
+
+
+def record_inserts(connection, table_name, rows):
+    "Core inserts (bulk, seed) bypass the ORM flush hook"
+    if table_name == 'books':
+        _record(connection, added=[(row.get('author_id'), row.get('year')) for row in rows])
+    elif table_name == 'authors':
+        _record(connection, authors=len(rows))
+
+
+def _old_value(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_on_flush(session, flush_context):
+    added, removed, authors, removed_authors = [], [], 0, set()
+    for obj in session.new:
+        name = getattr(obj, '__tablename__', None)
+        if name == 'books':
+            added.append((obj.author_id, obj.year))
+        elif name == 'authors':
+            authors += 1
+
+    for obj in session.dirty:
+        if getattr(obj, '__tablename__', None) == 'books' and session.is_modified(obj):
+            old = (_old_value(obj, 'author_id'), _old_value(obj, 'year'))
+            if old != (obj.author_id, obj.year):
+                removed.append(old)
+                added.append((obj.author_id, obj.year))
+
+    for obj in session.deleted:
+        name = getattr(obj, '__tablename__', None)
+        if name == 'books':
+            removed.append((_old_value(obj, 'author_id'), _old_value(obj, 'year')))
+        elif name == 'authors':
+            authors -= 1
+            removed_authors.add(obj.id)
+
+    if added or removed or authors:
+        _record(session.connection(), added, removed, authors, removed_authors)
+
+
+def rebuild(connection):
+    "Recomputes every summary from scratch - for a database populated before them"
+    books, authors = db.Model.metadata.tables['books'], db.Model.metadata.tables['authors']
+    for model in (CatalogTotal, BookYearCount, AuthorStats):
+        connection.execute(model.__table__.delete())
+
+    def count(table):
+        return connection.execute(db.select([func.count()]).select_from(table)).scalar()
+
+    connection.execute(CatalogTotal.__table__.insert(), [
+        {'name': 'books', 'value': count(books)},
+        {'name': 'authors', 'value': count(authors)},
+    ])
+    connection.execute(BookYearCount.__table__.insert().from_select(
+        ['year', 'count'],
+        db.select([books.c.year, func.count()])
+        .where(books.c.year.isnot(None))
+        .group_by(books.c.year)))
+    connection.execute(AuthorStats.__table__.insert().from_select(
+        ['author_id', 'book_count', 'first_year', 'last_year'],
+        db.select([books.c.author_id, func.count(), func.min(books.c.year), func.max(books.c.year)])
+        .where(books.c.author_id.isnot(None))
+        .group_by(books.c.author_id)))
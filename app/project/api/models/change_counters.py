@@ -0,0 +1,79 @@
+from sqlalchemy import event, inspect
+
+from project.api.utils.database import db
+
+TRACKED_TABLES = ('authors', 'books')
+
+## Per-table change counter: bumped in the same transaction as any write to a tracked
+## table, so (table, counter) identifies the content of a list without reading it
+class ChangeCounter(db.Model):
+    __tablename__ = 'change_counters'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    counter = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, connection, table_names):
+        table = cls.__table__
+        for name in sorted(set(table_names)):  # stable order => no lock inversion
+            res = connection.execute(
+                table.update()
+                .where(table.c.table_name == name)
+                .values(counter=table.c.counter + 1))
+            if res.rowcount == 0:
+                connection.execute(table.insert().values(table_name=name, counter=1))
+
+    @classmethod
+    def current(cls, table_names):
+        rows = db.session.query(cls.table_name, cls.counter) \
+                         .filter(cls.table_name.in_(table_names)).all()
+        counters = dict.fromkeys(table_names, 0)
+        counters.update(rows)
+        return counters
+
+
+@event.listens_for(ChangeCounter.__table__, 'after_create')
+def _seed_counters(table, connection, **kw):
+    connection.execute(table.insert(), [{'table_name': name, 'counter': 0}
+                                        for name in TRACKED_TABLES])
+
+
+## The books are embedded in the representation of their author => a book write bumps
+## the row version of its author(s), the author's ETag / cache entry need nothing else
+def bump_author_versions(connection, author_ids):
+    author_ids = sorted({id for id in author_ids if id is not None})  # stable lock order
+    if author_ids:
+        authors = db.Model.metadata.tables['authors']
+        connection.execute(authors.update()
+                           .where(authors.c.id.in_(author_ids))
+                           .values(version=authors.c.version + 1))
+
+
+def _book_author_ids(book):
+    history = inspect(book).attrs.author_id.history  # a moved book changes both authors
+    return {book.author_id, *history.deleted}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    touched, book_authors, new_authors = set(), set(), set()
+    for obj in session.new | session.dirty | session.deleted:
+        name = getattr(obj, '__tablename__', None)
+        if name in TRACKED_TABLES:
+            touched.add(name)
+        if name == 'authors' and obj in session.deleted:
+            touched.add('books')  # delete-orphan cascade
+        if name == 'authors' and obj not in session.dirty:
+            new_authors.add(obj.id)  # inserted or deleted: no previous version to outdate
+        if name == 'books':
+            book_authors.update(_book_author_ids(obj))
+
+    if touched:
+        ChangeCounter.bump(session.connection(), touched)
+
+    book_authors -= new_authors
+    if book_authors:
+        bump_author_versions(session.connection(), book_authors)
+        for obj in list(session.identity_map.values()):  # reloaded on next access
+            if getattr(obj, '__tablename__', None) == 'authors' and obj.id in book_authors:
+                session.expire(obj, ['version'])
@@ -0,0 +1,38 @@
+import datetime
+
+from project.api.utils.database import db
+
+## Outgoing e-mail, written in the same transaction as whatever triggers it and
+## delivered later by the mail worker (manage.py mail-worker)
+class OutboxEmail(db.Model):
+    __tablename__ = 'email_outbox'
+
+    PENDING, SENT, FAILED = 'pending', 'sent', 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(256), nullable=False)
+    subject = db.Column(db.String(256), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),)
+
+    def __init__(self, recipient, subject, html):
+        self.recipient = recipient
+        self.subject = subject
+        self.html = html
+
+    @classmethod
+    def due(cls, limit, now=None):
+        now = now or datetime.datetime.utcnow()
+        # SKIP LOCKED (PostgreSQL): several workers can drain the outbox concurrently
+        return cls.query.filter(cls.status == cls.PENDING, cls.next_attempt_at <= now) \
+                        .order_by(cls.id) \
+                        .limit(limit) \
+                        .with_for_update(skip_locked=True) \
+                        .all()
@@ -0,0 +1,27 @@
+import datetime
+
+from project.api.utils.database import db
+
+## Revoked JWTs - workers pull the rows revoked since their last refresh (revoked_at,
+## read with an overlap). A row revokes either one token (jti), until it expires, or
+## every token of an identity issued up to not_after (iat, seconds since the epoch).
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True)
+    identity = db.Column(db.String(512), nullable=False)
+    not_after = db.Column(db.BigInteger)
+    expires_at = db.Column(db.DateTime)   # None: the token never expires
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+        db.Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
+
+    def __init__(self, identity, jti=None, not_after=None, expires_at=None):
+        self.identity = identity
+        self.jti = jti
+        self.not_after = not_after
+        self.expires_at = expires_at
@@ -5,6 +5,7 @@ from marshmallow_sqlalchemy import ModelSchema
 from marshmallow import fields
 
 from project.api.utils.database import db
+from project.api.utils.timing import TimedSchemaMixin
 
 ## User Model
 class User(db.Model):
@@ -17,7 +18,13 @@ class User(db.Model):
     email = db.Column(db.String(256), unique=True, nullable=False)    # enforce it at the DB level
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now())
-    
+
+    ## case-insensitive uniqueness, also the index of the login / signup lookups
+    __table_args__ = (
+        db.Index('ux_users_email_lower', db.func.lower(email), unique=True),
+        db.Index('ux_users_username_lower', db.func.lower(username), unique=True),
+    )
+
     def create(self):
         "Persist into DB"
         dtnow = datetime.datetime.utcnow()
@@ -29,11 +36,18 @@ class User(db.Model):
 
     @classmethod
     def find_by_username(cls, username):
-        return cls.query.filter_by(username=username).first()
+        return cls.query.filter(db.func.lower(cls.username) == username.lower()).first()
 
     @classmethod
     def find_by_email(cls, email):
-        return cls.query.filter_by(email=email).first()
+        return cls.query.filter(db.func.lower(cls.email) == email.lower()).first()
+
+    @classmethod
+    def find_credentials(cls, email=None, username=None):
+        "(username, password, isVerified) only - one lookup on a lower() unique index"
+        column, value = (cls.email, email) if email else (cls.username, username)
+        return db.session.query(cls.username, cls.password, cls.isVerified) \
+                         .filter(db.func.lower(column) == value.lower()).first()
     
     @staticmethod
     def generate_hash(password):
@@ -45,7 +59,7 @@ class User(db.Model):
 
 
 ## User Serialization
-class UserSchema(ModelSchema):
+class UserSchema(TimedSchemaMixin, ModelSchema):
     class Meta(ModelSchema.Meta):
         model = User
         sqla_session = db.session
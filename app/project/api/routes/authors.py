@@ -1,12 +1,30 @@
 import sys, logging
 
-from flask import Blueprint, request, current_app, url_for
+from flask import Blueprint, request, current_app, url_for, abort
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.exc import StaleDataError
 
 from project.api.utils.responses import response_with
 from project.api.utils import responses as resp
 from project.api.models.authors import Author, AuthorSchema
+from project.api.models.catalog_stats import AuthorStats
+from project.api.models.books import Book, BookSchema
 from project.api.utils.database import db
+from project.api.utils.etag import (
+    conditional_response, make_etag, row_version, row_versions, table_etag
+)
+from project.api.utils.serializers import (
+    FieldsError, columns, dump_rows, requested_fields, schema_for
+)
+from project.api.utils.export import export_format, export_response
+from project.api.utils.cache import cache, book_key, author_key, read_through_many
+from project.api.utils.bulk import BulkBodyError, parse_bulk_body, bulk_insert
+from project.api.utils.search import search_tokens, search_query
+from project.api.utils.pagination import (
+    CursorError, FilterError, cursor_mode_requested, get_limit, get_sort, get_ids_arg,
+    keyset_paginate
+)
 
 
 author_routes = Blueprint("author_routes", __name__)
@@ -82,6 +100,7 @@ def create_author():
         author = author_schema.load(data)
 
         result = author_schema.dump(author.create())  # .data
+        cache.delete(author_key(author.id))
 
         return response_with(resp.CREATED_201, value={"author": result})
 
@@ -90,13 +109,111 @@ def create_author():
         return response_with(resp.INVALID_INPUT_422)
 
 
+## Create authors in bulk
+@author_routes.route('/bulk', methods=['POST'])
+@jwt_required
+def create_author_bulk():
+    """
+    Bulk create author endpoint
+    ---
+    consumes:
+      - application/json
+      - application/x-ndjson
+    parameters:
+      - in: body
+        name: body
+        description: JSON array of authors or NDJSON (one author per line)
+        schema:
+          type: array
+          items:
+            schema:
+              id: Author
+      - in: header
+        name: authorization
+        type: string
+        required: true
+    security:
+      - Bearer: []
+    responses:
+      201:
+        description: Valid rows inserted, invalid ones reported by index
+        schema:
+          properties:
+            code:
+              type: string
+            inserted:
+              type: integer
+            errors:
+              type: array
+              items:
+                properties:
+                  index:
+                    type: integer
+                  errors:
+                    type: object
+      422:
+        description: Invalid body or no valid row
+        schema:
+          id: invalidInput
+          properties:
+            code:
+              type: string
+            message:
+              type: string
+    """
+
+    try:
+        rows = parse_bulk_body()
+
+    except BulkBodyError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.INVALID_INPUT_422)
+
+    author_schema = AuthorSchema(only=['first_name', 'last_name'])
+    inserted, errors = bulk_insert(Author, author_schema, ['first_name', 'last_name'], rows)
+
+    if inserted == 0 and errors:
+        return response_with(resp.INVALID_INPUT_422, error=errors)
+
+    return response_with(resp.CREATED_201, value={'inserted': inserted},
+                         error=errors or None)
+
+
 ## Get list of all authors with Pagination - No Auth required (so far)
 @author_routes.route('/', methods=['GET'])
 def get_author_list():
     """
     Get author list endpoint
     ---
-    parametrers:
+    parameters:
+      - name: ids
+        in: query
+        description: comma separated author IDs (multi-get, bounded by YABOOK_MAX_IDS_PER_REQUEST), authors are returned in that order, with their books, and unknown IDs listed in missing
+        type: string
+      - name: page
+        in: query
+        description: page number (offset pagination, returns count)
+        type: integer
+      - name: after
+        in: query
+        description: opaque cursor returned as next_cursor (keyset pagination, no count)
+        type: string
+      - name: limit
+        in: query
+        description: page size in cursor mode (bounded by YABOOK_MAX_ITEMS_PER_PAGE)
+        type: integer
+      - name: sort
+        in: query
+        description: cursor mode sort key, one of id, first_name, last_name (prefix with - for descending)
+        type: string
+      - name: include
+        in: query
+        description: set to books to embed each author's books (loaded in one extra query)
+        type: string
+      - name: fields
+        in: query
+        description: comma separated subset of id, first_name, last_name, created_at, version, books
+        type: string
     responses:
       200:
         description: Author List
@@ -125,41 +242,122 @@ def get_author_list():
                     type: string
     """
 
-    page = request.args.get('page', 1, type=int) # default 1st page, cast it as an int
-    num_item_per_page = current_app.config['YABOOK_ITEMS_PER_PAGE']
+    try:
+        names = _author_list_fields()
 
-    # start from first page:
-    if page < 0: page = 1
+    except FieldsError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
 
-    pagination = Author.query.paginate(
-        page, per_page=num_item_per_page,
-        error_out=False)
+    if 'ids' in request.args:  # detail representation, ?fields= already validated above
+        return _get_author_list_by_ids(requested_fields(AUTHOR_FIELDS))
 
-    count = pagination.total
-    max_pages = count // num_item_per_page
-    max_pages += 0 if count % num_item_per_page == 0 else 1
+    # embedded books => the books counter is part of the list version
+    tables = ['authors', 'books'] if _includes_books() else ['authors']
+    build = _get_author_list_by_cursor if cursor_mode_requested() else _get_author_list_by_page
+    return conditional_response(table_etag(*tables), lambda: build(names))
 
-    fetched = pagination.items
-    prev_url, next_url = None, None
+## Export the whole catalog (streamed) - No Auth required (so far)
+@author_routes.route('/export', methods=['GET'])
+def export_authors():
+    """
+    Export authors endpoint
+    ---
+    produces:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: format
+        in: query
+        description: ndjson (default) or csv
+        type: string
+    responses:
+      200:
+        description: every author (id, first_name, last_name, created_at), one per line, ordered by id
+      400:
+        description: Unsupported format
+        schema:
+          id: badRequest
+          properties:
+            code:
+              type: string
+            message:
+              type: string
+    """
 
-    if pagination.has_prev:
-        if page <= max_pages:
-            prev_url = url_for('author_routes.get_author_list', page=page-1)
-        else:
-            # point to actual last page (for example)
-            prev_url = url_for('author_routes.get_author_list', page=max_pages)
+    fmt = export_format()
+    if fmt is None:
+        return response_with(resp.BAD_REQUEST_400)
 
-    if pagination.has_next:
-        next_url = url_for('author_routes.get_author_list', page=page+1)
+    query = Author.query.with_entities(*columns(Author, AUTHOR_EXPORT_FIELDS)).order_by(Author.id)
+    return export_response(query, AuthorSchema, AUTHOR_EXPORT_FIELDS, 'authors', fmt)
 
-    author_schema = AuthorSchema(many=True, only=['first_name', 'last_name', 'id'])
-    authors = author_schema.dump(fetched)
-    value = {'authors': authors, 'prev_url': prev_url,
-      'next_url': next_url,
-      'count': count
-    }
 
-    return response_with(resp.SUCCESS_200, value=value)
+## Full-text search on names - No Auth required (so far)
+@author_routes.route('/search', methods=['GET'])
+def search_authors():
+    """
+    Search authors endpoint
+    ---
+    parameters:
+      - name: q
+        in: query
+        description: words to look for in first / last names (the last one as a prefix)
+        required: true
+        type: string
+      - name: limit
+        in: query
+        description: max number of results (bounded by YABOOK_MAX_ITEMS_PER_PAGE)
+        type: integer
+      - name: include
+        in: query
+        description: books to embed the books of each author
+        type: string
+      - name: fields
+        in: query
+        description: comma separated subset of id, first_name, last_name, created_at, version, books
+        type: string
+    responses:
+      200:
+        description: Matching authors, most relevant first
+        schema:
+          properties:
+            code:
+              type: string
+            authors:
+              type: array
+              items:
+                schema:
+                  id: AuthorFull
+      400:
+        description: Missing or empty query
+        schema:
+          id: badRequest
+          properties:
+            code:
+              type: string
+            message:
+              type: string
+    """
+
+    try:
+        names = _author_list_fields()
+
+    except FieldsError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    tokens = search_tokens(request.args.get('q'))
+    if not tokens:
+        return response_with(resp.BAD_REQUEST_400)
+
+    def build_response():
+        query = Author.query.with_entities(*columns(Author, _author_select(names)))
+        fetched = search_query(query, Author, tokens).limit(get_limit()).all()
+        return response_with(resp.SUCCESS_200, value={'authors': _dump_authors(fetched, names)})
+
+    tables = ('authors', 'books') if _includes_books() else ('authors',)
+    return conditional_response(table_etag(*tables), build_response)
 
 
 ## Get one specific Author
@@ -175,6 +373,10 @@ def get_author_detail(author_id):
         required: true
         schema:
           type: integer
+      - name: fields
+        in: query
+        description: comma separated subset of id, first_name, last_name, created_at, version, books
+        type: string
     responses:
       200:
         description: Author Details
@@ -204,11 +406,90 @@ def get_author_detail(author_id):
               type: string
     """
 
-    fetched = Author.query.get_or_404(author_id)
-    author_schema = AuthorSchema()
-    author = author_schema.dump(fetched)
+    try:
+        fields = requested_fields(AUTHOR_FIELDS)
 
-    return response_with(resp.SUCCESS_200, value={"author": author})
+    except FieldsError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    # the author's books are embedded => a book write bumps the author's version
+    version = row_version(Author, author_id)
+    if version is None:
+        abort(404)
+
+    def build_response():
+        # read-through: the cached dict is only valid for the versions it was built from
+        author = cache.get(author_key(author_id), version)
+        if author is not None and fields is not None:
+            author = {name: author[name] for name in fields if name in author}
+
+        elif author is None and fields is not None:
+            # ?fields= => only those columns (and books if asked), the partial dict is not cached
+            fetched = Author.query.options(*_author_detail_options(fields)).get_or_404(author_id)
+            author = schema_for(AuthorSchema, fields).dump(fetched)
+
+        elif author is None:
+            fetched = Author.query.options(*_author_detail_options()).get_or_404(author_id)
+            author = schema_for(AuthorSchema).dump(fetched)
+            cache.set(author_key(author_id), author, version)
+
+        return response_with(resp.SUCCESS_200, value={"author": author})
+
+    return conditional_response(make_etag('author', author_id, version),
+                                build_response)
+
+
+## Statistics of one Author (incrementally maintained)
+@author_routes.route('/<int:author_id>/stats', methods=['GET'])
+def get_author_stats(author_id):
+    """
+    Get author statistics endpoint
+    ---
+    parameters:
+      - name: author_id
+        in: path
+        description: author ID
+        required: true
+        schema:
+          type: integer
+    responses:
+      200:
+        description: Number of books and first / last publication years of the author
+        schema:
+          properties:
+            code:
+              type: string
+            stats:
+              properties:
+                author_id:
+                  type: integer
+                book_count:
+                  type: integer
+                first_year:
+                  type: integer
+                last_year:
+                  type: integer
+      404:
+        description: Author not found
+    """
+
+    version = row_version(Author, author_id)
+    if version is None:
+        abort(404)
+
+    def build_response():
+        row = db.session.query(AuthorStats.book_count, AuthorStats.first_year,
+                               AuthorStats.last_year) \
+                        .filter(AuthorStats.author_id == author_id).first()
+        book_count, first_year, last_year = row if row is not None else (0, None, None)
+        stats = {'author_id': author_id, 'book_count': book_count,
+                 'first_year': first_year, 'last_year': last_year}
+        return response_with(resp.SUCCESS_200, value={'stats': stats})
+
+    # only book writes change the stats of an author, and they bump its version
+    return conditional_response(make_etag('author-stats', author_id, version),
+                                build_response)
 
 
 ## Update (whole)  Author
@@ -286,9 +567,9 @@ def update_author_detail(id):
     get_author.first_name = data['first_name']
     get_author.last_name = data['last_name']
 
-    _persist(db, get_author, action='update')
-    author_schema = AuthorSchema()
-    author = author_schema.dump(get_author)
+    failed, author = _persist(db, get_author, action='update', dump=AuthorSchema().dump)
+    if failed is not None:
+        return failed
 
     return response_with(resp.SUCCESS_200, value={"author": author})
 
@@ -372,9 +653,9 @@ def modify_author_detail(id):
     if data.get('last_name'):
         get_author.last_name = data['last_name']
 
-    _persist(db, get_author, action='update')
-    author_schema = AuthorSchema()
-    author = author_schema.dump(get_author)
+    failed, author = _persist(db, get_author, action='update', dump=AuthorSchema().dump)
+    if failed is not None:
+        return failed
     return response_with(resp.SUCCESS_200, value={"author": author})
 
 ## Delete an Author
@@ -414,19 +695,176 @@ def delete_author(id):
     """
     get_author = Author.query.get_or_404(id)
 
-    _persist(db, get_author, action='delete')
+    failed, _ = _persist(db, get_author, action='delete')
+    if failed is not None:
+        return failed
 
     return response_with(resp.SUCCESS_204)
 
 
 ## Internal helpers
 
+## list endpoints are read-only: projected columns + compiled row serializer
+AUTHOR_FIELDS = ('id', 'first_name', 'last_name', 'created_at', 'version', 'books')  # ?fields=
+AUTHOR_LIST_FIELDS = ('first_name', 'last_name', 'id')
+AUTHOR_BOOK_FIELDS = ('title', 'year', 'id')
+AUTHOR_EXPORT_FIELDS = ('id', 'first_name', 'last_name', 'created_at')
+
+def _author_list_fields():
+    "Columns to dump for ?fields= (books are embedded apart, see _dump_authors)"
+    fields = requested_fields(AUTHOR_FIELDS)
+    if fields is None:
+        return AUTHOR_LIST_FIELDS
+    return tuple(name for name in fields if name != 'books')
+
+def _author_select(names, column=Author.id):
+    "names, then the sort column and id (cursor, embedded books) when not in it"
+    return names + tuple(key for key in dict.fromkeys((column.key, 'id')) if key not in names)
+
+def _get_author_list_by_page(names=AUTHOR_LIST_FIELDS):
+    page = request.args.get('page', 1, type=int) # default 1st page, cast it as an int
+    num_item_per_page = current_app.config['YABOOK_ITEMS_PER_PAGE']
+
+    # start from first page:
+    if page < 0: page = 1
+
+    extra_args = _author_list_args()
+    query = Author.query.with_entities(*columns(Author, _author_select(names)))
+    pagination = query.order_by(Author.id).paginate(
+        page, per_page=num_item_per_page,
+        error_out=False)
+
+    count = pagination.total
+    max_pages = count // num_item_per_page
+    max_pages += 0 if count % num_item_per_page == 0 else 1
+
+    fetched = pagination.items
+    prev_url, next_url = None, None
+
+    if pagination.has_prev:
+        if page <= max_pages:
+            prev_url = url_for('author_routes.get_author_list', page=page-1, **extra_args)
+        else:
+            # point to actual last page (for example)
+            prev_url = url_for('author_routes.get_author_list', page=max_pages, **extra_args)
+
+    if pagination.has_next:
+        next_url = url_for('author_routes.get_author_list', page=page+1, **extra_args)
+
+    authors = _dump_authors(fetched, names)
+    value = {'authors': authors, 'prev_url': prev_url,
+      'next_url': next_url,
+      'count': count
+    }
+
+    return response_with(resp.SUCCESS_200, value=value)
+
+
+AUTHOR_SORT_KEYS = {'id': Author.id, 'first_name': Author.first_name,
+                    'last_name': Author.last_name}
+
+def _get_author_list_by_cursor(names=AUTHOR_LIST_FIELDS):
+    try:
+        sort, column, descending = get_sort(AUTHOR_SORT_KEYS)
+        limit = get_limit()
+        extra_args = _author_list_args()
+        query = Author.query.with_entities(*columns(Author, _author_select(names, column)))
+        fetched, next_cursor = keyset_paginate(query, Author.id, sort, column, descending,
+                                               after=request.args.get('after'), limit=limit)
+
+    except CursorError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    next_url = None
+    if next_cursor is not None:
+        next_url = url_for('author_routes.get_author_list', after=next_cursor, limit=limit,
+                           sort=sort, **extra_args)
+
+    value = {'authors': _dump_authors(fetched, names),
+             'next_cursor': next_cursor,
+             'next_url': next_url
+    }
+
+    return response_with(resp.SUCCESS_200, value=value)
+
+def _author_list_args():
+    return {name: request.args[name] for name in ('include', 'fields') if request.args.get(name)}
+
+def _dump_authors(rows, names=AUTHOR_LIST_FIELDS):
+    """
+    ?include=books loads the books of the whole page with one extra SELECT ... IN (...)
+    instead of one lazy SELECT per author
+    """
+    authors = dump_rows(AuthorSchema, names, rows)
+    if not _includes_books():
+        return authors
+
+    by_author = {row.id: [] for row in rows}
+    if by_author:
+        books = Book.query.with_entities(*columns(Book, AUTHOR_BOOK_FIELDS), Book.author_id) \
+                          .filter(Book.author_id.in_(by_author)) \
+                          .order_by(Book.id)
+        for book in books:
+            by_author[book.author_id].append(book)
+
+    for row, author in zip(rows, authors):
+        author['books'] = dump_rows(BookSchema, AUTHOR_BOOK_FIELDS, by_author[row.id])
+
+    return authors
+
+def _author_detail_options(fields=None):
+    "Loader options of the detail representation, restricted to ?fields= when given"
+    if fields is None:
+        return [joinedload(Author.books)]
+
+    options = [load_only(*(tuple(name for name in fields if name != 'books') or ('id',)))]
+    if 'books' in fields:
+        options.append(joinedload(Author.books).load_only(*AUTHOR_BOOK_FIELDS))
+    return options
+
+def _get_author_list_by_ids(fields=None):
+    try:
+        ids = get_ids_arg()
+
+    except FilterError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    # the authors' books are embedded => their writes bump the versions (as detail)
+    versions = row_versions(Author, ids)
+
+    def load(missing):
+        query = Author.query.options(*_author_detail_options(fields)).filter(Author.id.in_(missing))
+        schema = schema_for(AuthorSchema, fields)
+        return {author.id: schema.dump(author) for author in query}
+
+    def build_response():
+        found = read_through_many(author_key, versions, load, fields)
+        value = {'authors': [found[id] for id in ids if id in found],
+                 'missing': [id for id in ids if id not in found]}
+        return response_with(resp.SUCCESS_200, value=value)
+
+    return conditional_response(make_etag('authors', *sorted(versions.items())),
+                                build_response)
+
+def _includes_books():
+    return 'books' in request.args.get('include', '').split(',') or \
+        'books' in request.args.get('fields', '').split(',')
+
 def _find_author_by_id(id):
     data = request.get_json()
-    return data, Author.query.get(id) # can be NOT FOUND
+    # single row => joined eager load, author and books in one round trip
+    return data, Author.query.options(joinedload(Author.books)).get(id) # can be NOT FOUND
 
-def _persist(db, author, action='add'):
+def _persist(db, author, action='add', dump=None):
+    "Returns (error response or None, dump of the author)"
+    dumped = None
     try:
+        stale_keys = [author_key(author.id)]
+        if action == 'delete':  # delete-orphan cascade
+            stale_keys.extend(book_key(book.id) for book in author.books)
+
         if action == 'update':
             db.session.add(author)
         elif action == 'delete':
@@ -434,8 +872,21 @@ def _persist(db, author, action='add'):
         else:
             raise Exception("action is either update or delete")
 
+        db.session.flush()
+        if dump is not None:
+            # before the commit expires it => no re-SELECT of the author and its books
+            dumped = dump(author)
         db.session.commit()
+        cache.delete(*stale_keys)
+
+    except StaleDataError as ex:  # version_id_col: the row changed since it was loaded
+        db.session.rollback()
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.CONFLICT_409), None
 
     except Exception as ex:
+        db.session.rollback()
         logging.error(f"Intercepted Exception: {ex}")
-        return response_with(resp.INVALID_INPUT_422)
+        return response_with(resp.INVALID_INPUT_422), None
+
+    return None, dumped
@@ -1,12 +1,29 @@
 import sys, logging
 
-from flask import Blueprint, request, current_app, url_for
+from flask import Blueprint, request, current_app, url_for, abort
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.exc import StaleDataError
 
 from project.api.utils.responses import response_with
 from project.api.utils import responses as resp
 from project.api.models.books import Book, BookSchema
+from project.api.models.catalog_stats import CatalogTotal, BookYearCount
 from project.api.utils.database import db
+from project.api.utils.etag import (
+    conditional_response, make_etag, row_version, row_versions, table_etag
+)
+from project.api.utils.serializers import (
+    FieldsError, columns, dump_rows, requested_fields, schema_for
+)
+from project.api.utils.export import export_format, export_response
+from project.api.utils.cache import cache, book_key, author_key, read_through_many
+from project.api.utils.bulk import BulkBodyError, parse_bulk_body, bulk_insert
+from project.api.utils.search import search_tokens, search_query
+from project.api.utils.pagination import (
+    CursorError, FilterError, cursor_mode_requested, get_limit, get_sort, get_int_arg,
+    get_ids_arg, keyset_paginate, prefix_match
+)
 
 
 book_routes = Blueprint("book_routes", __name__)
@@ -79,6 +96,7 @@ def create_book():
         book_schema = BookSchema()
         book = book_schema.load(data)
         result = book_schema.dump(book.create())
+        cache.delete(author_key(book.author_id))  # author detail embeds its books
 
         return response_with(resp.CREATED_201, value={"book": result})
 
@@ -87,13 +105,125 @@ def create_book():
         return response_with(resp.INVALID_INPUT_422)
 
 
+## Create books in bulk
+@book_routes.route('/bulk', methods=['POST'])
+@jwt_required
+def create_book_bulk():
+    """
+    Bulk create book endpoint
+    ---
+    consumes:
+      - application/json
+      - application/x-ndjson
+    parameters:
+      - in: body
+        name: body
+        description: JSON array of books or NDJSON (one book per line)
+        schema:
+          type: array
+          items:
+            schema:
+              id: Book
+      - in: header
+        name: authorization
+        type: string
+        required: true
+    security:
+      - Bearer: []
+    responses:
+      201:
+        description: Valid rows inserted, invalid ones reported by index
+        schema:
+          properties:
+            code:
+              type: string
+            inserted:
+              type: integer
+            errors:
+              type: array
+              items:
+                properties:
+                  index:
+                    type: integer
+                  errors:
+                    type: object
+      422:
+        description: Invalid body or no valid row
+        schema:
+          id: invalidInput
+          properties:
+            code:
+              type: string
+            message:
+              type: string
+    """
+
+    try:
+        rows = parse_bulk_body()
+
+    except BulkBodyError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.INVALID_INPUT_422)
+
+    book_schema = BookSchema(only=['title', 'year', 'author_id'])
+    inserted, errors = bulk_insert(Book, book_schema, ['title', 'year', 'author_id'], rows)
+    cache.delete(*{author_key(row['author_id']) for _, row in rows
+                   if isinstance(row, dict) and 'author_id' in row})
+
+    if inserted == 0 and errors:
+        return response_with(resp.INVALID_INPUT_422, error=errors)
+
+    return response_with(resp.CREATED_201, value={'inserted': inserted},
+                         error=errors or None)
+
+
 ## Get list of all books with Pagination - No Auth required (so far)
 @book_routes.route('/', methods=['GET'])
 def get_book_list():
     """
     Get book list endpoint
     ---
-    parametrers:
+    parameters:
+      - name: ids
+        in: query
+        description: comma separated book IDs (multi-get, bounded by YABOOK_MAX_IDS_PER_REQUEST), books are returned in that order and unknown IDs listed in missing
+        type: string
+      - name: page
+        in: query
+        description: page number (offset pagination, returns count)
+        type: integer
+      - name: after
+        in: query
+        description: opaque cursor returned as next_cursor (keyset pagination, no count)
+        type: string
+      - name: limit
+        in: query
+        description: page size in cursor mode (bounded by YABOOK_MAX_ITEMS_PER_PAGE)
+        type: integer
+      - name: sort
+        in: query
+        description: sort key, one of id, title, year (prefix with - for descending)
+        type: string
+      - name: author_id
+        in: query
+        description: only the books of this author
+        type: integer
+      - name: year_from
+        in: query
+        description: only the books published this year or later (requires sort=year)
+        type: integer
+      - name: year_to
+        in: query
+        description: only the books published this year or earlier (requires sort=year)
+        type: integer
+      - name: title_prefix
+        in: query
+        description: only the books whose title starts with it (requires sort=title)
+        type: string
+      - name: fields
+        in: query
+        description: comma separated subset of id, author_id, title, year, version
+        type: string
     responses:
       200:
         description: Book List
@@ -119,50 +249,193 @@ def get_book_list():
                             type: integer
     """
 
-    page = request.args.get('page', 1, type=int) # default 1st page, cast it as an int
-    num_item_per_page = current_app.config['YABOOK_ITEMS_PER_PAGE']
+    try:
+        fields = requested_fields(BOOK_FIELDS)
 
-    # start from first page:
-    if page < 0: page = 1
+    except FieldsError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
 
-    pagination = Book.query.paginate(
-        page, per_page=num_item_per_page,
-        error_out=False)
+    if 'ids' in request.args:
+        return _get_book_list_by_ids(fields)
 
-    count = pagination.total
-    max_pages = count // num_item_per_page
-    max_pages += 0 if count % num_item_per_page == 0 else 1
+    build = _get_book_list_by_cursor if cursor_mode_requested() else _get_book_list_by_page
+    return conditional_response(table_etag('books'), lambda: build(fields))
 
-    fetched = pagination.items
-    prev_url, next_url = None, None
+## Export the whole catalog (streamed) - No Auth required (so far)
+@book_routes.route('/export', methods=['GET'])
+def export_books():
+    """
+    Export books endpoint
+    ---
+    produces:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: format
+        in: query
+        description: ndjson (default) or csv
+        type: string
+    responses:
+      200:
+        description: every book (id, title, year, author_id), one per line, ordered by id
+      400:
+        description: Unsupported format
+        schema:
+          id: badRequest
+          properties:
+            code:
+              type: string
+            message:
+              type: string
+    """
 
-    if pagination.has_prev:
-        if page <= max_pages:
-            prev_url = url_for('book_routes.get_book_list', page=page-1)
-        else:
-            # point to actual last page (for example)
-            prev_url = url_for('book_routes.get_book_list', page=max_pages)
+    fmt = export_format()
+    if fmt is None:
+        return response_with(resp.BAD_REQUEST_400)
 
-    if pagination.has_next:
-        next_url = url_for('book_routes.get_book_list', page=page+1)
+    query = Book.query.with_entities(*columns(Book, BOOK_EXPORT_FIELDS)).order_by(Book.id)
+    return export_response(query, BookSchema, BOOK_EXPORT_FIELDS, 'books', fmt)
 
-    book_schema = BookSchema(many=True, only=['author_id', 'title', 'year'])
-    books = book_schema.dump(fetched)
-    value = {'books': books, 'prev_url': prev_url,
-      'next_url': next_url,
-      'count': count
-    }
 
-    return response_with(resp.SUCCESS_200, value=value)
+## Catalog statistics (incrementally maintained) - No Auth required (so far)
+@book_routes.route('/stats', methods=['GET'])
+def get_book_stats():
+    """
+    Catalog statistics endpoint
+    ---
+    responses:
+      200:
+        description: Total books and authors, book counts by publication year and decade
+        schema:
+          properties:
+            code:
+              type: string
+            stats:
+              properties:
+                books:
+                  type: integer
+                authors:
+                  type: integer
+                by_year:
+                  type: object
+                by_decade:
+                  type: object
+    """
+
+    def build_response():
+        totals = dict(db.session.query(CatalogTotal.name, CatalogTotal.value))
+        by_year, by_decade = {}, {}
+        for year, count in db.session.query(BookYearCount.year, BookYearCount.count) \
+                                     .filter(BookYearCount.count > 0) \
+                                     .order_by(BookYearCount.year):
+            by_year[str(year)] = count
+            decade = str(year - year % 10)
+            by_decade[decade] = by_decade.get(decade, 0) + count
+
+        stats = {'books': totals.get('books', 0), 'authors': totals.get('authors', 0),
+                 'by_year': by_year, 'by_decade': by_decade}
+        return response_with(resp.SUCCESS_200, value={'stats': stats})
+
+    return conditional_response(table_etag('authors', 'books'), build_response)
+
+
+## Full-text search on titles - No Auth required (so far)
+@book_routes.route('/search', methods=['GET'])
+def search_books():
+    """
+    Search books endpoint
+    ---
+    parameters:
+      - name: q
+        in: query
+        description: words to look for in the title (the last one as a prefix)
+        required: true
+        type: string
+      - name: limit
+        in: query
+        description: max number of results (bounded by YABOOK_MAX_ITEMS_PER_PAGE)
+        type: integer
+      - name: fields
+        in: query
+        description: comma separated subset of id, author_id, title, year, version
+        type: string
+    responses:
+      200:
+        description: Matching books, most relevant first
+        schema:
+          properties:
+            code:
+              type: string
+            books:
+              type: array
+              items:
+                schema:
+                  id: BookFull
+      400:
+        description: Missing or empty query
+        schema:
+          id: badRequest
+          properties:
+            code:
+              type: string
+            message:
+              type: string
+    """
+
+    try:
+        names = requested_fields(BOOK_FIELDS) or BOOK_CURSOR_FIELDS
+
+    except FieldsError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    tokens = search_tokens(request.args.get('q'))
+    if not tokens:
+        return response_with(resp.BAD_REQUEST_400)
+
+    def build_response():
+        query = Book.query.with_entities(*columns(Book, names))
+        fetched = search_query(query, Book, tokens).limit(get_limit()).all()
+        return response_with(resp.SUCCESS_200,
+                             value={'books': dump_rows(BookSchema, names, fetched)})
+
+    return conditional_response(table_etag('books'), build_response)
+
 
 ## Get one specific Book
 @book_routes.route('/<int:book_id>', methods=['GET'])
 def get_book_detail(book_id):
-    fetched = Book.query.get_or_404(book_id)
-    book_schema = BookSchema()
-    book = book_schema.dump(fetched)
+    try:
+        fields = requested_fields(BOOK_FIELDS)
 
-    return response_with(resp.SUCCESS_200, value={"book": book})
+    except FieldsError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    version = row_version(Book, book_id)
+    if version is None:
+        abort(404)
+
+    def build_response():
+        # read-through: the cached dict is only valid for the row version it was built from
+        book = cache.get(book_key(book_id), version)
+        if book is not None and fields is not None:
+            book = {name: book[name] for name in fields if name in book}
+
+        elif book is None and fields is not None:
+            # ?fields= => only those columns are read, the partial dict is not cached
+            fetched = Book.query.options(load_only(*fields)).get_or_404(book_id)
+            book = schema_for(BookSchema, fields).dump(fetched)
+
+        elif book is None:
+            fetched = Book.query.get_or_404(book_id)
+            book = schema_for(BookSchema).dump(fetched)
+            cache.set(book_key(book_id), book, version)
+
+        return response_with(resp.SUCCESS_200, value={"book": book})
+
+    return conditional_response(make_etag('book', book_id, version), build_response)
 
 
 ## Update (whole) Book
@@ -174,7 +447,9 @@ def update_book_detail(id):
     get_book.title = data['title']
     get_book.year = data['year']
 
-    _persist(db, get_book, action='update')
+    failed = _persist(db, get_book, action='update')
+    if failed is not None:
+        return failed
     book_schema = BookSchema()
     book = book_schema.dump(get_book)
 
@@ -192,7 +467,9 @@ def modify_book_detail(id):
     if data.get('year'):
         get_book.year = data['year']
 
-    _persist(db, get_book, action='update')
+    failed = _persist(db, get_book, action='update')
+    if failed is not None:
+        return failed
     book_schema = BookSchema()
     book = book_schema.dump(get_book)
     return response_with(resp.SUCCESS_200, value={"book": book})
@@ -234,19 +511,169 @@ def delete_book(id):
     """
     get_book = Book.query.get_or_404(id)
 
-    _persist(db, get_book, action='delete')
+    failed = _persist(db, get_book, action='delete')
+    if failed is not None:
+        return failed
 
     return response_with(resp.SUCCESS_204)
 
 
 ## Internal helpers
 
+## list endpoints are read-only: projected columns + compiled row serializer
+BOOK_FIELDS = ('id', 'author_id', 'title', 'year', 'version')  # allowed in ?fields=
+BOOK_LIST_FIELDS = ('author_id', 'title', 'year')
+BOOK_CURSOR_FIELDS = ('author_id', 'title', 'year', 'id')
+BOOK_EXPORT_FIELDS = ('id', 'title', 'year', 'author_id')
+
+BOOK_SORT_KEYS = {'id': Book.id, 'title': Book.title, 'year': Book.year}
+BOOK_FILTER_ARGS = ('author_id', 'year_from', 'year_to', 'title_prefix')
+BOOK_RANGE_FILTERS = {'year_from': 'year', 'year_to': 'year', 'title_prefix': 'title'}
+
+def _book_list_query(names):
+    """
+    Projected query narrowed by the ?author_id= ?year_from= ?year_to= ?title_prefix=
+    filters, and the (sort, column, descending) to apply. A range filter must be on the
+    sort column so that every accepted combination is one scan of an index declared
+    on Book: [author_id =] [range on the sort column] ORDER BY <sort column>, id
+    The sort column and id are selected after names (for the cursor) when not in it.
+    """
+    ranged = {BOOK_RANGE_FILTERS[name] for name in BOOK_RANGE_FILTERS if request.args.get(name)}
+    if len(ranged) > 1:
+        raise FilterError("year_from / year_to and title_prefix cannot be combined")
+
+    sort, column, descending = get_sort(BOOK_SORT_KEYS, default=next(iter(ranged), 'id'))
+    if ranged and column.key not in ranged:
+        raise FilterError(f"a {column.key} sort cannot serve a {ranged.pop()} range filter")
+
+    extra = tuple(key for key in dict.fromkeys((column.key, 'id')) if key not in names)
+    query = Book.query.with_entities(*columns(Book, names + extra))
+    author_id = get_int_arg('author_id')
+    if author_id is not None:
+        query = query.filter(Book.author_id == author_id)
+
+    year_from, year_to = get_int_arg('year_from'), get_int_arg('year_to')
+    if year_from is not None:
+        query = query.filter(Book.year >= year_from)
+    if year_to is not None:
+        query = query.filter(Book.year <= year_to)
+
+    title_prefix = request.args.get('title_prefix')
+    if title_prefix:
+        dialect = query.session.get_bind().dialect.name
+        query = query.filter(prefix_match(Book.title, title_prefix, dialect))
+
+    return query, (sort, column, descending)
+
+def _book_list_args():
+    "Filters and sort of the request, carried over to the prev / next urls"
+    return {name: request.args[name] for name in BOOK_FILTER_ARGS + ('sort', 'fields')
+            if request.args.get(name)}
+
+def _get_book_list_by_page(fields=None):
+    page = request.args.get('page', 1, type=int) # default 1st page, cast it as an int
+    num_item_per_page = current_app.config['YABOOK_ITEMS_PER_PAGE']
+
+    # start from first page:
+    if page < 0: page = 1
+
+    try:
+        names = fields or BOOK_LIST_FIELDS
+        query, (_, column, descending) = _book_list_query(names)
+
+    except (CursorError, FilterError) as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    order = [column.desc(), Book.id.desc()] if descending else [column.asc(), Book.id.asc()]
+    extra_args = _book_list_args()
+    pagination = query.order_by(*order).paginate(
+        page, per_page=num_item_per_page,
+        error_out=False)
+
+    count = pagination.total
+    max_pages = count // num_item_per_page
+    max_pages += 0 if count % num_item_per_page == 0 else 1
+
+    fetched = pagination.items
+    prev_url, next_url = None, None
+
+    if pagination.has_prev:
+        if page <= max_pages:
+            prev_url = url_for('book_routes.get_book_list', page=page-1, **extra_args)
+        else:
+            # point to actual last page (for example)
+            prev_url = url_for('book_routes.get_book_list', page=max_pages, **extra_args)
+
+    if pagination.has_next:
+        next_url = url_for('book_routes.get_book_list', page=page+1, **extra_args)
+
+    books = dump_rows(BookSchema, names, fetched)
+    value = {'books': books, 'prev_url': prev_url,
+      'next_url': next_url,
+      'count': count
+    }
+
+    return response_with(resp.SUCCESS_200, value=value)
+
+
+def _get_book_list_by_cursor(fields=None):
+    try:
+        limit = get_limit()
+        names = fields or BOOK_CURSOR_FIELDS
+        query, (sort, column, descending) = _book_list_query(names)
+        fetched, next_cursor = keyset_paginate(query, Book.id, sort, column, descending,
+                                               after=request.args.get('after'), limit=limit)
+
+    except (CursorError, FilterError) as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    next_url = None
+    if next_cursor is not None:
+        extra_args = dict(_book_list_args(), sort=sort)
+        next_url = url_for('book_routes.get_book_list', after=next_cursor, limit=limit,
+                           **extra_args)
+
+    value = {'books': dump_rows(BookSchema, names, fetched),
+             'next_cursor': next_cursor,
+             'next_url': next_url
+    }
+
+    return response_with(resp.SUCCESS_200, value=value)
+
+def _get_book_list_by_ids(fields=None):
+    try:
+        ids = get_ids_arg()
+
+    except FilterError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.BAD_REQUEST_400)
+
+    versions = row_versions(Book, ids)
+
+    def load(missing):
+        query = Book.query.filter(Book.id.in_(missing))
+        if fields is not None:
+            query = query.options(load_only(*fields))
+        schema = schema_for(BookSchema, fields)
+        return {book.id: schema.dump(book) for book in query}
+
+    def build_response():
+        found = read_through_many(book_key, versions, load, fields)
+        value = {'books': [found[id] for id in ids if id in found],
+                 'missing': [id for id in ids if id not in found]}
+        return response_with(resp.SUCCESS_200, value=value)
+
+    return conditional_response(make_etag('books', *sorted(versions.items())), build_response)
+
 def _find_book_by_id(id):
     data = request.get_json()
     return data, Book.query.get_or_404(id) # can be NOT FOUND
 
 def _persist(db, book, action='add'):
     try:
+        stale_keys = [book_key(book.id), author_key(book.author_id)]
         if action == 'update':
             db.session.add(book)
         elif action == 'delete':
@@ -255,7 +682,16 @@ def _persist(db, book, action='add'):
             raise Exception("action is either update or delete")
 
         db.session.commit()
+        cache.delete(*stale_keys)
+
+    except StaleDataError as ex:  # version_id_col: the row changed since it was loaded
+        db.session.rollback()
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.CONFLICT_409)
 
     except Exception as ex:
+        db.session.rollback()
         logging.error(f"Intercepted Exception: {ex}")
         return response_with(resp.INVALID_INPUT_422)
+
+    return None
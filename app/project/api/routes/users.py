@@ -1,9 +1,11 @@
 import sys, logging
 
 from flask import Blueprint, request, url_for, render_template_string, current_app
+from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import (
-    jwt_refresh_token_required,
+    jwt_required, jwt_refresh_token_required,
     create_access_token, create_refresh_token,
+    get_jwt_identity, get_raw_jwt,
 )
 
 from project.api.utils.responses import response_with
@@ -13,7 +15,9 @@ from project.api.utils.token import (
     generate_verification_token,
     confirm_verification_token
 )
-from project.api.utils.mail import send_email
+from project.api.utils.mail import enqueue_email
+from project.api.utils.hashing import hasher, HashingBusy
+from project.api.utils.revocation import revocation
 from project.api.models.users import User, UserSchema
 
 
@@ -67,13 +71,9 @@ def create_user():
     """
     try:
         data = request.get_json()
-        ## user already defined
-        if User.find_by_email(data['email']) is not None or \
-           User.find_by_username(data['username']) is not None:
-            return response_with(resp.INVALID_INPUT_422)
-
-        ## ok user does not yet exist
-        data['password'] = User.generate_hash(data['password'])
+        ## no existence check: an already defined user (email or username, whatever the
+        ## case) is rejected by the unique indexes on insert - see IntegrityError below
+        data['password'] = hasher.run(User.generate_hash, data['password'])
         user_schema = UserSchema()
         user = user_schema.load(data)
 
@@ -85,7 +85,7 @@ def create_user():
 
         curr_env = current_app.config['ENV']
         if curr_env != 'development' and curr_env != 'testing':
-            send_email(user.email, subject, html)
+            enqueue_email(user.email, subject, html)  # delivered by manage.py mail-worker
         else:
             logging.error(f"email: {user.email}, subject: {subject}")
             logging.error(html)
@@ -94,6 +94,16 @@ def create_user():
         result = user_schema.dump(user.create())
         return response_with(resp.CREATED_201)
 
+    except IntegrityError as ex:
+        db.session.rollback()  # also drops the verification e-mail queued above
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.INVALID_INPUT_422)
+
+    except HashingBusy as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.SERVICE_UNAVAILABLE_503,
+                             headers={'Retry-After': str(ex.retry_after)})
+
     except Exception as ex:
         logging.error(f"Intercepted Exception: {ex}")
         return response_with(resp.INVALID_INPUT_422)
@@ -127,24 +137,19 @@ def authenticate_user():
       try:
         data = request.get_json()
 
-        if data.get('email'):
-            current_user = User.find_by_email(data['email'])
-
-        elif data.get('username'):
-            current_user = User.find_by_username(data['username'])
-        else:
-            # TODO: raise exception
-            pass
+        if not data.get('email') and not data.get('username'):
+            return response_with(resp.INVALID_INPUT_422)
 
+        current_user = User.find_credentials(email=data.get('email'), username=data.get('username'))
         if not current_user:
             return response_with(resp.SERVER_ERROR_404)
 
         if current_user and not current_user.isVerified:
             return response_with(resp.BAD_REQUEST_400)
 
-        if User.verify_hash(data['password'], current_user.password):
-            access_token = create_access_token(identity=current_user.username, expires_delta=False)
-            refresh_token = create_refresh_token(identity=current_user.username, expires_delta=False)
+        if hasher.run(User.verify_hash, data['password'], current_user.password):
+            access_token = create_access_token(identity=current_user.username)
+            refresh_token = create_refresh_token(identity=current_user.username)
             return response_with(resp.SUCCESS_200,
                                  value={'message': f'Logged in as {current_user.username}',
                                         'access_token': access_token,
@@ -152,6 +157,11 @@ def authenticate_user():
         else:
             return response_with(resp.UNAUTHORIZED_401)
 
+      except HashingBusy as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.SERVICE_UNAVAILABLE_503,
+                             headers={'Retry-After': str(ex.retry_after)})
+
       except Exception as ex:
         logging.error(f"Intercepted Exception: {ex}")
         return response_with(resp.INVALID_INPUT_422)
@@ -170,7 +180,7 @@ def refresh():
     try:
         current_user = get_jwt_identity()
         value = {
-            'access_token': create_access_token(identity=current_user, expires_delta=False)
+            'access_token': create_access_token(identity=current_user)
         }
 
         return response_with(resp.CREATED_201, value)
@@ -178,3 +188,73 @@ def refresh():
     except  Exception as ex:
         logging.error(f"Intercepted Exception: {ex}")
         return response_with(resp.INVALID_INPUT_422)
+
+
+## sign out: the presented access token (refresh token for /logout/refresh) is revoked
+@user_routes.route('/logout', methods=['POST'])
+@jwt_required
+def logout():
+    """
+    Logout endpoint
+    ---
+    parameters:
+      - in: header
+        name: authorization
+        type: string
+        required: true
+    security:
+      - Bearer: []
+    responses:
+      200:
+        description: The access token is revoked
+      401:
+        description: Missing, invalid or already revoked token
+    """
+    return _revoke_current_token()
+
+
+@user_routes.route('/logout/refresh', methods=['POST'])
+@jwt_refresh_token_required
+def logout_refresh():
+    return _revoke_current_token()
+
+
+## revoke every token (access and refresh) issued so far to the current identity
+@user_routes.route('/revoke-all', methods=['POST'])
+@jwt_required
+def revoke_all_tokens():
+    """
+    Revoke all tokens endpoint
+    ---
+    parameters:
+      - in: header
+        name: authorization
+        type: string
+        required: true
+    security:
+      - Bearer: []
+    responses:
+      200:
+        description: Every token issued to the identity so far is revoked
+      401:
+        description: Missing, invalid or already revoked token
+    """
+    try:
+        identity = get_jwt_identity()
+        revocation.revoke_all(identity)
+        return response_with(resp.SUCCESS_200,
+                             value={'message': f'Every token of {identity} is revoked'})
+
+    except Exception as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.INVALID_INPUT_422)
+
+
+def _revoke_current_token():
+    try:
+        revocation.revoke(get_raw_jwt())
+        return response_with(resp.SUCCESS_200, value={'message': 'Logged out'})
+
+    except Exception as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return response_with(resp.INVALID_INPUT_422)
@@ -4,10 +4,12 @@ import unittest
 
 from datetime import datetime
 from flask_jwt_extended import create_access_token
+from sqlalchemy import event
 
 from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
 from project.api.models.authors import Author
-# from project.api.models.books import Book
+from project.api.models.books import Book
 
 CONTENT_TYPE = 'application/json'
 
@@ -86,6 +88,20 @@ class TestAuthors(RootTestCase):
         self.assertEqual(422, resp.status_code)
         return
 
+    def test_create_authors_bulk_all_invalid(self):
+        authors = [{'first_name': 'Julien'}, {'last_name': 'Gracq'}]
+        resp = self.app.post('/api/authors/bulk',
+                             data=json.dumps(authors),
+                             content_type=CONTENT_TYPE,
+                             headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        data = json.loads(resp.data)
+
+        self.assertEqual(422, resp.status_code)
+        self.assertEqual(2, len(data['errors']))
+        self.assertEqual(2, Author.query.count())
+        return
+
     # def test_upload_avatar(self):
     #     resp = self.app.post('/api/authors/avatar/2',
     #                          data=dict(avatar=(io.BytesIO(b'test'), 'test_file.jpg')),
@@ -116,6 +132,99 @@ class TestAuthors(RootTestCase):
         self.assertTrue('authors' in data)
         return
 
+    def test_get_authors_by_cursor(self):
+        resp = self.app.get('/api/authors/?limit=1&sort=first_name',
+                            content_type=CONTENT_TYPE,
+        )
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('Jane', data['authors'][0]['first_name'])
+        self.assertIsNotNone(data['next_cursor'])
+
+        resp = self.app.get('/api/authors/?limit=1&sort=first_name&after=' + data['next_cursor'],
+                            content_type=CONTENT_TYPE,
+        )
+        data = json.loads(resp.data)
+
+        self.assertEqual('John', data['authors'][0]['first_name'])
+        self.assertIsNone(data['next_cursor'])
+        return
+
+    def test_get_authors_include_books(self):
+        for ix in range(3):
+            Book(title=f"Book {ix}", year=2000 + ix, author_id=1 + ix % 2).create()
+
+        statements = []
+        def count_statements(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            resp = self.app.get('/api/authors/?include=books',
+                                content_type=CONTENT_TYPE,
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([2, 1], [len(aut['books']) for aut in data['authors']])
+        # change counters (ETag) + count + page + one selectin for all the books
+        self.assertEqual(4, len(statements))
+        return
+
+    def test_export_authors(self):
+        resp = self.app.get('/api/authors/export')
+        authors = [json.loads(line) for line in resp.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(['John', 'Jane'], [aut['first_name'] for aut in authors])
+        self.assertTrue(all(aut['created_at'] for aut in authors))
+        return
+
+    def test_search_authors(self):
+        resp = self.app.get('/api/authors/search?q=doe%20jan')
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(['Jane'], [aut['first_name'] for aut in data['authors']])
+
+        resp = self.app.get('/api/authors/search?q=doe')
+        self.assertEqual(2, len(json.loads(resp.data)['authors']))
+        return
+
+    def test_search_authors_index_follows_updates(self):
+        resp = self.app.patch('/api/authors/1', headers={'Authorization': 'Bearer ' + self.token},
+                              content_type=CONTENT_TYPE,
+                              data=json.dumps({'first_name': 'Corto'}))
+        self.assertEqual(200, resp.status_code)
+
+        resp = self.app.get('/api/authors/search?q=corto')
+        self.assertEqual([1], [aut['id'] for aut in json.loads(resp.data)['authors']])
+        resp = self.app.get('/api/authors/search?q=john')
+        self.assertEqual([], json.loads(resp.data)['authors'])
+        return
+
+    def test_get_authors_sparse_fieldsets(self):
+        Book(title='Corto', year=1967, author_id=2).create()
+
+        resp = self.app.get('/api/authors/?fields=last_name,books&limit=1&sort=-id')
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([{'last_name': 'Doe', 'books': [{'id': 1, 'title': 'Corto', 'year': 1967}]}],
+                         data['authors'])
+        self.assertTrue('fields=last_name' in data['next_url'])
+
+        resp = self.app.get('/api/authors/2?fields=first_name')
+        self.assertEqual({'first_name': 'Jane'}, json.loads(resp.data)['author'])
+        resp = self.app.get('/api/authors/2?fields=id,books')
+        self.assertEqual({'id': 2, 'books': [{'id': 1, 'title': 'Corto', 'year': 1967}]},
+                         json.loads(resp.data)['author'])
+        self.assertEqual(400, self.app.get('/api/authors/2?fields=password').status_code)
+        return
+
     def test_get_author_detail(self):
         resp = self.app.get('/api/authors/2',
                             content_type=CONTENT_TYPE,
@@ -126,6 +235,46 @@ class TestAuthors(RootTestCase):
         self.assertTrue('author' in data)
         return
 
+    def test_get_author_detail_not_modified(self):
+        resp = self.app.get('/api/authors/2')
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/api/authors/2', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b'', resp.data)
+
+        # If-None-Match is a weak comparison
+        resp = self.app.get('/api/authors/2', headers={'If-None-Match': f'W/{etag}'})
+        self.assertEqual(304, resp.status_code)
+
+        # the book of another author does not
+        Book(title="Not hers", year=1998, author_id=1).create()
+        resp = self.app.get('/api/authors/2', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+
+        # a new book of this author changes the representation
+        Book(title="Another one", year=1999, author_id=2).create()
+        resp = self.app.get('/api/authors/2', headers={'If-None-Match': etag})
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(etag, resp.headers['ETag'])
+        return
+
+    def test_moved_book_bumps_both_authors(self):
+        book = Book(title="Moved", year=2001, author_id=1).create()
+        before = dict(db.session.query(Author.id, Author.version))
+
+        book.author_id = 2
+        db.session.commit()
+
+        after = dict(db.session.query(Author.id, Author.version))
+        self.assertEqual({1: before[1] + 1, 2: before[2] + 1}, after)
+        # in-session authors are not stale: they can still be updated
+        author = Author.query.get(2)
+        author.first_name = 'Janet'
+        db.session.commit()
+        self.assertEqual(before[2] + 2, author.version)
+        return
+
     def test_update_author(self):
         author = {
             'first_name': 'Henri'
@@ -141,6 +290,33 @@ class TestAuthors(RootTestCase):
         self.assertEqual(200, resp.status_code)
         return
 
+    def test_put_author_dumps_without_reloading(self):
+        Book(title="Book 0", year=2000, author_id=2).create()
+
+        statements = []
+        def count_statements(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            resp = self.app.put('/api/authors/2',
+                                data=json.dumps({'first_name': 'Henri', 'last_name': 'Bosco'}),
+                                content_type=CONTENT_TYPE,
+                                headers={'Authorization': 'Bearer ' + self.token}
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        # the book insert bumped the author to version 2
+        self.assertEqual(('Henri', 3), (data['author']['first_name'], data['author']['version']))
+        self.assertEqual(['Book 0'], [book['title'] for book in data['author']['books']])
+        # the joined load is the only read, nothing is selected again after the UPDATE
+        updated = next(ix for ix, stmt in enumerate(statements) if stmt.startswith('UPDATE authors'))
+        self.assertFalse([stmt for stmt in statements[updated:] if stmt.startswith('SELECT')])
+        return
+
     def test_delete_author(self):
         resp = self.app.delete('/api/authors/2',
                                content_type=CONTENT_TYPE,
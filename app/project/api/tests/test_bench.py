@@ -0,0 +1,32 @@
+import copy
+import unittest
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.bench import seed_bench_data, run_bench, compare
+
+
+class TestBench(RootTestCase):
+
+    def test_every_scenario_runs_without_error(self):
+        seed_bench_data(authors=3, books_per_author=4, users=1)
+        report = run_bench(self.app, iterations=2)
+
+        self.assertEqual(16, len(report['results']))
+        for name, result in report['results'].items():
+            self.assertEqual(0, result['errors'], name)
+            self.assertTrue(result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'])
+        return
+
+    def test_compare_flags_regressions(self):
+        seed_bench_data(authors=1, books_per_author=1, users=1)
+        baseline = run_bench(self.app, iterations=2, only=['book_detail'])
+        report = copy.deepcopy(baseline)
+        report['results']['book_detail']['p95_ms'] = baseline['results']['book_detail']['p95_ms'] * 2 + 1
+
+        self.assertEqual([], compare(baseline, baseline))
+        self.assertEqual(1, len(compare(report, baseline, threshold=0.2)))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,22 @@ import json
 import io
 import unittest
 
+from urllib.parse import quote
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
 from datetime import datetime
+from flask import current_app
 from flask_jwt_extended import create_access_token
 
 from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
 from project.api.models.authors import Author
-from project.api.models.books import Book
+from project.api.models.books import Book, BookSchema
+from project.api.utils.serializers import columns, dump_rows
+from project.api.routes.books import _book_list_query, BOOK_CURSOR_FIELDS
+from project.api.utils.pagination import encode_cursor, prefix_match
+from project.api.utils.bulk import ROW_CONFLICT
 
 
 CONTENT_TYPE = 'application/json'
@@ -99,6 +109,68 @@ class TestAuthors(RootTestCase):
         self.assertEqual(401, resp.status_code)
         return
 
+    def test_create_books_bulk(self):
+        etag = self.app.get('/api/books/').headers['ETag']
+        books = [
+            {'title': 'Bulk 1', 'year': 2001, 'author_id': 1},
+            {'title': 'Bulk 2', 'author_id': 1},  # NO year
+            {'title': 'Bulk 3', 'year': 2003, 'author_id': 2},
+        ]
+        resp = self.app.post('/api/books/bulk',
+                             data=json.dumps(books),
+                             content_type=CONTENT_TYPE,
+                             headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        data = json.loads(resp.data)
+
+        self.assertEqual(201, resp.status_code)
+        self.assertEqual(2, data['inserted'])
+        self.assertEqual([1], [err['index'] for err in data['errors']])
+        self.assertEqual(7, Book.query.count())
+
+        resp = self.app.get('/api/books/', headers={'If-None-Match': etag})
+        self.assertEqual(200, resp.status_code)
+        return
+
+    def test_create_books_bulk_hides_database_errors(self):
+        db.session.execute("CREATE TRIGGER no_boom BEFORE INSERT ON books WHEN new.title = 'boom' "
+                           "BEGIN SELECT RAISE(ABORT, 'secret detail'); END")
+        db.session.commit()
+        books = [
+            {'title': 'Bulk 1', 'year': 2001, 'author_id': 1},
+            {'title': 'boom', 'year': 2002, 'author_id': 1},
+        ]
+        resp = self.app.post('/api/books/bulk',
+                             data=json.dumps(books),
+                             content_type=CONTENT_TYPE,
+                             headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        data = json.loads(resp.data)
+
+        self.assertEqual(201, resp.status_code)
+        self.assertEqual(1, data['inserted'])
+        self.assertEqual([{'index': 1, 'errors': {'_schema': [ROW_CONFLICT]}}], data['errors'])
+        self.assertFalse(b'secret detail' in resp.data)
+        return
+
+    def test_create_books_bulk_ndjson(self):
+        lines = '\n'.join([
+            json.dumps({'title': 'Bulk 1', 'year': 2001, 'author_id': 1}),
+            '{not json',
+            json.dumps({'title': 'Bulk 2', 'year': 2002, 'author_id': 2}),
+        ])
+        resp = self.app.post('/api/books/bulk',
+                             data=lines,
+                             content_type='application/x-ndjson',
+                             headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        data = json.loads(resp.data)
+
+        self.assertEqual(201, resp.status_code)
+        self.assertEqual(2, data['inserted'])
+        self.assertEqual([1], [err['index'] for err in data['errors']])
+        return
+
     def test_get_books(self):
         resp = self.app.get('/api/books/',
                             content_type=CONTENT_TYPE,
@@ -109,6 +181,215 @@ class TestAuthors(RootTestCase):
         self.assertTrue('books' in data)
         return
 
+    def test_projected_rows_match_schema_dump(self):
+        names = ('id', 'author_id', 'title', 'year')
+        rows = Book.query.with_entities(*columns(Book, names)).order_by(Book.id).all()
+        books = Book.query.order_by(Book.id).all()
+
+        self.assertEqual(BookSchema(many=True, only=names).dump(books),
+                         dump_rows(BookSchema, names, rows))
+        return
+
+    def test_get_books_by_cursor(self):
+        seen, url = [], '/api/books/?limit=2&sort=-year'
+        while url:
+            resp = self.app.get(url, content_type=CONTENT_TYPE)
+            data = json.loads(resp.data)
+
+            self.assertEqual(200, resp.status_code)
+            self.assertFalse('count' in data)
+            self.assertTrue(len(data['books']) <= 2)
+            seen.extend(bk['year'] for bk in data['books'])
+            url = data['next_url']
+
+        self.assertEqual([1992, 1986, 1981, 1972, 1970], seen)
+        return
+
+    def test_get_books_by_cursor_with_null_years(self):
+        for title in ('Undated 1', 'Undated 2', 'Undated 3'):
+            Book(title=title, year=None, author_id=1).create()
+
+        for sort, expected in (('year', [1970, 1972, 1981, 1986, 1992, None, None, None]),
+                               ('-year', [None, None, None, 1992, 1986, 1981, 1972, 1970])):
+            seen, ids, url = [], [], f'/api/books/?limit=2&sort={sort}'
+            while url:
+                resp = self.app.get(url, content_type=CONTENT_TYPE)
+                self.assertEqual(200, resp.status_code, url)
+                data = json.loads(resp.data)
+                seen.extend(bk['year'] for bk in data['books'])
+                ids.extend(bk['id'] for bk in data['books'])
+                url = data['next_url']
+
+            self.assertEqual(expected, seen, sort)
+            self.assertEqual(8, len(set(ids)), sort)
+        return
+
+    def test_get_books_with_tampered_cursor(self):
+        for sort, values in (('year', ('1970', 1)), ('year', (1970, 'a')), ('id', (1, None)),
+                             ('title', (3, 1)), ('year', (True, 1))):
+            cursor = encode_cursor(sort, values)
+            resp = self.app.get(f'/api/books/?limit=2&sort={sort}&after={cursor}')
+            self.assertEqual(400, resp.status_code, (sort, values))
+        return
+
+    def test_get_books_filtered(self):
+        resp = self.app.get('/api/books/?author_id=2&year_from=1980&page=1')
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(2, data['count'])
+        self.assertEqual([1986, 1992], [bk['year'] for bk in data['books']])
+
+        resp = self.app.get('/api/books/?title_prefix=Test%20Book%204&sort=-title&limit=1')
+        data = json.loads(resp.data)
+        self.assertEqual([1972], [bk['year'] for bk in data['books']])  # ties: -id
+        self.assertTrue('title_prefix=Test+Book+4' in data['next_url'])
+        return
+
+    def test_get_books_title_prefix_with_punctuation(self):
+        for title in ('a-z', 'a.b', '50% off', '50 cents'):
+            Book(title=title, year=2000, author_id=1).create()
+
+        for prefix, expected in (('a-', ['a-z']), ('a', ['a-z', 'a.b']), ('50%', ['50% off'])):
+            resp = self.app.get('/api/books/?sort=title&limit=10&title_prefix=' + quote(prefix))
+            self.assertEqual(expected, [bk['title'] for bk in json.loads(resp.data)['books']], prefix)
+
+        # no collation dependent range outside SQLite, a (text_pattern_ops served) LIKE only
+        condition = str(prefix_match(Book.title, 'a-', 'postgresql').compile(
+            dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+        self.assertEqual("books.title LIKE 'a-%%' ESCAPE '/'", condition)
+        return
+
+    def test_get_books_filter_not_served_by_sort(self):
+        for query in ('year_from=1980&sort=title', 'title_prefix=T&year_to=1990',
+                      'author_id=one', 'sort=author_id'):
+            resp = self.app.get('/api/books/?limit=2&' + query)
+            self.assertEqual(400, resp.status_code, query)
+        return
+
+    def test_get_books_filters_use_an_index(self):
+        for query in ('', '?sort=-year', '?author_id=1&sort=title', '?author_id=1',
+                      '?year_from=1980&year_to=1990', '?author_id=1&title_prefix=Te'):
+            with self.app.application.test_request_context('/api/books/' + query):
+                sql_query, (_, column, descending) = _book_list_query(BOOK_CURSOR_FIELDS)
+                order = [column.desc(), Book.id.desc()] if descending else [column, Book.id]
+                statement = sql_query.order_by(*order).statement
+                compiled = statement.compile(compile_kwargs={'literal_binds': True})
+                plan = ' '.join(str(row[-1]) for row in
+                                db.session.execute(f'EXPLAIN QUERY PLAN {compiled}'))
+
+            self.assertFalse('TEMP B-TREE' in plan, f'{query}: {plan}')  # no sort step
+            self.assertTrue(query == '' or 'USING' in plan, f'{query}: {plan}')
+        return
+
+    def test_get_books_sparse_fieldsets(self):
+        resp = self.app.get('/api/books/?fields=title&sort=-year&limit=2')
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([{'title': 'Test Book 4'}, {'title': 'Test Book 3'}], data['books'])
+        self.assertTrue('fields=title' in data['next_url'])
+
+        resp = self.app.get('/api/books/?fields=year,id&page=1')
+        self.assertEqual({'id': 1, 'year': 1970}, json.loads(resp.data)['books'][0])
+
+        for url in ('/api/books/?fields=title,isbn', '/api/books/?fields=', '/api/books/2?fields=Author'):
+            self.assertEqual(400, self.app.get(url).status_code, url)
+        return
+
+    def test_get_book_details_sparse_fieldset(self):
+        resp = self.app.get('/api/books/2?fields=year')  # cache miss: 2 columns read
+        self.assertEqual({'year': 1981}, json.loads(resp.data)['book'])
+
+        self.app.get('/api/books/2')                     # fills the cache
+        resp = self.app.get('/api/books/2?fields=title,id')
+        self.assertEqual({'id': 2, 'title': 'Test Book 2'}, json.loads(resp.data)['book'])
+        return
+
+    def test_get_books_by_ids(self):
+        resp = self.app.get('/api/books/?ids=3,42,1,3')
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([3, 1], [book['id'] for book in data['books']])  # requested order
+        self.assertEqual('Test Book 3', data['books'][0]['title'])
+        self.assertEqual([42], data['missing'])
+
+        resp = self.app.get('/api/books/?ids=2,1&fields=year')
+        self.assertEqual([{'year': 1981}, {'year': 1970}], json.loads(resp.data)['books'])
+
+        etag = self.app.get('/api/books/?ids=2,1').headers['ETag'].strip('"')
+        resp = self.app.get('/api/books/?ids=2,1', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+
+        current_app.config['YABOOK_MAX_IDS_PER_REQUEST'] = 2
+        for url in ('/api/books/?ids=1,2,3', '/api/books/?ids=1,a', '/api/books/?ids='):
+            self.assertEqual(400, self.app.get(url).status_code, url)
+        return
+
+    def test_get_books_with_invalid_cursor(self):
+        resp = self.app.get('/api/books/?after=garbage&limit=2',
+                            content_type=CONTENT_TYPE,
+        )
+
+        self.assertEqual(400, resp.status_code)
+        return
+
+    def test_export_books_ndjson(self):
+        resp = self.app.get('/api/books/export')
+        lines = resp.data.decode('utf-8').splitlines()
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('application/x-ndjson', resp.mimetype)
+        self.assertEqual(5, len(lines))
+        self.assertEqual({'id': 1, 'title': 'Test Book 1', 'year': 1970, 'author_id': 1},
+                         json.loads(lines[0]))
+        return
+
+    def test_export_books_csv(self):
+        resp = self.app.get('/api/books/export?format=csv')
+        lines = resp.data.decode('utf-8').splitlines()
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('id,title,year,author_id', lines[0])
+        self.assertEqual(6, len(lines))
+        return
+
+    def test_export_books_unknown_format(self):
+        resp = self.app.get('/api/books/export?format=xml')
+
+        self.assertEqual(400, resp.status_code)
+        return
+
+    def test_search_books(self):
+        book = Book.query.get(3)
+        book.title = 'Corto Maltese'
+        book.create()
+
+        resp = self.app.get('/api/books/search?q=malt')
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([3], [bk['id'] for bk in data['books']])
+
+        resp = self.app.get('/api/books/search?q=test%20book&limit=2')
+        self.assertEqual(2, len(json.loads(resp.data)['books']))
+        return
+
+    def test_search_books_index_follows_deletes(self):
+        resp = self.app.delete('/api/books/1', headers={'Authorization': 'Bearer ' + self.token})
+        self.assertEqual(204, resp.status_code)
+
+        resp = self.app.get('/api/books/search?q="book 1"')
+        self.assertEqual([], json.loads(resp.data)['books'])
+        return
+
+    def test_search_books_without_query(self):
+        resp = self.app.get('/api/books/search?q=%22%2A')
+
+        self.assertEqual(400, resp.status_code)
+        return
+
     def test_get_book_details(self):
         resp = self.app.get('/api/books/2',
                             content_type=CONTENT_TYPE,
@@ -119,6 +400,42 @@ class TestAuthors(RootTestCase):
         self.assertTrue('book' in data)
         return
 
+    def test_get_books_not_modified(self):
+        resp = self.app.get('/api/books/?page=2')
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/api/books/?page=2', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+
+        resp = self.app.get('/api/books/?page=1', headers={'If-None-Match': etag})
+        self.assertEqual(200, resp.status_code)
+        return
+
+    def test_get_book_details_etag_changes_on_update(self):
+        resp = self.app.get('/api/books/2')
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/api/books/2', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+
+        self.app.patch('/api/books/2',
+                       data=json.dumps({'year': 2002}),
+                       content_type=CONTENT_TYPE,
+                       headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        resp = self.app.get('/api/books/2', headers={'If-None-Match': etag})
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(2002, data['book']['year'])
+        return
+
+    def test_get_book_details_not_found(self):
+        resp = self.app.get('/api/books/42')
+
+        self.assertEqual(404, resp.status_code)
+        return
+
     def test_update_book(self):
         book = {
             'year': 2002,
@@ -133,6 +450,30 @@ class TestAuthors(RootTestCase):
         self.assertEqual(200, resp.status_code)
         return
 
+    def test_concurrent_update_is_a_conflict(self):
+        def concurrent_write(session, flush_context, instances):
+            session.connection().execute('UPDATE books SET version = version + 1 WHERE id = 2')
+
+        event.listen(db.session, 'before_flush', concurrent_write)
+        try:
+            resp = self.app.put('/api/books/2',
+                                data=json.dumps({'year': 2002, 'title': 'Amelie'}),
+                                content_type=CONTENT_TYPE,
+                                headers= {'Authorization': 'Bearer ' + self.token}
+            )
+        finally:
+            event.remove(db.session, 'before_flush', concurrent_write)
+
+        self.assertEqual(409, resp.status_code)
+        self.assertEqual('Test Book 2', Book.query.get(2).title)  # rolled back
+
+        resp = self.app.put('/api/books/2',   # reloaded: no conflict anymore
+                            data=json.dumps({'year': 2002, 'title': 'Amelie'}),
+                            content_type=CONTENT_TYPE,
+                            headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        self.assertEqual(200, resp.status_code)
+        return
 
 if __name__ == '__main__':
     unittest.main()
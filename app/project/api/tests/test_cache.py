@@ -0,0 +1,177 @@
+import json
+import time
+import unittest
+
+from flask_jwt_extended import create_access_token
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.cache import LocalCache, RedisCache, cache, book_key, author_key
+from project.api.tests.test_books import book_factory
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        lru = LocalCache(max_entries=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')       # b is now the least recently used
+        lru.set('c', 3)
+
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(1, lru.stats()['evictions'])
+        return
+
+    def test_ttl_expiration(self):
+        lru = LocalCache(max_entries=2, ttl=0)
+        lru.set('a', 1)
+        time.sleep(0.01)
+
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(1, lru.stats()['expirations'])
+        return
+
+    def test_stale_version_is_a_miss(self):
+        lru = LocalCache()
+        lru.set('a', 1, version=1)
+
+        self.assertIsNone(lru.get('a', version=2))
+        self.assertEqual(1, lru.get('a', version=1))
+        self.assertEqual({'hits': 1, 'misses': 1, 'stale': 1},
+                         {k: lru.stats()[k] for k in ('hits', 'misses', 'stale')})
+        return
+
+
+class FakeRedis(object):
+    "The subset of the redis client RedisCache uses, TTLs are ignored"
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode('utf-8')
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def setex(self, key, ttl, value):
+        self.commands.append((key, ttl, value))
+
+    def execute(self):
+        for command in self.commands:
+            self.client.setex(*command)
+        self.commands = []
+
+
+class TestRedisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_cache = RedisCache(None, ttl=60, client=FakeRedis())  # no server needed
+
+    def test_hit_stale_and_miss(self):
+        self.redis_cache.set('a', {'id': 1}, version=1)
+
+        self.assertEqual({'id': 1}, self.redis_cache.get('a', version=1))
+        self.assertIsNone(self.redis_cache.get('a', version=2))
+        self.assertIsNone(self.redis_cache.get('b', version=1))
+        self.assertEqual((1, 2, 1), (self.redis_cache.hits, self.redis_cache.misses,
+                                     self.redis_cache.stale))
+        self.assertIn('yabook:a', self.redis_cache.client.data)
+        return
+
+    def test_get_many_and_set_many(self):
+        self.redis_cache.set_many({'a': ({'id': 1}, 1), 'b': ({'id': 2}, 1)})
+
+        self.assertEqual({'a': {'id': 1}},
+                         self.redis_cache.get_many({'a': 1, 'b': 2, 'c': 1}))
+        self.assertEqual((1, 2, 1), (self.redis_cache.hits, self.redis_cache.misses,
+                                     self.redis_cache.stale))
+        self.assertEqual({}, self.redis_cache.get_many({}))
+
+        self.redis_cache.delete('a')
+        self.assertIsNone(self.redis_cache.get('a', version=1))
+        return
+
+
+class TestDetailCache(RootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        book_factory()
+        self.token = create_access_token(identity='test@corto.org', fresh=True)
+
+    def tearDown(self):
+       super().tearDown()
+
+    def test_read_through_and_invalidation(self):
+        self.app.get('/api/books/2')
+        self.app.get('/api/authors/1')
+        self.app.get('/api/books/2')
+
+        backend = cache.backend
+        self.assertEqual(1, backend.stats()['hits'])
+        self.assertIn(author_key(1), backend._data)
+
+        resp = self.app.patch('/api/books/2',
+                              data=json.dumps({'title': 'Amelie'}),
+                              content_type='application/json',
+                              headers= {'Authorization': 'Bearer ' + self.token}
+        )
+        self.assertEqual(200, resp.status_code)
+        # the book and its author are gone
+        self.assertNotIn(book_key(2), backend._data)
+        self.assertNotIn(author_key(1), backend._data)
+
+        resp = self.app.get('/api/books/2')
+        self.assertEqual('Amelie', json.loads(resp.data)['book']['title'])
+        return
+
+    def test_multi_get_reads_and_fills_in_bulk(self):
+        self.app.get('/api/books/2')                    # one of the three already cached
+        backend = cache.backend
+        resp = self.app.get('/api/books/?ids=1,2,3')
+        self.assertEqual([1, 2, 3], [book['id'] for book in json.loads(resp.data)['books']])
+        self.assertEqual(1, backend.stats()['hits'])
+        self.assertIn(book_key(1), backend._data)
+        self.assertIn(book_key(3), backend._data)
+
+        resp = self.app.get('/api/authors/?ids=2,1')    # embeds the books, as the detail
+        authors = json.loads(resp.data)['authors']
+        self.assertEqual([2, 1], [author['id'] for author in authors])
+        self.assertEqual(3, len(authors[0]['books']))
+        self.assertEqual(authors[1], json.loads(self.app.get('/api/authors/1').data)['author'])
+        self.assertEqual(2, backend.stats()['hits'])  # author 1 filled by the multi-get
+        return
+
+    def test_cache_stats_endpoint(self):
+        self.app.get('/api/books/2')
+        self.assertEqual(401, self.app.get('/api/cache/stats').status_code)
+
+        resp = self.app.get('/api/cache/stats', headers={'Authorization': 'Bearer ' + self.token})
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(1, data['cache']['misses'])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
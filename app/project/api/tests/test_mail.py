@@ -0,0 +1,96 @@
+import socketserver
+import threading
+import unittest
+
+from flask import current_app
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
+from project.api.utils.mail import mail, enqueue_email, deliver_outbox
+from project.api.models.outbox import OutboxEmail
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    "Just enough SMTP for smtplib: greets, accepts every command and records DATA"
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline().decode('utf-8').strip()
+            verb = line.split(' ')[0].upper()
+            if not line or verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            if verb == 'DATA':
+                self.reply('354 go ahead')
+                body = []
+                for data_line in iter(self.rfile.readline, b'.\r\n'):
+                    body.append(data_line)
+                self.server.messages.append(b''.join(body))
+            self.reply('250 ok')
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.messages, self.connections = [], 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class TestMailOutbox(RootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.smtp = LocalSMTPServer()
+        current_app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=self.smtp.server_address[1],
+                                  MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+                                  MAIL_SUPPRESS_SEND=False)
+        mail.init_app(current_app)
+
+    def tearDown(self):
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        super().tearDown()
+
+    def test_batch_uses_one_connection(self):
+        for ix in range(3):
+            enqueue_email(f'user{ix}@nowhere.org', 'Hello', '<p>Hello</p>')
+        db.session.commit()
+
+        sent, failed = deliver_outbox()
+
+        self.assertEqual((3, 0), (sent, failed))
+        self.assertEqual(3, len(self.smtp.messages))
+        self.assertEqual(1, self.smtp.connections)
+        self.assertEqual(3, OutboxEmail.query.filter_by(status=OutboxEmail.SENT).count())
+        self.assertEqual((0, 0), deliver_outbox())
+        return
+
+    def test_retry_with_backoff_when_smtp_down(self):
+        enqueue_email('user@nowhere.org', 'Hello', '<p>Hello</p>')
+        db.session.commit()
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        current_app.config['MAIL_PORT'] = 1  # nothing listens there
+        mail.init_app(current_app)
+
+        sent, failed = deliver_outbox()
+        outbox_email = OutboxEmail.query.one()
+
+        self.assertEqual((0, 1), (sent, failed))
+        self.assertEqual(OutboxEmail.PENDING, outbox_email.status)
+        self.assertEqual(1, outbox_email.attempts)
+        # not due before the backoff delay
+        self.assertEqual((0, 0), deliver_outbox())
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
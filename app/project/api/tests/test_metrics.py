@@ -0,0 +1,101 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.cache import cache
+from project.api.utils.metrics import Registry, render, ARCHIVE
+from project.api.tests.test_books import book_factory
+
+
+class TestMetricsEndpoint(RootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        book_factory()
+
+    def tearDown(self):
+       super().tearDown()
+
+    def test_per_endpoint_metrics(self):
+        self.app.get('/api/books/1')
+        self.app.get('/api/books/1')
+        self.app.get('/api/books/42')
+        text = self.app.get('/metrics').data.decode('utf-8')
+
+        self.assertTrue('yabook_http_requests_total{endpoint="book_routes.get_book_detail",'
+                        'method="GET",status="200"} 2' in text)
+        self.assertTrue('yabook_http_requests_total{endpoint="book_routes.get_book_detail",'
+                        'method="GET",status="404"} 1' in text)
+        self.assertTrue('yabook_http_request_duration_seconds_count'
+                        '{endpoint="book_routes.get_book_detail"} 3' in text)
+        self.assertTrue('yabook_cache_misses_total 1' in text)
+        return
+
+    def test_shared_cache_totals_are_not_exported(self):
+        stats = {'backend': 'redis', 'hits': 3, 'misses': 1, 'evictions': 7}
+        with mock.patch.object(cache, 'stats', return_value=stats):
+            text = self.app.get('/metrics').data.decode('utf-8')
+
+        self.assertTrue('yabook_cache_hits_total 3' in text)  # this worker's own
+        self.assertFalse('yabook_cache_evictions_total 7' in text)  # server-wide
+        return
+
+
+class TestMetricsAggregation(unittest.TestCase):
+
+    def test_snapshots_of_workers_are_summed(self):
+        worker = Registry()
+        worker.inc('yabook_http_requests_total', (('endpoint', 'e'),), 2)
+        worker.set('yabook_hashing_pending', value=3)
+        worker.observe('yabook_http_request_duration_seconds', (('endpoint', 'e'),), 0.02)
+        alive = worker.snapshot()
+
+        dead = dict(alive, pid=2 ** 22 + 1)  # no such process: its gauges are dropped
+        text = render([alive, dead])
+
+        self.assertTrue('yabook_http_requests_total{endpoint="e"} 4' in text)
+        self.assertTrue('yabook_hashing_pending 3' in text)
+        self.assertTrue('yabook_http_request_duration_seconds_bucket{endpoint="e",le="0.025"} 2'
+                        in text)
+        return
+
+    def test_file_backed_collect(self):
+        directory = tempfile.mkdtemp()
+        worker = Registry(directory)
+        worker.inc('yabook_http_requests_total', (('endpoint', 'e'),))
+        worker.flush(force=True)
+
+        self.assertEqual([f'metrics_{os.getpid()}.json'], os.listdir(directory))
+        self.assertTrue('yabook_http_requests_total{endpoint="e"} 1' in render(worker.collect()))
+        return
+
+    def test_dead_workers_are_archived(self):
+        directory = tempfile.mkdtemp()
+        dead = Registry()
+        dead.inc('yabook_http_requests_total', (('endpoint', 'e'),), 2)
+        dead.set_total('yabook_cache_hits_total', value=5)
+        dead.set('yabook_hashing_pending', value=7)
+        dead.observe('yabook_http_request_duration_seconds', (('endpoint', 'e'),), 0.02)
+        for pid in (2 ** 22 + 1, 2 ** 22 + 2):  # no such processes
+            with open(os.path.join(directory, f'metrics_{pid}.json'), 'w') as out:
+                json.dump(dict(dead.snapshot(), pid=pid), out)
+
+        worker = Registry(directory)
+        worker.set_total('yabook_cache_hits_total', value=1)
+        text = render(worker.collect())
+
+        self.assertEqual(sorted([f'metrics_{os.getpid()}.json', ARCHIVE]),
+                         sorted(name for name in os.listdir(directory) if not name.startswith('.')))
+        self.assertTrue('yabook_http_requests_total{endpoint="e"} 4' in text)
+        self.assertTrue('yabook_cache_hits_total 11' in text)  # counters never go backwards
+        self.assertFalse('yabook_hashing_pending 14' in text)
+        self.assertTrue('yabook_http_request_duration_seconds_count{endpoint="e"} 2' in text)
+        self.assertEqual(text, render(worker.collect()))  # archived once
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
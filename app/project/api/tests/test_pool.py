@@ -0,0 +1,64 @@
+import json
+import unittest
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import InstrumentedQueuePool, engine_options, pool_stats
+from project.api.config.config import TestingConfig
+
+
+class TestPool(unittest.TestCase):
+
+    def test_engine_options(self):
+        config = {k: getattr(TestingConfig, k) for k in dir(TestingConfig) if k.isupper()}
+        config['SQLALCHEMY_DATABASE_URI'] = 'postgresql+psycopg2://u:p@db/books'
+
+        options = engine_options(config)
+        self.assertIs(InstrumentedQueuePool, options['poolclass'])
+        self.assertTrue(options['pool_pre_ping'])
+
+        config['YABOOK_DB_PGBOUNCER'] = True
+        self.assertEqual({'poolclass': NullPool}, engine_options(config))
+
+        config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.assertEqual({}, engine_options(config))
+        return
+
+    def test_checkout_timeout_is_recorded(self):
+        engine = create_engine('sqlite://', poolclass=InstrumentedQueuePool,
+                               pool_size=1, max_overflow=0, pool_timeout=0.01)
+        conn = engine.connect()
+        try:
+            self.assertEqual(1, pool_stats(engine)['checked_out'])
+            with self.assertRaises(PoolTimeoutError):
+                engine.connect()
+        finally:
+            conn.close()
+
+        stats = pool_stats(engine)
+        self.assertEqual(1, stats['timeouts'])
+        self.assertEqual(0, stats['checked_out'])
+        self.assertEqual(2, stats['wait_time']['count'])
+        return
+
+
+class TestPoolStatsEndpoint(RootTestCase):
+
+    def test_db_stats(self):
+        self.assertEqual(401, self.app.get('/api/db/stats').status_code)
+
+        token = create_access_token(identity='test@corto.org')
+        resp = self.app.get('/api/db/stats', headers={'Authorization': 'Bearer ' + token})
+        data = json.loads(resp.data)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue('class' in data['pool'])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
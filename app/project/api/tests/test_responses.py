@@ -0,0 +1,132 @@
+import gzip
+import json
+import datetime
+import decimal
+import unittest
+
+from flask import current_app
+from flask_jwt_extended import create_access_token
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.responses import response_with
+from project.api.utils import responses as resp
+from project.api.utils.json_encoding import StdlibEncoder, make_encoder
+from project.api.utils.compression import Compressor, GzipCoder, make_compressor
+from project.api.utils.spec import SpecDocument
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class TestResponses(RootTestCase):
+
+    def test_headers_are_not_shared_between_calls(self):
+        response_with(resp.SERVICE_UNAVAILABLE_503, headers={'Retry-After': '1'})
+        response = response_with(resp.SUCCESS_200)
+
+        self.assertFalse('Retry-After' in response.headers)
+        self.assertEqual('*', response.headers['Access-Control-Allow-Origin'])
+        return
+
+    def test_body_is_compact_json(self):
+        created = datetime.datetime(2020, 8, 1, 12, 30, 5)
+        response = response_with(resp.SUCCESS_200, value={'created_at': created,
+                                                          'price': decimal.Decimal('9.5')})
+
+        self.assertEqual('application/json', response.mimetype)
+        self.assertEqual({'code': 'success', 'created_at': '2020-08-01T12:30:05', 'price': 9.5},
+                         json.loads(response.get_data()))
+        self.assertFalse(b' ' in response.get_data())
+        return
+
+    def test_encoders_agree(self):
+        value = {'b': [1, 2.5, None, True], 'a': 'hé', 'day': datetime.date(2020, 1, 2)}
+        encoder = current_app.extensions['yabook_json']
+
+        self.assertEqual(StdlibEncoder(sort_keys=True).dumps(value), encoder.dumps(value))
+        self.assertEqual('stdlib', make_encoder('stdlib').name)
+        return
+
+    def test_spec_built_once_host_patched_per_request(self):
+        resp = self.app.get('/api/spec')
+        document = current_app.extensions['yabook_spec']
+        spec = json.loads(resp.data)
+
+        self.assertEqual('http://localhost/', spec['info']['base'])
+        self.assertEqual(current_app.config['API_VER'], spec['info']['version'])
+        self.assertTrue(any('/books/' in path for path in spec['paths']))
+
+        other = self.app.get('/api/spec', base_url='https://books.example.org')
+        self.assertIs(document, current_app.extensions['yabook_spec'])
+        self.assertEqual('https://books.example.org/', json.loads(other.data)['info']['base'])
+        self.assertNotEqual(resp.headers['ETag'], other.headers['ETag'])
+
+        resp = self.app.get('/api/spec', headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(document.digest, SpecDocument(current_app).digest)
+        return
+
+
+class TestCompression(RootTestCase):
+
+    def test_gzip_negotiated_and_cached(self):
+        plain = self.app.get('/api/spec')
+        self.assertFalse('Content-Encoding' in plain.headers)
+        self.assertEqual('Accept-Encoding', plain.headers['Vary'])
+
+        current_app.extensions['yabook_compression'] = Compressor([GzipCoder(6)])
+        for _ in range(2):
+            resp = self.app.get('/api/spec', headers={'Accept-Encoding': 'gzip, deflate'})
+            self.assertEqual('gzip', resp.headers['Content-Encoding'])
+            self.assertEqual(json.loads(plain.data), json.loads(gzip.decompress(resp.data)))
+            self.assertEqual(len(resp.data), int(resp.headers['Content-Length']))
+
+        stats = current_app.extensions['yabook_compression'].stats()
+        self.assertEqual(2, stats['compressed'])
+        self.assertEqual(1, stats['cache']['hits'])  # the second one was not recompressed
+        return
+
+    def test_small_or_refused_bodies_are_not_compressed(self):
+        auth = 'Bearer ' + create_access_token(identity='test@corto.org')
+        resp = self.app.get('/api/hashing/stats',
+                            headers={'Accept-Encoding': 'gzip', 'Authorization': auth})
+        self.assertEqual(200, resp.status_code)
+        self.assertFalse('Content-Encoding' in resp.headers)  # below YABOOK_COMPRESS_MIN_SIZE
+
+        current_app.config.update(YABOOK_COMPRESS_MIN_SIZE=0, YABOOK_COMPRESS_BROTLI=False)
+        current_app.extensions['yabook_compression'] = make_compressor(current_app.config)
+        for encoding, expected in (('gzip', 'gzip'), ('gzip;q=0, identity', None), ('', None)):
+            resp = self.app.get('/api/hashing/stats',
+                                headers={'Accept-Encoding': encoding, 'Authorization': auth})
+            self.assertEqual(expected, resp.headers.get('Content-Encoding'), encoding)
+        return
+
+    def test_encoded_representation_has_its_own_etag(self):
+        current_app.extensions['yabook_compression'] = Compressor([GzipCoder(6)])
+        plain = self.app.get('/api/spec')
+        encoded = self.app.get('/api/spec', headers={'Accept-Encoding': 'gzip'})
+
+        plain_etag, encoded_etag = plain.headers['ETag'], encoded.headers['ETag']
+        self.assertNotEqual(plain_etag, encoded_etag)
+        self.assertEqual(plain_etag.strip('"') + '-gzip', encoded_etag.strip('"'))
+
+        for etag in (plain_etag, encoded_etag):
+            resp = self.app.get('/api/spec', headers={'Accept-Encoding': 'gzip',
+                                                      'If-None-Match': etag})
+            self.assertEqual(304, resp.status_code)
+            self.assertEqual(etag, resp.headers['ETag'])
+        return
+
+    @unittest.skipUnless(brotli, "brotli not installed")
+    def test_brotli_preferred(self):
+        resp = self.app.get('/api/spec', headers={'Accept-Encoding': 'gzip, br'})
+
+        self.assertEqual('br', resp.headers['Content-Encoding'])
+        self.assertTrue(json.loads(brotli.decompress(resp.data)))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
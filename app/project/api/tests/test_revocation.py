@@ -0,0 +1,104 @@
+import time
+import datetime
+import unittest
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
+from project.api.utils.revocation import RevocationList
+from project.api.models.revoked_tokens import RevokedToken
+
+
+class TestRevocation(RootTestCase):
+
+    def auth(self, token):
+        return {'Authorization': 'Bearer ' + token}
+
+    def test_logout_revokes_the_token(self):
+        token = create_access_token(identity='foobar', expires_delta=False)
+        other = create_access_token(identity='foobar', expires_delta=False)
+
+        self.assertEqual(200, self.app.post('/api/users/logout', headers=self.auth(token)).status_code)
+        self.assertEqual(401, self.app.post('/api/users/logout', headers=self.auth(token)).status_code)
+        self.assertEqual(200, self.app.post('/api/users/logout', headers=self.auth(other)).status_code)
+        return
+
+    def test_refresh_token_can_be_revoked(self):
+        refresh = create_refresh_token(identity='foobar', expires_delta=False)
+
+        resp = self.app.post('/api/users/refresh', headers=self.auth(refresh))
+        self.assertEqual(201, resp.status_code)
+
+        self.app.post('/api/users/logout/refresh', headers=self.auth(refresh))
+        resp = self.app.post('/api/users/refresh', headers=self.auth(refresh))
+        self.assertEqual(401, resp.status_code)
+        return
+
+    def test_revoke_all(self):
+        token = create_access_token(identity='foobar')
+        decoded = decode_token(create_access_token(identity='foobar'))
+
+        resp = self.app.post('/api/users/revoke-all', headers=self.auth(token))
+        self.assertEqual(200, resp.status_code)
+
+        revocation_list = current_app.extensions['yabook_revocation']
+        self.assertTrue(revocation_list.is_revoked(decoded))
+        self.assertFalse(revocation_list.is_revoked(dict(decoded, iat=int(time.time()) + 1)))
+        self.assertFalse(revocation_list.is_revoked(dict(decoded, identity='someone else')))
+        return
+
+    def test_other_workers_catch_up_incrementally(self):
+        worker = RevocationList(refresh_interval=3600)
+        decoded = decode_token(create_access_token(identity='foobar'))
+        self.assertFalse(worker.is_revoked(decoded))
+
+        current_app.extensions['yabook_revocation'].revoke(decoded)
+        for _ in range(100):  # hot path: no DB round trip before the refresh is due
+            self.assertFalse(worker.is_revoked(decoded))
+        self.assertEqual(1, worker.refreshes)
+
+        worker.refresh(force=True)
+        self.assertTrue(worker.is_revoked(decoded))
+        self.assertEqual({'jtis': 1, 'identities': 0, 'refreshes': 2, 'refresh_interval': 3600},
+                         {k: v for k, v in worker.stats().items() if k != 'last_seen'})
+        return
+
+    def test_late_commit_is_not_missed(self):
+        worker = RevocationList(refresh_interval=3600, margin=60)
+        current_app.extensions['yabook_revocation'].revoke(
+            decode_token(create_access_token(identity='foobar')))
+        worker.refresh(force=True)
+
+        # revoked (revoked_at set) before the row above, committed after the refresh
+        late = decode_token(create_access_token(identity='foobar'))
+        row = RevokedToken('foobar', jti=late['jti'])
+        row.revoked_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=30)
+        db.session.add(row)
+        db.session.commit()
+
+        worker.refresh(force=True)
+        self.assertTrue(worker.is_revoked(late))
+        self.assertEqual(2, worker.stats()['jtis'])  # the first row re-read, not duplicated
+        return
+
+    def test_expired_tokens_are_pruned(self):
+        revocation_list = current_app.extensions['yabook_revocation']
+        expired = decode_token(create_access_token(identity='foobar'))
+        expired['exp'] = int(time.time()) - 10
+        revocation_list.revoke(expired)
+        self.assertEqual(1, revocation_list.stats()['jtis'])
+
+        revocation_list.refresh(force=True)
+        self.assertEqual(0, revocation_list.stats()['jtis'])
+        self.assertFalse(RevocationList().is_revoked(expired))  # not loaded by a new worker
+
+        revocation_list._next_prune = 0
+        revocation_list.revoke(decode_token(create_access_token(identity='foobar')))
+        self.assertEqual(1, RevokedToken.query.count())
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import unittest
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+from project.api.utils.schema import upgrade_schema
+
+## tables as created by the version before row versions and the list / login indexes
+LEGACY_DDL = [
+    "CREATE TABLE authors (id INTEGER PRIMARY KEY, first_name VARCHAR(20), "
+    "last_name VARCHAR(20), created_at DATETIME)",
+    "CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR(50), year INTEGER, "
+    "author_id INTEGER REFERENCES authors (id))",
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(512) NOT NULL UNIQUE, "
+    "password VARCHAR(512) NOT NULL, isVerified BOOLEAN NOT NULL, "
+    "email VARCHAR(256) NOT NULL UNIQUE, created_at DATETIME, updated_at DATETIME)",
+    "INSERT INTO authors (id, first_name, last_name) VALUES (1, 'Ursula', 'Le Guin')",
+    "INSERT INTO books (id, title, year, author_id) VALUES (1, 'Lavinia', 2008, 1)",
+]
+
+
+class TestUpgradeSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.db_file = tempfile.mkstemp()[1]
+        self.engine = create_engine('sqlite:///' + self.db_file)
+        with self.engine.begin() as connection:
+            for statement in LEGACY_DDL:
+                connection.execute(text(statement))
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.db_file)
+
+    def _upgrade(self):
+        with self.engine.begin() as connection:
+            upgrade_schema(connection)
+
+    def test_adds_versions_and_indexes(self):
+        self._upgrade()
+
+        inspector = inspect(self.engine)
+        for name in ('books', 'authors'):
+            self.assertIn('version', [col['name'] for col in inspector.get_columns(name)])
+        with self.engine.connect() as connection:
+            self.assertEqual(1, connection.execute(text('SELECT version FROM books')).scalar())
+            indexes = {row[0] for row in connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        self.assertTrue({'ix_books_author_id', 'ix_books_title', 'ux_users_email_lower',
+                         'ux_users_username_lower'} <= indexes)
+        return
+
+    def test_is_idempotent(self):
+        self._upgrade()
+        self._upgrade()
+
+        columns = [col['name'] for col in inspect(self.engine).get_columns('books')]
+        self.assertEqual(1, columns.count('version'))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
+from project.api.utils.seed import seed_db, SEED_PASSWORD
+from project.api.models.authors import Author
+from project.api.models.books import Book
+from project.api.models.users import User
+from project.api.models.change_counters import ChangeCounter
+
+
+class TestSeed(RootTestCase):
+
+    def test_seed_chunks_and_counts(self):
+        commits = []
+        inserted = seed_db(authors=7, books_per_author=3, users=4, chunk_size=6,
+                           progress=lambda done: commits.append(dict(done)))
+
+        self.assertEqual({'authors': 7, 'books': 21, 'users': 4}, inserted)
+        self.assertEqual(21, Book.query.count())
+        self.assertEqual([3] * 7, [len(author.books) for author in Author.query.order_by(Author.id)])
+        self.assertEqual(4 + 1, len(commits))  # 2 authors per chunk, then one users chunk
+        self.assertEqual(4, ChangeCounter.current(['books'])['books'])
+        return
+
+    def test_seed_is_deterministic(self):
+        seed_db(authors=3, books_per_author=2, users=0, seed=7)
+        first = [(b.title, b.year) for b in Book.query.order_by(Book.id)]
+        db.session.query(Book).delete()
+        db.session.commit()
+
+        seed_db(authors=3, books_per_author=2, users=0, seed=7)
+        self.assertEqual(first, [(b.title, b.year) for b in Book.query.order_by(Book.id)][-6:])
+        return
+
+    def test_seeded_users_share_one_hash(self):
+        seed_db(authors=0, books_per_author=0, users=3, user_prefix='seeded')
+
+        users = User.query.order_by(User.id).all()
+        self.assertEqual(['seeded0', 'seeded1', 'seeded2'], [user.username for user in users])
+        self.assertEqual(1, len({user.password for user in users}))
+        self.assertTrue(User.verify_hash(SEED_PASSWORD, users[0].password))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from project.api.utils.server import gunicorn_options, _green_psycopg
+
+
+class TestServerOptions(unittest.TestCase):
+
+    def test_options_mapping(self):
+        options = gunicorn_options(bind='127.0.0.1:8000', workers=4, timeout=10,
+                                   graceful_timeout=20, max_requests=1000, pidfile='/tmp/y.pid')
+
+        self.assertEqual({'bind': '127.0.0.1:8000', 'workers': 4, 'threads': 1,
+                          'worker_class': 'sync', 'timeout': 10, 'graceful_timeout': 20,
+                          'max_requests': 1000, 'max_requests_jitter': 100,
+                          'pidfile': '/tmp/y.pid', 'preload_app': False}, options)
+        return
+
+    def test_threads_select_gthread(self):
+        options = gunicorn_options(threads=4, preload=True)
+
+        self.assertEqual('gthread', options['worker_class'])
+        self.assertTrue(options['preload_app'])
+        return
+
+    def test_gevent_is_never_preloaded(self):
+        options = gunicorn_options(worker_class='gevent', preload=True)
+
+        self.assertEqual('gevent', options['worker_class'])
+        self.assertFalse(options['preload_app'])
+        self.assertIs(_green_psycopg, options['post_fork'])  # psycopg2 waits on greenlets
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
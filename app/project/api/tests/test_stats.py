@@ -0,0 +1,110 @@
+import json
+import unittest
+from unittest import mock
+
+from sqlalchemy import event
+
+from flask_jwt_extended import create_access_token
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
+from project.api.models.authors import Author
+from project.api.models.books import Book
+from project.api.models.catalog_stats import (
+    CatalogTotal, BookYearCount, AuthorStats, rebuild
+)
+from project.api.models import catalog_stats
+from project.api.tests.test_books import book_factory
+
+CONTENT_TYPE = 'application/json'
+
+
+def summaries():
+    return (sorted(db.session.query(CatalogTotal.name, CatalogTotal.value)),
+            sorted(db.session.query(BookYearCount.year, BookYearCount.count)
+                             .filter(BookYearCount.count != 0)),
+            sorted(db.session.query(AuthorStats.author_id, AuthorStats.book_count,
+                                    AuthorStats.first_year, AuthorStats.last_year)
+                             .filter(AuthorStats.book_count != 0)))
+
+
+class TestStats(RootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        book_factory()
+        self.auth = {'Authorization': 'Bearer ' + create_access_token(identity='test@corto.org',
+                                                                      fresh=True)}
+
+    def assertMatchesRebuild(self):
+        incremental = summaries()
+        with db.engine.begin() as connection:
+            rebuild(connection)
+        db.session.expire_all()
+        self.assertEqual(summaries(), incremental)
+
+    def test_get_book_stats(self):
+        resp = self.app.get('/api/books/stats')
+        stats = json.loads(resp.data)['stats']
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(5, stats['books'])
+        self.assertEqual(2, stats['authors'])
+        self.assertEqual({'1970': 1, '1972': 1, '1981': 1, '1986': 1, '1992': 1}, stats['by_year'])
+        self.assertEqual({'1970': 2, '1980': 2, '1990': 1}, stats['by_decade'])
+        return
+
+    def test_get_author_stats(self):
+        resp = self.app.get('/api/authors/2/stats')
+        stats = json.loads(resp.data)['stats']
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'author_id': 2, 'book_count': 3, 'first_year': 1972, 'last_year': 1992},
+                         stats)
+        self.assertEqual(404, self.app.get('/api/authors/42/stats').status_code)
+        return
+
+    def test_stats_follow_writes(self):
+        self.app.patch('/api/books/5', headers=self.auth, content_type=CONTENT_TYPE,
+                       data=json.dumps({'year': 2001}))
+        self.app.delete('/api/books/4', headers=self.auth)
+        self.app.post('/api/books/bulk', headers=self.auth, content_type=CONTENT_TYPE,
+                      data=json.dumps([{'title': 'b1', 'year': 1950, 'author_id': 1},
+                                       {'title': 'b2', 'year': 1950, 'author_id': 2}]))
+
+        stats = json.loads(self.app.get('/api/authors/2/stats').data)['stats']
+        self.assertEqual({'author_id': 2, 'book_count': 3, 'first_year': 1950, 'last_year': 2001},
+                         stats)
+        self.assertMatchesRebuild()
+
+        self.app.delete('/api/authors/1', headers=self.auth)  # cascades to its books
+        stats = json.loads(self.app.get('/api/books/stats').data)['stats']
+        self.assertEqual((3, 1), (stats['books'], stats['authors']))
+        self.assertMatchesRebuild()
+        return
+
+    def test_first_write_of_a_key_is_one_upsert(self):
+        statements = []
+        def count_statements(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statements)
+        try:
+            Book(title='New year', year=1930, author_id=1).create()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+
+        writes = [stmt for stmt in statements if 'book_year_counts' in stmt or 'author_stats' in stmt]
+        self.assertEqual(2, len(writes))
+        self.assertTrue(all('ON CONFLICT' in stmt for stmt in writes))
+        self.assertMatchesRebuild()
+        return
+
+    def test_stats_follow_writes_without_upsert(self):
+        with mock.patch.object(catalog_stats, '_upsert_supported', return_value=False):
+            self.test_stats_follow_writes()
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
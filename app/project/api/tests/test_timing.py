@@ -0,0 +1,48 @@
+import unittest
+
+from sqlalchemy.exc import OperationalError
+
+from project.api.utils.test_base import RootTestCase
+from project.api.utils.database import db
+from project.api.tests.test_authors import author_factory
+
+
+class TestServerTiming(RootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        author_factory()
+
+    def tearDown(self):
+       super().tearDown()
+
+    def test_server_timing_header(self):
+        resp = self.app.get('/api/authors/2')
+        entries = {entry.split(';')[0]: entry
+                   for entry in resp.headers['Server-Timing'].split(', ')}
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'db', 'dump', 'total'}, set(entries))
+        # version + joined author/books load
+        self.assertTrue('desc="2 queries"' in entries['db'])
+        return
+
+    def test_no_dump_on_not_modified(self):
+        etag = self.app.get('/api/authors/2').headers['ETag']
+        resp = self.app.get('/api/authors/2', headers={'If-None-Match': etag})
+
+        self.assertEqual(304, resp.status_code)
+        self.assertTrue('dump;dur=0.00' in resp.headers['Server-Timing'])
+        return
+
+    def test_failed_statement_leaves_no_start(self):
+        with db.engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute('SELECT * FROM no_such_table')
+
+            self.assertEqual([], connection.info['_timing_start'])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,13 @@ import json
 import unittest
 
 from datetime import datetime
+from flask import current_app
+from flask_jwt_extended import decode_token
 
 from project.api.utils.test_base import RootTestCase
 from project.api.models.users import User
 from project.api.utils.token import generate_verification_token, confirm_verification_token
+from project.api.utils.hashing import HashingService
 
 
 def set_users():
@@ -50,6 +53,42 @@ class TestUsers(RootTestCase):
 
         self.assertEqual(200, resp.status_code)
         self.assertTrue('access_token' in data)
+        # JWT_*_TOKEN_EXPIRES apply => revoked jtis can be dropped once expired
+        access, refresh = decode_token(data['access_token']), decode_token(data['refresh_token'])
+        self.assertEqual(60, access['exp'] - access['iat'])
+        self.assertTrue('exp' in refresh)
+        return
+
+    def test_login_when_hashing_saturated(self):
+        current_app.extensions['yabook_hasher'] = HashingService(workers=0, max_pending=0,
+                                                                 retry_after=3)
+        (full_user, pwd), _ = set_users()
+        user = {
+            "email": full_user.email,
+            "password": pwd
+        }
+
+        resp = self.app.post('/api/users/login',
+                             data=json.dumps(user),
+                             content_type='application/json'
+        )
+
+        self.assertEqual(503, resp.status_code)
+        self.assertEqual('3', resp.headers['Retry-After'])
+        self.assertEqual(1, current_app.extensions['yabook_hasher'].stats()['rejected'])
+        return
+
+    def test_hashing_in_process_pool(self):
+        service = HashingService(workers=1, max_pending=2)
+        try:
+            hashed = service.run(User.generate_hash, 'secret')
+            self.assertTrue(service.run(User.verify_hash, 'secret', hashed))
+        finally:
+            service.shutdown()
+
+        stats = service.stats()
+        self.assertEqual(2, stats['latency']['count'])
+        self.assertEqual(0, stats['rejected'])
         return
 
     def test_login_wrong_credentials(self):
@@ -99,6 +138,33 @@ class TestUsers(RootTestCase):
         self.assertTrue('created' in data['code'])
         return
 
+    def test_create_user_already_defined(self):
+        # same e-mail / username as foobar, other case: rejected by the lower() unique indexes
+        for user in ({"username": 'babar', "password": 'hello world', "email": 'Foo.Bar@Nowhere.org'},
+                     {"username": 'FooBar', "password": 'hello world', "email": 'babar@nowhere.net'}):
+            resp = self.app.post('/api/users/',
+                                 data=json.dumps(user),
+                                 content_type='application/json'
+            )
+            self.assertEqual(422, resp.status_code)
+
+        self.assertEqual(2, User.query.count())
+        return
+
+    def test_login_is_case_insensitive(self):
+        (full_user, pwd), _ = set_users()
+        for user in ({"email": full_user.email.upper(), "password": pwd},
+                     {"username": 'FOOBAR', "password": pwd}):
+            resp = self.app.post('/api/users/login',
+                                 data=json.dumps(user),
+                                 content_type='application/json'
+            )
+            data = json.loads(resp.data)
+
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual('Logged in as foobar', data['message'])
+        return
+
     def test_create_user_without_username(self):
         user = {
             # NO username on purpose
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import platform
+import tempfile
+
+from flask import current_app
+from flask_jwt_extended import create_access_token
+
+from project.api.utils.database import db, engine_options
+from project.api.models.authors import Author
+from project.api.models.books import Book
+from project.api.utils.seed import seed_db
+
+
+CONTENT_TYPE = 'application/json'
+BENCH_PASSWORD = 'bench-password'
+
+
+## Data set
+
+def seed_bench_data(authors=50, books_per_author=20, users=5, seed=42):
+    "Loads the bench data set in the current DB - users are bench0... with BENCH_PASSWORD"
+    return seed_db(authors, books_per_author, users, seed=seed, password=BENCH_PASSWORD,
+                   user_prefix='bench')
+
+
+## Scenarios - (name, call issuing one request, optional untimed preparation)
+
+# expected error answers - any other status >= 400 counts as an error
+EXPECTED_STATUS = {'user_signup_duplicate': 422}
+
+
+def _scenarios(client, token, iterations):
+    auth = {'Authorization': 'Bearer ' + token}
+    book_ids = [row.id for row in db.session.query(Book.id).order_by(Book.id)]
+    author_ids = [row.id for row in db.session.query(Author.id).order_by(Author.id)]
+    deep_page = max(1, len(book_ids) // current_app.config['YABOOK_ITEMS_PER_PAGE'])
+    counter = iter(range(10 ** 9))
+    to_delete = []
+
+    def pick(ids):
+        return ids[next(counter) % len(ids)]
+
+    def prepare_delete():
+        to_delete.extend(Book('to delete', 2000, author_ids[0]).create().id
+                         for _ in range(iterations))
+
+    def signup():
+        ix = next(counter)
+        return client.post('/api/users/', content_type=CONTENT_TYPE,
+                           data=json.dumps({'username': f'signup{ix}',
+                                            'email': f'signup{ix}@nowhere.org',
+                                            'password': BENCH_PASSWORD}))
+
+    return [
+        ('book_list_first_page', lambda: client.get('/api/books/?page=1'), None),
+        ('book_list_deep_page', lambda: client.get(f'/api/books/?page={deep_page}'), None),
+        ('book_list_cursor', lambda: client.get('/api/books/?limit=20'), None),
+        ('book_list_filtered', lambda: client.get(
+            f'/api/books/?author_id={pick(author_ids)}&sort=-year&limit=20'), None),
+        ('author_list', lambda: client.get('/api/authors/?page=1'), None),
+        ('author_list_include_books', lambda: client.get('/api/authors/?include=books'), None),
+        ('book_detail', lambda: client.get(f'/api/books/{pick(book_ids)}'), None),
+        ('author_detail', lambda: client.get(f'/api/authors/{pick(author_ids)}'), None),
+        ('book_create', lambda: client.post(
+            '/api/books/', headers=auth, content_type=CONTENT_TYPE,
+            data=json.dumps({'title': 'bench', 'year': 2001, 'author_id': author_ids[0]})), None),
+        ('book_put', lambda: client.put(
+            f'/api/books/{pick(book_ids)}', headers=auth, content_type=CONTENT_TYPE,
+            data=json.dumps({'title': 'bench put', 'year': 2002})), None),
+        ('book_patch', lambda: client.patch(
+            f'/api/books/{pick(book_ids)}', headers=auth, content_type=CONTENT_TYPE,
+            data=json.dumps({'year': 2003})), None),
+        ('book_delete', lambda: client.delete(f'/api/books/{to_delete.pop()}', headers=auth),
+         prepare_delete),
+        ('user_signup', signup, None),
+        ('user_signup_duplicate', lambda: client.post(
+            '/api/users/', content_type=CONTENT_TYPE,
+            data=json.dumps({'username': 'BENCH0', 'email': 'bench0@example.org',
+                             'password': BENCH_PASSWORD})), None),
+        ('user_login', lambda: client.post(
+            '/api/users/login', content_type=CONTENT_TYPE,
+            data=json.dumps({'username': 'bench0', 'password': BENCH_PASSWORD})), None),
+        ('user_login_email', lambda: client.post(
+            '/api/users/login', content_type=CONTENT_TYPE,
+            data=json.dumps({'email': 'Bench0@Example.org', 'password': BENCH_PASSWORD})), None),
+    ]
+
+
+def percentile(sorted_values, pct):
+    "Nearest-rank percentile of an already sorted list"
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_bench(client, iterations=200, only=None):
+    token = create_access_token(identity='bench@nowhere.org', fresh=True)
+    results = {}
+
+    for name, call, prepare in _scenarios(client, token, iterations):
+        if only and name not in only:
+            continue
+
+        if prepare is not None:
+            prepare()
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            resp = call()
+            latencies.append(time.perf_counter() - t0)
+            if resp.status_code >= 400 and resp.status_code != EXPECTED_STATUS.get(name):
+                errors += 1
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        results[name] = {
+            'count': iterations,
+            'errors': errors,
+            'rps': iterations / elapsed if elapsed else 0.0,
+            'mean_ms': 1000 * sum(latencies) / len(latencies),
+            'p50_ms': 1000 * percentile(latencies, 50),
+            'p95_ms': 1000 * percentile(latencies, 95),
+            'p99_ms': 1000 * percentile(latencies, 99),
+        }
+
+    return {'meta': {'python': platform.python_version(), 'iterations': iterations,
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+def compare(report, baseline, threshold=0.2):
+    """
+    Regressions of report vs baseline: p95 more than threshold slower, or throughput
+    more than threshold lower. Returns a list of human readable messages.
+    """
+    regressions = []
+    for name, base in baseline['results'].items():
+        current = report['results'].get(name)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {current['p95_ms']:.2f}ms vs {base['p95_ms']:.2f}ms")
+        if current['rps'] < base['rps'] * (1 - threshold):
+            regressions.append(f"{name}: {current['rps']:.1f} req/s vs {base['rps']:.1f} req/s")
+    return regressions
+
+
+def format_report(report):
+    lines = [f"{'scenario':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"]
+    for name, res in report['results'].items():
+        lines.append(f"{name:<28}{res['rps']:>10.1f}{res['p50_ms']:>10.2f}"
+                     f"{res['p95_ms']:>10.2f}{res['p99_ms']:>10.2f}{res['errors']:>8}")
+    return '\n'.join(lines)
+
+
+def bench_app(create_app, db_url=None, authors=50, books_per_author=20, users=5,
+              iterations=200, only=None):
+    """
+    Seeds the data set in db_url (a scratch database, tables are created if needed)
+    or by default in a throw-away SQLite file, then runs every scenario in-process
+    """
+    app = create_app()
+    tmp_file = None
+    if db_url is None:
+        fd, tmp_file = tempfile.mkstemp(prefix='yabook-bench-', suffix='.db')
+        os.close(fd)
+        db_url = 'sqlite:///' + tmp_file
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    if 'sqlalchemy' not in app.extensions:
+        db.init_app(app)
+
+    try:
+        with app.app_context():
+            db.create_all()
+            seed_bench_data(authors, books_per_author, users)
+            report = run_bench(app.test_client(), iterations, only)
+            report['meta'].update({'authors': authors, 'books_per_author': books_per_author,
+                                   'db': db.engine.url.drivername})
+            db.session.remove()
+            db.engine.dispose()
+        return report
+
+    finally:
+        if tmp_file is not None:
+            os.remove(tmp_file)
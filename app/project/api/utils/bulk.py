@@ -0,0 +1,114 @@
+import json
+import logging
+
+from flask import request, current_app
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from project.api.utils.database import db
+from project.api.models.change_counters import ChangeCounter, bump_author_versions
+from project.api.models.catalog_stats import record_inserts
+
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+## per-row errors of the database: the DBAPI text (constraint / table names, SQL) is
+## only logged, the client gets a generic message
+ROW_CONFLICT = 'Row conflicts with existing data (constraint violation).'
+ROW_REJECTED = 'Row rejected by the database.'
+
+
+class BulkBodyError(ValueError):
+    "Raised when the request body is neither a JSON array nor NDJSON"
+
+
+def parse_bulk_body():
+    """
+    Returns a list of (index, row) - a row is either a dict or the exception raised
+    while decoding its NDJSON line, so that one bad line does not void the batch
+    """
+    max_rows = current_app.config['YABOOK_BULK_MAX_ROWS']
+
+    if request.mimetype in NDJSON_CONTENT_TYPES:
+        rows = []
+        lines = (line for line in request.get_data(as_text=True).splitlines() if line.strip())
+        for ix, line in enumerate(lines):
+            try:
+                rows.append((ix, json.loads(line)))
+            except ValueError as ex:
+                rows.append((ix, ex))
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            raise BulkBodyError("expected a JSON array or an NDJSON body")
+        rows = list(enumerate(data))
+
+    if len(rows) > max_rows:
+        raise BulkBodyError(f"too many rows ({len(rows)} > {max_rows})")
+
+    return rows
+
+
+def bulk_insert(model, schema, fields, rows):
+    """
+    Validates every row with schema then inserts the valid ones with one executemany
+    per chunk, all chunks in the same transaction. A chunk refused by the DB (FK, unique...)
+    is rolled back to its savepoint and replayed row by row to pinpoint the culprits.
+    Returns (inserted, errors) where errors is a list of {'index', 'errors'}.
+    """
+    chunk_size = current_app.config['YABOOK_BULK_CHUNK_SIZE']
+    table = model.__table__
+    valid, errors = [], []
+
+    for ix, row in rows:
+        if isinstance(row, Exception):
+            errors.append({'index': ix, 'errors': {'_schema': [str(row)]}})
+            continue
+
+        if not isinstance(row, dict):
+            errors.append({'index': ix, 'errors': {'_schema': ['Invalid input type.']}})
+            continue
+
+        row_errors = schema.validate(row)
+        if row_errors:
+            errors.append({'index': ix, 'errors': row_errors})
+        else:
+            valid.append((ix, {k: row.get(k) for k in fields}))
+
+    inserted = []
+    try:
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert(), [values for _, values in chunk])
+                inserted.extend(values for _, values in chunk)
+
+            except DBAPIError as ex:
+                logging.error(f"Intercepted Exception: {ex}")
+                for ix, values in chunk:
+                    try:
+                        with db.session.begin_nested():
+                            db.session.execute(table.insert(), values)
+                        inserted.append(values)
+
+                    except DBAPIError as row_ex:
+                        logging.error(f"Intercepted Exception: {row_ex}")
+                        message = ROW_CONFLICT if isinstance(row_ex, IntegrityError) else ROW_REJECTED
+                        errors.append({'index': ix, 'errors': {'_schema': [message]}})
+
+        if inserted:
+            # Core inserts bypass the ORM flush hook
+            ChangeCounter.bump(db.session.connection(), [table.name])
+            if table.name == 'books':
+                bump_author_versions(db.session.connection(),
+                                     (values.get('author_id') for values in inserted))
+            record_inserts(db.session.connection(), table.name, inserted)
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    errors.sort(key=lambda err: err['index'])
+    return len(inserted), errors
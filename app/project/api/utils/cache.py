@@ -0,0 +1,286 @@
+import json
+import time
+import threading
+import logging
+
+from collections import OrderedDict
+from flask import current_app
+
+
+## Backends - all expose get / set / get_many / set_many / delete / clear / stats
+## An entry is stored with the version (ETag) it was built from, a get() for another
+## version is a (stale) miss: workers with their own local cache never serve outdated data
+
+class LocalCache(object):
+    "In-process LRU bounded to max_entries, entries expire after ttl seconds"
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.evictions = self.expirations = 0
+
+    def get(self, key, version=None):
+        with self._lock:
+            return self._get(key, version, time.monotonic())
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._set(key, value, version, time.monotonic())
+
+    def get_many(self, versions):
+        "versions: {key: version} - returns {key: value} of the hits, one lock round"
+        with self._lock:
+            now = time.monotonic()
+            found = ((key, self._get(key, version, now)) for key, version in versions.items())
+            return {key: value for key, value in found if value is not None}
+
+    def set_many(self, entries):
+        "entries: {key: (value, version)}"
+        with self._lock:
+            now = time.monotonic()
+            for key, (value, version) in entries.items():
+                self._set(key, value, version, now)
+
+    def _get(self, key, version, now):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, entry_version, value = entry
+        if expires_at < now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if entry_version != version:
+            self.stale += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _set(self, key, value, version, now):
+        self._data[key] = (now + self.ttl, version, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'local', 'size': len(self._data),
+                    'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'stale': self.stale,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class RedisCache(object):
+    "Shared between workers - eviction is left to the server (maxmemory-policy allkeys-lru)"
+
+    def __init__(self, url, ttl=300, prefix='yabook:', client=None):
+        if client is None:
+            import redis  # optional dependency, only needed for this backend
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = self.stale = 0
+
+    def get(self, key, version=None):
+        return self._decode(self.client.get(self.prefix + key), version)
+
+    def set(self, key, value, version=None):
+        self.client.setex(self.prefix + key, self.ttl,
+                          json.dumps({'version': version, 'value': value}))
+
+    def get_many(self, versions):
+        "one MGET round trip"
+        keys = list(versions)
+        if not keys:
+            return {}
+        raws = self.client.mget([self.prefix + key for key in keys])
+        found = ((key, self._decode(raw, versions[key])) for key, raw in zip(keys, raws))
+        return {key: value for key, value in found if value is not None}
+
+    def set_many(self, entries):
+        "one pipelined round trip"
+        pipe = self.client.pipeline(transaction=False)
+        for key, (value, version) in entries.items():
+            pipe.setex(self.prefix + key, self.ttl,
+                       json.dumps({'version': version, 'value': value}))
+        pipe.execute()
+
+    def _decode(self, raw, version):
+        if raw is None:
+            self.misses += 1
+            return None
+
+        entry = json.loads(raw)
+        if entry['version'] != version:
+            self.stale += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry['value']
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        info = self.client.info('stats')
+        return {'backend': 'redis', 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses, 'stale': self.stale,
+                'evictions': info.get('evicted_keys', 0),
+                'expirations': info.get('expired_keys', 0)}
+
+
+class NullCache(object):
+    "Caching disabled"
+
+    def get(self, key, version=None):
+        return None
+
+    def set(self, key, value, version=None):
+        pass
+
+    def get_many(self, versions):
+        return {}
+
+    def set_many(self, entries):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'null'}
+
+
+## Flask extension - one backend per app, selected by YABOOK_CACHE_BACKEND
+
+class Cache(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('YABOOK_CACHE_BACKEND', 'local')
+        ttl = int(app.config.get('YABOOK_CACHE_TTL', 300))
+
+        if kind == 'redis':
+            backend = RedisCache(app.config['YABOOK_CACHE_REDIS_URL'], ttl=ttl)
+        elif kind == 'local':
+            backend = LocalCache(int(app.config.get('YABOOK_CACHE_MAX_ENTRIES', 1024)), ttl=ttl)
+        else:
+            backend = NullCache()
+
+        app.extensions['yabook_cache'] = backend
+
+    @property
+    def backend(self):
+        return current_app.extensions['yabook_cache']
+
+    def get(self, key, version=None):
+        try:
+            return self.backend.get(key, version)
+
+        except Exception as ex:  # a cache outage must not fail the request
+            logging.error(f"Intercepted Exception: {ex}")
+            return None
+
+    def set(self, key, value, version=None):
+        try:
+            self.backend.set(key, value, version)
+
+        except Exception as ex:
+            logging.error(f"Intercepted Exception: {ex}")
+
+    def get_many(self, versions):
+        try:
+            return self.backend.get_many(versions)
+
+        except Exception as ex:
+            logging.error(f"Intercepted Exception: {ex}")
+            return {}
+
+    def set_many(self, entries):
+        try:
+            if entries:
+                self.backend.set_many(entries)
+
+        except Exception as ex:
+            logging.error(f"Intercepted Exception: {ex}")
+
+    def delete(self, *keys):
+        try:
+            self.backend.delete(*keys)
+
+        except Exception as ex:
+            logging.error(f"Intercepted Exception: {ex}")
+
+    def stats(self):
+        return self.backend.stats()
+
+
+cache = Cache()
+
+
+def book_key(id):
+    return f'book:{id}'
+
+
+def author_key(id):
+    return f'author:{id}'
+
+
+def read_through_many(key, versions, load, fields=None):
+    """
+    Bulk read-through - versions: {id: cache version} of the rows to return. Cached dicts
+    are read with one get_many, load(missing ids) returns {id: dict} for the others (one
+    SELECT ... IN (...)) which are stored with one set_many - unless trimmed to ?fields=
+    """
+    cached = cache.get_many({key(id): version for id, version in versions.items()})
+    found, missing = {}, []
+    for id in versions:
+        value = cached.get(key(id))
+        if value is None:
+            missing.append(id)
+        elif fields is None:
+            found[id] = value
+        else:
+            found[id] = {name: value[name] for name in fields if name in value}
+
+    if missing:
+        loaded = load(missing)
+        found.update(loaded)
+        if fields is None:
+            cache.set_many({key(id): (value, versions[id]) for id, value in loaded.items()})
+
+    return found
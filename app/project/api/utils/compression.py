@@ -0,0 +1,146 @@
+import zlib
+import hashlib
+import logging
+
+from flask import current_app, request
+
+from project.api.utils.cache import LocalCache
+from project.api.utils.etag import encoded_etag
+
+
+## Negotiated compression of the response bodies: brotli (optional dependency) when
+## installed and accepted by the client, gzip otherwise. Small bodies are sent as is,
+## the compressed form of recent bodies is kept in a small LRU (hot list pages, spec).
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv',
+                          'text/css', 'application/javascript')
+
+
+class GzipCoder(object):
+    name = 'gzip'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        # gzip container, no file name nor mtime => same body, same bytes
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+
+class BrotliCoder(object):
+    name = 'br'
+
+    def __init__(self, quality=4):
+        import brotli  # optional dependency, ImportError => gzip only
+
+        self._compress = brotli.compress
+        self.quality = quality
+
+    def compress(self, data):
+        return self._compress(data, quality=self.quality)
+
+
+class Compressor(object):
+
+    def __init__(self, coders, min_size=500, mimetypes=COMPRESSIBLE_MIMETYPES, cache_entries=64):
+        self.coders = {coder.name: coder for coder in coders}  # by order of preference
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.cache = LocalCache(max_entries=cache_entries, ttl=3600) if cache_entries else None
+        self.compressed = self.too_small = self.bytes_in = self.bytes_out = 0
+
+    def process(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if response.direct_passthrough or response.is_streamed or \
+           response.status_code in (204, 304) or 'Content-Encoding' in response.headers:
+            return response
+
+        coding = request.accept_encodings.best_match(list(self.coders))
+        if coding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            self.too_small += 1
+            return response
+
+        response.set_data(self._compress(self.coders[coding], data,
+                                         cacheable=request.method == 'GET' and
+                                                   response.status_code == 200))
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:  # strong validators differ per representation
+            response.set_etag(encoded_etag(etag, coding))
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += response.content_length
+        return response
+
+    def _compress(self, coder, data, cacheable):
+        if self.cache is None or not cacheable:
+            return coder.compress(data)
+
+        # digesting is an order of magnitude cheaper than compressing
+        key = f'{coder.name}:{hashlib.sha1(data).hexdigest()}'
+        body = self.cache.get(key)
+        if body is None:
+            body = coder.compress(data)
+            self.cache.set(key, body)
+        return body
+
+    def stats(self):
+        return {'codings': list(self.coders), 'min_size': self.min_size,
+                'compressed': self.compressed, 'too_small': self.too_small,
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                'cache': self.cache.stats() if self.cache is not None else None}
+
+
+def make_compressor(config):
+    coders = []
+    if config.get('YABOOK_COMPRESS_BROTLI', True):
+        try:
+            coders.append(BrotliCoder(int(config.get('YABOOK_COMPRESS_BROTLI_QUALITY', 4))))
+
+        except ImportError as ex:
+            logging.info(f"brotli not available: {ex}")
+
+    coders.append(GzipCoder(int(config.get('YABOOK_COMPRESS_LEVEL', 6))))
+    return Compressor(coders,
+                      min_size=int(config.get('YABOOK_COMPRESS_MIN_SIZE', 500)),
+                      cache_entries=int(config.get('YABOOK_COMPRESS_CACHE_ENTRIES', 64)))
+
+
+## Flask extension - applied by the app's after_request hook
+
+class Compression(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config.get('YABOOK_COMPRESS', True):
+            app.extensions['yabook_compression'] = make_compressor(app.config)
+
+    def process(self, response):
+        compressor = current_app.extensions.get('yabook_compression')
+        if compressor is None:
+            return response
+
+        try:
+            return compressor.process(response)
+
+        except Exception as ex:  # never fail a request for the sake of saving bytes
+            logging.error(f"Intercepted Exception: {ex}")
+            return response
+
+    def stats(self):
+        compressor = current_app.extensions.get('yabook_compression')
+        return compressor.stats() if compressor is not None else {'enabled': False}
+
+
+compression = Compression()
@@ -1,5 +1,76 @@
+import time
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+
+from project.api.utils.histogram import Histogram
 
 db = SQLAlchemy() # Will init the DB creation
 
 
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class InstrumentedQueuePool(QueuePool):
+    "QueuePool recording how long a checkout waits for a connection and how often it gives up"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_time = Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_time, pool.timeouts = self.wait_time, self.timeouts
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+
+        finally:
+            self.wait_time.observe(time.perf_counter() - start)
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS from the YABOOK_DB_* settings. Pool sizing only applies
+    to server databases (SQLite keeps the driver defaults). Behind pgbouncer in
+    transaction mode the pooling is done by pgbouncer: no client side pool at all.
+    """
+    uri = str(config.get('SQLALCHEMY_DATABASE_URI') or '')
+    if not uri.startswith('postgresql'):
+        return {}
+
+    if config.get('YABOOK_DB_PGBOUNCER'):
+        return {'poolclass': NullPool}
+
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(config['YABOOK_DB_POOL_SIZE']),
+        'max_overflow': int(config['YABOOK_DB_MAX_OVERFLOW']),
+        'pool_timeout': float(config['YABOOK_DB_POOL_TIMEOUT']),
+        'pool_recycle': int(config['YABOOK_DB_POOL_RECYCLE']),
+        'pool_pre_ping': bool(config['YABOOK_DB_POOL_PRE_PING']),
+    }
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({'size': pool.size(),
+                      'checked_in': pool.checkedin(),
+                      'checked_out': pool.checkedout(),
+                      'overflow': max(pool.overflow(), 0),
+                      'max_overflow': pool._max_overflow})
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({'timeouts': pool.timeouts,
+                      'wait_time': pool.wait_time.snapshot()})
+    return stats
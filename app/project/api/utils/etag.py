@@ -0,0 +1,65 @@
+import hashlib
+
+from flask import request, make_response
+
+from project.api.utils.database import db
+from project.api.utils.responses import API_NAME
+from project.api.models.change_counters import ChangeCounter
+
+
+def make_etag(*parts):
+    "Strong ETag from the version parts and the query string (which shapes the body)"
+    raw = ':'.join(str(part) for part in parts) + '?' + request.query_string.decode('latin-1')
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def row_version(model, id):
+    "Reads only the version column - None when the row does not exist"
+    return db.session.query(model.version).filter(model.id == id).scalar()
+
+
+def row_versions(model, ids):
+    "{id: version} of the rows that exist among ids - one SELECT ... IN (...)"
+    return dict(db.session.query(model.id, model.version).filter(model.id.in_(ids)))
+
+
+def table_etag(*table_names):
+    counters = ChangeCounter.current(table_names)
+    return make_etag(*(f'{name}={counters[name]}' for name in table_names))
+
+
+## a content-coded body (see compression) is another representation: its strong ETag
+## is the identity one suffixed with the coding
+CODINGS = ('gzip', 'br')
+
+
+def encoded_etag(etag, coding):
+    return f'{etag}-{coding}'
+
+
+def matching_etag(etag):
+    "The tag of If-None-Match that matches etag or one of its encoded variants, or None"
+    # If-None-Match uses the weak comparison: W/"x" (e.g. from a proxy) matches "x" too
+    for tag in (etag,) + tuple(encoded_etag(etag, coding) for coding in CODINGS):
+        if request.if_none_match.contains_weak(tag):
+            return tag
+    return None
+
+
+def conditional_response(etag, build_response):
+    """
+    Answers If-None-Match with a bodyless 304 when etag matches, before
+    build_response (ORM load + schema dump) is even called
+    """
+    matched = matching_etag(etag)
+    if matched is not None:
+        response = make_response('', 304, {'Access-Control-Allow-Origin': '*',
+                                           'server': API_NAME})
+        response.set_etag(matched)  # the validator of the representation the client holds
+        return response
+
+    response = build_response()
+    if response.status_code == 200:
+        response.set_etag(etag)
+
+    return response
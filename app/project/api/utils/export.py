@@ -0,0 +1,61 @@
+import io
+import csv
+
+from flask import request, current_app, Response, stream_with_context
+
+from project.api.utils.responses import API_NAME
+from project.api.utils.serializers import row_serializer
+from project.api.utils.json_encoding import json_provider
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_format():
+    "None when ?format= is not supported"
+    fmt = request.args.get('format', 'ndjson')
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+def export_response(query, schema_cls, names, basename, fmt):
+    """
+    Streams every row of query (projected on names) without materializing the result:
+    yield_per => server-side cursor on PostgreSQL, rows are fetched and written
+    YABOOK_EXPORT_BATCH_SIZE at a time so memory stays flat whatever the table size
+    """
+    batch_size = current_app.config['YABOOK_EXPORT_BATCH_SIZE']
+    serialize = row_serializer(schema_cls, tuple(names))
+    rows = query.yield_per(batch_size)
+
+    def generate_ndjson():
+        dumps, batch = json_provider.dumps, []
+        for row in rows:
+            batch.append(dumps(serialize(row)))
+            if len(batch) == batch_size:
+                yield b'\n'.join(batch) + b'\n'
+                batch = []
+        if batch:
+            yield b'\n'.join(batch) + b'\n'
+
+    def generate_csv():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=names)
+        writer.writeheader()
+        for ix, row in enumerate(rows, 1):
+            writer.writerow(serialize(row))
+            if ix % batch_size == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    generate = generate_csv if fmt == 'csv' else generate_ndjson
+    headers = {'Access-Control-Allow-Origin': '*',
+               'server': API_NAME,
+               'Content-Disposition': f'attachment; filename={basename}.{fmt}'}
+
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt],
+                    headers=headers)
@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+import logging
+
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+from project.api.utils.histogram import Histogram
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class HashingBusy(Exception):
+    "Raised when the hashing queue is full or a job timed out - maps to a 503"
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HashingService(object):
+    """
+    Runs the (deliberately slow) pbkdf2 hash / verify calls in a bounded process pool so
+    request workers are not pinned by them. At most max_pending jobs are queued or
+    running, beyond that the caller gets HashingBusy right away instead of piling up.
+    With workers=0 the job runs inline (tests, tiny deployments) but is still metered.
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=5.0, retry_after=1):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+        self.pending = self.max_pending_seen = 0
+        self.rejected = self.timeouts = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+    def _get_executor(self):
+        # created lazily and per process: a pool inherited through fork() is unusable
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _release(self, *args):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def run(self, func, *args):
+        "func must be picklable (module level function or static method)"
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy("hashing queue is full", self.retry_after)
+
+        with self._lock:
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+
+        start = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                return func(*args)
+            finally:
+                self._release()
+                self.latency.observe(time.perf_counter() - start)
+
+        try:
+            future = self._get_executor().submit(func, *args)
+
+        except (BrokenProcessPool, RuntimeError) as ex:
+            self._release()
+            self._reset_executor()
+            logging.error(f"Intercepted Exception: {ex}")
+            raise HashingBusy("hashing pool unavailable", self.retry_after)
+
+        # the slot is held until the job really ends, even if we stop waiting for it
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise HashingBusy("hashing timed out", self.retry_after)
+
+        except BrokenProcessPool as ex:
+            self._reset_executor()
+            logging.error(f"Intercepted Exception: {ex}")
+            raise HashingBusy("hashing pool unavailable", self.retry_after)
+
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    def shutdown(self):
+        self._reset_executor()
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'max_pending': self.max_pending,
+                    'pending': self.pending, 'max_pending_seen': self.max_pending_seen,
+                    'rejected': self.rejected, 'timeouts': self.timeouts,
+                    'latency': self.latency.snapshot()}
+
+
+## Flask extension - one service per app
+
+class Hasher(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['yabook_hasher'] = HashingService(
+            workers=int(app.config.get('YABOOK_HASH_WORKERS', 2)),
+            max_pending=int(app.config.get('YABOOK_HASH_MAX_PENDING', 16)),
+            timeout=float(app.config.get('YABOOK_HASH_TIMEOUT', 5.0)),
+            retry_after=int(app.config.get('YABOOK_HASH_RETRY_AFTER', 1)))
+
+    @property
+    def service(self):
+        return current_app.extensions['yabook_hasher']
+
+    def run(self, func, *args):
+        return self.service.run(func, *args)
+
+    def stats(self):
+        return self.service.stats()
+
+
+hasher = Hasher()
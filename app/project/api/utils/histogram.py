@@ -0,0 +1,30 @@
+import bisect
+import threading
+
+
+class Histogram(object):
+    "Thread-safe fixed-bucket histogram (Prometheus style: cumulative on snapshot)"
+
+    def __init__(self, buckets):
+        self.bounds = tuple(buckets) + (float('inf'),)
+        self._counts = [0] * len(self.bounds)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = self.max = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.bounds, self._counts):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+
+            return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                    'buckets': buckets}
@@ -0,0 +1,89 @@
+import json
+import logging
+import datetime
+import decimal
+
+from flask import current_app, has_app_context
+
+
+## JSON encoding of the API responses: orjson (C accelerated, optional dependency)
+## when installed, the stdlib encoder otherwise. Both write compact UTF-8 bytes and
+## encode datetime / date as ISO 8601 and Decimal as a number.
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibEncoder(object):
+    name = 'stdlib'
+
+    def __init__(self, sort_keys=False):
+        self._encoder = json.JSONEncoder(separators=(',', ':'), sort_keys=sort_keys,
+                                         ensure_ascii=False, default=_default)
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj).encode('utf-8')
+
+
+class OrjsonEncoder(object):
+    name = 'orjson'
+
+    def __init__(self, sort_keys=False):
+        import orjson  # optional dependency, ImportError => stdlib fallback
+
+        self._dumps = orjson.dumps
+        self._option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+    def dumps(self, obj):
+        return self._dumps(obj, default=_default, option=self._option)
+
+
+ENCODERS = {'orjson': OrjsonEncoder, 'stdlib': StdlibEncoder}
+
+
+def make_encoder(kind='auto', sort_keys=False):
+    "kind: orjson | stdlib | auto (orjson when installed)"
+    if kind == 'auto':
+        try:
+            return OrjsonEncoder(sort_keys)
+        except ImportError:
+            return StdlibEncoder(sort_keys)
+
+    try:
+        return ENCODERS[kind](sort_keys)
+
+    except ImportError as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+        return StdlibEncoder(sort_keys)
+
+
+## Flask extension - one encoder per app, selected by YABOOK_JSON_ENCODER
+
+class JsonProvider(object):
+
+    def __init__(self, app=None):
+        self._fallback = StdlibEncoder()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['yabook_json'] = make_encoder(
+            app.config.get('YABOOK_JSON_ENCODER', 'auto'),
+            sort_keys=bool(app.config.get('JSON_SORT_KEYS', False)))
+
+    @property
+    def encoder(self):
+        if has_app_context():
+            return current_app.extensions.get('yabook_json', self._fallback)
+        return self._fallback
+
+    def dumps(self, obj):
+        "obj as UTF-8 encoded JSON bytes"
+        return self.encoder.dumps(obj)
+
+
+json_provider = JsonProvider()
@@ -1,13 +1,96 @@
+import time
+import datetime
+import logging
+
 from flask_mail import Mail, Message
 from flask import current_app
 
+from project.api.utils.database import db
+from project.api.models.outbox import OutboxEmail
+
 mail = Mail()
 
-def send_email(to, subject, template):
-    msg = Message(subject,
-                  recipients=[to],
-                  html=template,
-                  sender=current_app.config['MAIL_DEFAULT_SENDER']
+def build_message(to, subject, template):
+    return Message(subject,
+                   recipients=[to],
+                   html=template,
+                   sender=current_app.config['MAIL_DEFAULT_SENDER']
     )
-    mail.send(msg)
+
+def send_email(to, subject, template):
+    mail.send(build_message(to, subject, template))
     return
+
+def enqueue_email(to, subject, template):
+    "Adds the e-mail to the outbox, it is committed along with the caller's transaction"
+    outbox_email = OutboxEmail(to, subject, template)
+    db.session.add(outbox_email)
+    return outbox_email
+
+
+## Outbox delivery (mail worker)
+
+def _backoff(attempts):
+    base = int(current_app.config['YABOOK_MAIL_BACKOFF'])
+    return datetime.timedelta(seconds=min(base * 2 ** (attempts - 1),
+                                          int(current_app.config['YABOOK_MAIL_MAX_BACKOFF'])))
+
+def _failed(outbox_email, ex, now):
+    outbox_email.attempts += 1
+    outbox_email.last_error = str(ex)[:1024]
+    if outbox_email.attempts >= int(current_app.config['YABOOK_MAIL_MAX_ATTEMPTS']):
+        outbox_email.status = OutboxEmail.FAILED
+    else:
+        outbox_email.next_attempt_at = now + _backoff(outbox_email.attempts)
+
+def deliver_outbox(batch_size=None):
+    """
+    Sends one batch of due e-mails over a single SMTP connection.
+    A failure (connection or message) is retried with exponential backoff
+    until YABOOK_MAIL_MAX_ATTEMPTS. Returns (sent, failed) for the batch.
+    """
+    batch_size = batch_size or int(current_app.config['YABOOK_MAIL_BATCH_SIZE'])
+    now = datetime.datetime.utcnow()
+    batch = OutboxEmail.due(batch_size, now)
+    if not batch:
+        db.session.commit()  # release the (empty) row locks
+        return 0, 0
+
+    sent = failed = 0
+    handled = set()
+    try:
+        with mail.connect() as conn:
+            for outbox_email in batch:
+                handled.add(outbox_email.id)
+                try:
+                    conn.send(build_message(outbox_email.recipient, outbox_email.subject,
+                                            outbox_email.html))
+                    outbox_email.status = OutboxEmail.SENT
+                    outbox_email.sent_at = datetime.datetime.utcnow()
+                    sent += 1
+
+                except Exception as ex:
+                    logging.error(f"Intercepted Exception: {ex}")
+                    _failed(outbox_email, ex, now)
+                    failed += 1
+
+    except Exception as ex:  # could not connect (or lost the connection): retry the rest
+        logging.error(f"Intercepted Exception: {ex}")
+        for outbox_email in batch:
+            if outbox_email.id not in handled:
+                _failed(outbox_email, ex, now)
+                failed += 1
+
+    db.session.commit()
+    return sent, failed
+
+def run_mail_worker(once=False, interval=None):
+    interval = interval or float(current_app.config['YABOOK_MAIL_POLL_INTERVAL'])
+    while True:
+        sent, failed = deliver_outbox()
+        if sent or failed:
+            logging.info(f"mail worker: {sent} sent, {failed} failed")
+        if once:
+            return
+        if not sent:  # batch was not full of work, wait for more
+            time.sleep(interval)
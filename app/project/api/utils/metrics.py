@@ -0,0 +1,321 @@
+import os
+import json
+import glob
+import time
+import fcntl
+import threading
+import logging
+import tempfile
+
+from flask import request, current_app
+
+from project.api.utils.histogram import Histogram
+from project.api.utils.database import db, pool_stats
+from project.api.utils.cache import cache
+from project.api.utils.hashing import hasher
+
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRICS = {
+    'yabook_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status'),
+    'yabook_http_request_errors_total': ('counter', 'HTTP requests answered with a 5xx'),
+    'yabook_http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'yabook_db_pool_checked_out': ('gauge', 'DB connections currently checked out'),
+    'yabook_db_pool_overflow': ('gauge', 'DB connections opened beyond pool_size'),
+    'yabook_db_pool_timeouts_total': ('counter', 'DB pool checkouts that timed out'),
+    'yabook_cache_entries': ('gauge', 'Entries in the detail cache'),
+    'yabook_cache_hits_total': ('counter', 'Detail cache hits'),
+    'yabook_cache_misses_total': ('counter', 'Detail cache misses'),
+    'yabook_cache_evictions_total': ('counter', 'Detail cache LRU evictions'),
+    'yabook_hashing_pending': ('gauge', 'Password hashing jobs queued or running'),
+    'yabook_hashing_rejected_total': ('counter', 'Password hashing jobs rejected (503)'),
+}
+
+
+ARCHIVE = 'metrics_archive.json'
+
+
+class Registry(object):
+    """
+    Metrics of one process. With a directory (multi-worker serving) each process
+    periodically writes its snapshot to <dir>/metrics_<pid>.json and a scrape sums the
+    snapshots of every process - gauges only for the processes still alive. The
+    counters and histograms of a dead process are merged into <dir>/metrics_archive.json
+    and its file removed, so that the sums never go backwards when workers are recycled.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+        self._flusher_pid = None
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, labels=(), value=0):
+        with self._lock:
+            self._gauges[(name, tuple(labels))] = value
+
+    def set_total(self, name, labels=(), value=0):
+        "A counter kept by another component (cache, pool...): its current total"
+        with self._lock:
+            self._counters[(name, tuple(labels))] = value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(REQUEST_BUCKETS)
+        histogram.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                'histograms': [[name, labels, histogram.snapshot()]
+                               for (name, labels), histogram in self._histograms.items()],
+            }
+
+    def flush_due(self):
+        return self.directory is not None and \
+            time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self, force=False):
+        if self.directory is None:
+            return
+        if not force and not self.flush_due():
+            return
+        self._last_flush = time.monotonic()
+
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.metrics_')
+            with os.fdopen(fd, 'w') as out:
+                json.dump(self.snapshot(), out)
+            os.replace(tmp, path)  # atomic: a scrape never reads a partial file
+
+        except OSError as ex:
+            logging.error(f"Intercepted Exception: {ex}")
+
+    def start_flusher(self):
+        "Background flush so that the last requests of an idle worker are not lost"
+        if self.directory is None or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()  # threads do not survive fork(): one per process
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush(force=True)
+
+        threading.Thread(target=loop, name='yabook-metrics-flush', daemon=True).start()
+
+    def collect(self):
+        "Snapshots of every process (just this one without a directory)"
+        if self.directory is None:
+            return [self.snapshot()]
+
+        self.flush(force=True)
+        archive_dead(self.directory)
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                with open(path) as infile:
+                    snapshots.append(json.load(infile))
+            except (OSError, ValueError) as ex:
+                logging.error(f"Intercepted Exception: {ex}")
+        return snapshots
+
+
+def _merge(total, snap):
+    "Adds the counters and histograms of snap to total (gauges are dropped)"
+    counters = {(name, tuple(tuple(label) for label in labels)): value
+                for name, labels, value in total['counters']}
+    for name, labels, value in snap['counters']:
+        key = (name, tuple(tuple(label) for label in labels))
+        counters[key] = counters.get(key, 0) + value
+
+    histograms = {(name, tuple(tuple(label) for label in labels)): histo
+                  for name, labels, histo in total['histograms']}
+    for name, labels, histo in snap['histograms']:
+        key = (name, tuple(tuple(label) for label in labels))
+        merged = histograms.setdefault(key, {'count': 0, 'sum': 0.0, 'buckets': {}})
+        merged['count'] += histo['count']
+        merged['sum'] += histo['sum']
+        for bound, count in histo['buckets'].items():
+            merged['buckets'][bound] = merged['buckets'].get(bound, 0) + count
+
+    return {'pid': None,
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'gauges': [],
+            'histograms': [[name, labels, histo] for (name, labels), histo in histograms.items()]}
+
+
+def archive_dead(directory, pids=None):
+    """
+    Merges the snapshots of dead processes (pids, or every dead one found) into the
+    archive and removes their files - under a lock, so that concurrent scrapes (or the
+    gunicorn child_exit hook) never merge a file twice
+    """
+    try:
+        with open(os.path.join(directory, '.archive.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = []
+            for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+                pid = os.path.basename(path)[len('metrics_'):-len('.json')]
+                if pid.isdigit() and (int(pid) in pids if pids is not None else not _alive(int(pid))):
+                    dead.append(path)
+            if not dead:
+                return
+
+            archive_path = os.path.join(directory, ARCHIVE)
+            archive = {'pid': None, 'counters': [], 'gauges': [], 'histograms': []}
+            if os.path.exists(archive_path):
+                with open(archive_path) as infile:
+                    archive = json.load(infile)
+            for path in dead:
+                with open(path) as infile:
+                    archive = _merge(archive, json.load(infile))
+
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics_')
+            with os.fdopen(fd, 'w') as out:
+                json.dump(archive, out)
+            os.replace(tmp, archive_path)
+            for path in dead:
+                os.remove(path)
+
+    except (OSError, ValueError) as ex:
+        logging.error(f"Intercepted Exception: {ex}")
+
+
+def mark_process_dead(directory, pid):
+    "gunicorn child_exit hook: archives the metrics of the worker right away"
+    archive_dead(directory, [pid])
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def render(snapshots):
+    "Sums the snapshots and renders them in the Prometheus text format (0.0.4)"
+    values, histograms = {}, {}
+    for snap in snapshots:
+        alive = snap['pid'] is not None and (snap['pid'] == os.getpid() or _alive(snap['pid']))
+        for name, labels, value in snap['counters'] + (snap['gauges'] if alive else []):
+            key = (name, tuple(tuple(label) for label in labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, histo in snap['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.setdefault(key, {'count': 0, 'sum': 0.0, 'buckets': {}})
+            total['count'] += histo['count']
+            total['sum'] += histo['sum']
+            for bound, count in histo['buckets'].items():
+                total['buckets'][bound] = total['buckets'].get(bound, 0) + count
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (hname, labels), histo in sorted(histograms.items()):
+                if hname != name:
+                    continue
+                for bound, count in histo['buckets'].items():
+                    lines.append(f'{name}_bucket{_labels_text(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_sum{_labels_text(labels)} {histo["sum"]}')
+                lines.append(f'{name}_count{_labels_text(labels)} {histo["count"]}')
+        else:
+            for (vname, labels), value in sorted(values.items()):
+                if vname == name:
+                    lines.append(f'{name}{_labels_text(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+## Flask extension - one registry per app
+
+class Metrics(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # the env var lets `manage.py serve` hand a directory to workers it forks
+        directory = app.config.get('YABOOK_METRICS_DIR') or os.environ.get('YABOOK_METRICS_DIR')
+        app.extensions['yabook_metrics'] = Registry(
+            directory, float(app.config.get('YABOOK_METRICS_FLUSH_INTERVAL', 1.0)))
+
+    @property
+    def registry(self):
+        return current_app.extensions['yabook_metrics']
+
+    def record_request(self, response, duration):
+        endpoint = request.endpoint or 'unmatched'
+        registry = self.registry
+        registry.inc('yabook_http_requests_total',
+                     (('endpoint', endpoint), ('method', request.method),
+                      ('status', str(response.status_code))))
+        if response.status_code >= 500:
+            registry.inc('yabook_http_request_errors_total', (('endpoint', endpoint),))
+        if duration is not None:
+            registry.observe('yabook_http_request_duration_seconds',
+                             (('endpoint', endpoint),), duration)
+
+        if registry.directory is not None:
+            registry.start_flusher()
+            if registry.flush_due():
+                self.collect_gauges()
+                registry.flush()
+
+    def collect_gauges(self):
+        registry = self.registry
+        pool = pool_stats(db.engine)
+        registry.set('yabook_db_pool_checked_out', value=pool.get('checked_out', 0))
+        registry.set('yabook_db_pool_overflow', value=pool.get('overflow', 0))
+        # counters owned by other components: their totals, archived with the process
+        registry.set_total('yabook_db_pool_timeouts_total', value=pool.get('timeouts', 0))
+
+        stats = cache.stats()
+        registry.set_total('yabook_cache_hits_total', value=stats.get('hits', 0))
+        registry.set_total('yabook_cache_misses_total', value=stats.get('misses', 0))
+        if stats.get('backend') == 'local':
+            # a shared backend's size / evictions are server-wide: summed over the workers
+            # they would be counted once per worker => left to the server's own metrics
+            registry.set('yabook_cache_entries', value=stats.get('size', 0))
+            registry.set_total('yabook_cache_evictions_total', value=stats.get('evictions', 0))
+
+        stats = hasher.stats()
+        registry.set('yabook_hashing_pending', value=stats['pending'])
+        registry.set_total('yabook_hashing_rejected_total', value=stats['rejected'])
+
+    def render(self):
+        self.collect_gauges()
+        return render(self.registry.collect())
+
+
+metrics = Metrics()
@@ -0,0 +1,173 @@
+import json
+import base64
+import binascii
+
+from flask import request, current_app
+from sqlalchemy import and_, or_
+
+
+class CursorError(ValueError):
+    "Raised when an `after` cursor cannot be decoded or does not match the sort"
+
+
+class FilterError(ValueError):
+    "Raised when a list filter is malformed or not allowed with the requested sort"
+
+
+def cursor_mode_requested():
+    "Keyset mode is selected by `after` or `limit`, `page` keeps the legacy contract"
+    return 'page' not in request.args and \
+        ('after' in request.args or 'limit' in request.args)
+
+
+def get_limit():
+    limit = request.args.get('limit', current_app.config['YABOOK_ITEMS_PER_PAGE'], type=int)
+    max_limit = current_app.config['YABOOK_MAX_ITEMS_PER_PAGE']
+    return max(1, min(limit, max_limit))
+
+
+def get_sort(allowed, default='id'):
+    "Returns (key, column, descending) for ?sort=<key>|-<key>, key must be in allowed"
+    sort = request.args.get('sort', default) or default
+    key = sort[1:] if sort.startswith('-') else sort
+    if key not in allowed:
+        raise CursorError(f"sort key {sort} not allowed")
+
+    return sort, allowed[key], sort.startswith('-')
+
+
+def get_int_arg(name):
+    "Strict version of request.args.get(name, type=int): a malformed value is an error"
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise FilterError(f"{name} must be an integer")
+
+
+def get_ids_arg(name='ids'):
+    """
+    ?ids=3,1,2 as a list of distinct ints in the requested order, bounded by
+    YABOOK_MAX_IDS_PER_REQUEST
+    """
+    try:
+        ids = [int(value) for value in request.args.get(name, '').split(',') if value.strip()]
+    except ValueError:
+        raise FilterError(f"{name} must be a comma separated list of integers")
+
+    ids = list(dict.fromkeys(ids))
+    max_ids = current_app.config['YABOOK_MAX_IDS_PER_REQUEST']
+    if not ids or len(ids) > max_ids:
+        raise FilterError(f"{name} must hold between 1 and {max_ids} ids")
+
+    return ids
+
+
+def prefix_match(column, prefix, dialect):
+    """
+    column starts with prefix. On SQLite (byte-wise BINARY collation) it is written as
+    a range (column >= prefix AND column < next prefix) that the plain b-tree index on
+    column serves, the LIKE being an exact re-check. Elsewhere the range is wrong under
+    a linguistic collation (en_US.UTF-8 ignores punctuation and spaces at first level:
+    'a-z' > 'a.'), so it is LIKE 'prefix%' alone - on PostgreSQL served by the
+    text_pattern_ops indexes declared along with Book
+    """
+    # the pattern is built here: a constant 'prefix%' is what the planner can use an index for
+    escaped = prefix.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    like = column.like(escaped + '%', escape='/')
+    if dialect != 'sqlite':
+        return like
+
+    cond = [like, column >= prefix]
+    if ord(prefix[-1]) < 0x10FFFF:
+        cond.append(column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return and_(*cond)
+
+
+def encode_cursor(sort, values):
+    raw = json.dumps([sort] + list(values), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _check_cursor_value(value, column):
+    "The decoded value must have the type of the column (or be NULL when it is nullable)"
+    if value is None:
+        if not column.nullable:
+            raise CursorError("invalid cursor value")
+        return
+
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return
+
+    if isinstance(value, bool) or not isinstance(value, expected):
+        raise CursorError("invalid cursor value")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        decoded = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+
+    except (ValueError, binascii.Error, UnicodeError) as ex:
+        raise CursorError(f"invalid cursor: {ex}")
+
+    if not isinstance(decoded, list) or len(decoded) != 3 or decoded[0] != sort:
+        raise CursorError("cursor does not match requested sort")
+
+    return decoded[1], decoded[2]
+
+
+def keyset_paginate(query, pk, sort, column, descending, after=None, limit=None):
+    """
+    Seek pagination: WHERE (column, pk) > (last_value, last_pk) ORDER BY column, pk LIMIT n+1
+    No OFFSET and no COUNT(*), so the cost of a page does not depend on its depth.
+    NULLs of a nullable column sort last (first when descending), as in a PostgreSQL b-tree.
+    Returns (items, next_cursor) - next_cursor is None on the last page.
+    """
+    if after:
+        last_value, last_pk = decode_cursor(after, sort)
+        _check_cursor_value(last_pk, pk)
+        if column is not pk:
+            _check_cursor_value(last_value, column)
+        query = query.filter(_seek(pk, column, descending, last_value, last_pk))
+
+    if column is pk:
+        order = [pk.desc() if descending else pk.asc()]
+    elif not column.nullable:
+        order = [column.desc(), pk.desc()] if descending else [column.asc(), pk.asc()]
+    elif descending:
+        order = [column.desc().nullsfirst(), pk.desc()]
+    else:
+        order = [column.asc().nullslast(), pk.asc()]
+
+    items = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, (getattr(last, column.key), getattr(last, pk.key)))
+
+    return items, next_cursor
+
+
+def _seek(pk, column, descending, last_value, last_pk):
+    "Rows after (last_value, last_pk) in the order of keyset_paginate"
+    if column is pk:
+        return pk < last_pk if descending else pk > last_pk
+
+    if last_value is None:  # within the NULLs: last of all ascending, first descending
+        cond = and_(column.is_(None), pk < last_pk if descending else pk > last_pk)
+        return or_(column.isnot(None), cond) if descending else cond
+
+    if descending:
+        return or_(column < last_value, and_(column == last_value, pk < last_pk))
+
+    cond = [column > last_value, and_(column == last_value, pk > last_pk)]
+    if column.nullable:
+        cond.append(column.is_(None))
+    return or_(*cond)
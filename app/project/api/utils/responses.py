@@ -1,4 +1,6 @@
-from flask import make_response, jsonify
+from flask import current_app
+
+from project.api.utils.json_encoding import json_provider
 
 API_NAME = 'Flask REST API'
 
@@ -41,12 +43,24 @@ BAD_REQUEST_400 = {
     "message": "Bad request"
 }
 
+CONFLICT_409 = {
+    "http_code": 409,
+    "code": "conflict",
+    "message": "The resource was modified concurrently, reload it and retry"
+}
+
 SERVER_ERROR_500 = {
     "http_code": 500,
     "code": "serverError",
     "message": "Server error"
 }
 
+SERVICE_UNAVAILABLE_503 = {
+    "http_code": 503,
+    "code": "serviceUnavailable",
+    "message": "Service temporarily overloaded, retry later"
+}
+
 SERVER_ERROR_404 = {
     "http_code": 404,
     "code": "notFound",
@@ -67,24 +81,24 @@ UNAUTHORIZED_403 = {
 
 
 def response_with(response, value=None, message=None, error=None,
-                  headers={}, pagination=None):
-    result = {}
-    if value is not None:
-        result.update(value)
+                  headers=None, pagination=None):
+    result = {**value, 'code': response['code']} if value is not None \
+        else {'code': response['code']}
 
     if response.get('message', None) is not None:
-        result.update({'message': response['message']})
-
-    result.update({'code': response['code']})
+        result['message'] = response['message']
 
     if error is not None:
-        result.update({'errors': error})
+        result['errors'] = error
 
     if pagination is not None:
-        result.update({'pagination': pagination})
+        result['pagination'] = pagination
 
-    headers.update({'Access-Control-Allow-Origin': '*'})
-    headers.update({'server': API_NAME})
+    response_headers = {'Access-Control-Allow-Origin': '*', 'server': API_NAME}
+    if headers:
+        response_headers.update(headers)
 
-    return make_response(jsonify(result), response['http_code'],
-                         headers)
+    return current_app.response_class(json_provider.dumps(result),
+                                      status=response['http_code'],
+                                      headers=response_headers,
+                                      mimetype='application/json')
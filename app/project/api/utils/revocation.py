@@ -0,0 +1,167 @@
+import time
+import heapq
+import calendar
+import datetime
+import threading
+
+from flask import current_app
+from sqlalchemy import or_
+
+from project.api.utils.database import db
+from project.api.models.revoked_tokens import RevokedToken
+
+
+class RevocationList(object):
+    """
+    In-memory copy of the revoked_tokens table, one per worker process. The per
+    request check (JWT blacklist loader) is a dict lookup; the copy is brought up to
+    date at most every refresh_interval seconds with the rows revoked since the last
+    refresh, so another worker's revocation is enforced here within refresh_interval.
+    Revocations made by this worker are enforced right away.
+
+    The rows are re-read with an overlap of margin seconds (revoked_at > last seen -
+    margin): a row is only visible once committed, which can be after a row revoked
+    later - and the workers' clocks may disagree. Rows already known are re-added as
+    no-ops. Revoked jtis are dropped once their token has expired.
+    """
+
+    def __init__(self, refresh_interval=1.0, identity_claim='identity', margin=60,
+                 prune_interval=3600):
+        self.refresh_interval = refresh_interval
+        self.identity_claim = identity_claim
+        self.margin = datetime.timedelta(seconds=margin)
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._jtis = {}        # jti -> exp (seconds since the epoch), None: never expires
+        self._expiries = []    # heap of (exp, jti)
+        self._not_after = {}   # identity -> iat of the last revoked token
+        self._last_seen = None
+        self._next_refresh = 0.0
+        self._next_prune = time.monotonic() + prune_interval
+        self.refreshes = 0
+
+    def _add(self, jti, identity, not_after, expires=None):
+        if jti is not None and jti not in self._jtis:
+            self._jtis[jti] = expires
+            if expires is not None:
+                heapq.heappush(self._expiries, (expires, jti))
+        if not_after is not None:
+            self._not_after[identity] = max(not_after, self._not_after.get(identity, 0))
+
+    def _drop_expired(self, now):
+        while self._expiries and self._expiries[0][0] < now:
+            _, jti = heapq.heappop(self._expiries)
+            self._jtis.pop(jti, None)
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() < self._next_refresh:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is refreshing, go on with the current copy
+
+        try:
+            now = datetime.datetime.utcnow()
+            query = db.session.query(RevokedToken.jti, RevokedToken.identity,
+                                     RevokedToken.not_after, RevokedToken.expires_at,
+                                     RevokedToken.revoked_at) \
+                              .filter(or_(RevokedToken.expires_at.is_(None),
+                                          RevokedToken.expires_at > now))
+            if self._last_seen is not None:
+                query = query.filter(RevokedToken.revoked_at > self._last_seen - self.margin)
+
+            for row in query:
+                self._add(row.jti, row.identity, row.not_after, _epoch(row.expires_at))
+                self._last_seen = max(row.revoked_at, self._last_seen or row.revoked_at)
+            self._drop_expired(time.time())
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            self.refreshes += 1
+
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, decoded_token):
+        self.refresh()
+        if decoded_token.get('jti') in self._jtis:
+            return True
+        not_after = self._not_after.get(decoded_token.get(self.identity_claim))
+        return not_after is not None and decoded_token.get('iat', 0) <= not_after
+
+    def revoke(self, decoded_token):
+        "Revokes one token, given its decoded claims"
+        expires = decoded_token.get('exp')
+        row = RevokedToken(decoded_token[self.identity_claim], jti=decoded_token['jti'],
+                           expires_at=datetime.datetime.utcfromtimestamp(expires) if expires else None)
+        db.session.add(row)
+        if time.monotonic() >= self._next_prune:
+            self.prune()
+        db.session.commit()
+        with self._lock:  # refresh may be updating the dict / heap
+            self._add(row.jti, row.identity, None, expires)
+
+    def revoke_all(self, identity):
+        """
+        Revokes every token of identity issued so far. iat has a one second resolution:
+        a token issued within the same second is revoked as well
+        """
+        row = RevokedToken(identity, not_after=int(time.time()))
+        # the new cutoff supersedes the previous ones
+        RevokedToken.query.filter(RevokedToken.identity == identity,
+                                  RevokedToken.not_after < row.not_after) \
+                          .delete(synchronize_session=False)
+        db.session.add(row)
+        db.session.commit()
+        with self._lock:
+            self._add(None, identity, row.not_after)
+
+    def prune(self):
+        "Deletes the rows of the tokens expired by now - in the caller's transaction"
+        self._next_prune = time.monotonic() + self.prune_interval
+        return RevokedToken.query.filter(RevokedToken.expires_at < datetime.datetime.utcnow()) \
+                                 .delete(synchronize_session=False)
+
+    def stats(self):
+        return {'jtis': len(self._jtis), 'identities': len(self._not_after),
+                'last_seen': self._last_seen.isoformat() if self._last_seen else None,
+                'refreshes': self.refreshes, 'refresh_interval': self.refresh_interval}
+
+
+def _epoch(value):
+    "naive UTC datetime -> seconds since the epoch"
+    return calendar.timegm(value.utctimetuple()) if value is not None else None
+
+
+## Flask extension - one revocation list per app
+
+class Revocation(object):
+
+    def __init__(self, app=None, jwt=None):
+        if app is not None:
+            self.init_app(app, jwt)
+
+    def init_app(self, app, jwt):
+        "jwt: the app's JWTManager, its blacklist loader is pointed at the revocation list"
+        app.extensions['yabook_revocation'] = RevocationList(
+            float(app.config.get('YABOOK_REVOCATION_REFRESH', 1.0)),
+            app.config.get('JWT_IDENTITY_CLAIM', 'identity'),
+            margin=int(app.config.get('YABOOK_REVOCATION_MARGIN', 60)),
+            prune_interval=int(app.config.get('YABOOK_REVOCATION_PRUNE_INTERVAL', 3600)))
+        jwt.token_in_blacklist_loader(self.is_revoked)
+
+    @property
+    def revocation_list(self):
+        return current_app.extensions['yabook_revocation']
+
+    def is_revoked(self, decoded_token):
+        return self.revocation_list.is_revoked(decoded_token)
+
+    def revoke(self, decoded_token):
+        self.revocation_list.revoke(decoded_token)
+
+    def revoke_all(self, identity):
+        self.revocation_list.revoke_all(identity)
+
+    def stats(self):
+        return self.revocation_list.stats()
+
+
+revocation = Revocation()
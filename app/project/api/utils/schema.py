@@ -0,0 +1,59 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateIndex
+
+from project.api.utils.database import db
+from project.api.models.books import PATTERN_INDEXES
+from project.api.utils.search import create_search_index
+
+
+## Upgrade of a database created by an earlier version: db.create_all() only creates the
+## missing tables, the columns and indexes added since to an existing table are created
+## here. Every step checks (or uses IF NOT EXISTS) first => safe to run at each startup.
+
+
+def _column_ddl(column, dialect):
+    ddl = f'{column.name} {column.type.compile(dialect=dialect)}'
+    if column.server_default is not None:
+        default = column.server_default.arg
+        default = default.text if hasattr(default, 'text') else f"'{default}'"
+        ddl += f' DEFAULT {default}'
+        if not column.nullable:  # existing rows get the default
+            ddl += ' NOT NULL'
+    return ddl
+
+
+def _add_missing_columns(connection, inspector, tbl):
+    existing = {col['name'] for col in inspector.get_columns(tbl.name)}
+    for column in tbl.columns:
+        if column.name not in existing:
+            connection.execute(text(f'ALTER TABLE {tbl.name} ADD COLUMN '
+                                    f'{_column_ddl(column, connection.dialect)}'))
+
+
+def _create_missing_indexes(connection, tbl):
+    # expression indexes (lower(email)...) are not reflected => IF NOT EXISTS, not the inspector
+    for index in tbl.indexes:
+        statement = str(CreateIndex(index).compile(dialect=connection.dialect))
+        try:
+            with connection.begin_nested():
+                connection.execute(text(statement.replace(' INDEX ', ' INDEX IF NOT EXISTS ', 1)))
+
+        except SQLAlchemyError as ex:  # e.g. rows already breaking a new unique index
+            logging.error(f"Intercepted Exception: {ex}")
+
+
+def upgrade_schema(connection):
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    for tbl in db.Model.metadata.sorted_tables:
+        if tbl.name in tables:
+            _add_missing_columns(connection, inspector, tbl)
+            _create_missing_indexes(connection, tbl)
+
+    if connection.dialect.name == 'postgresql':
+        for name, columns in PATTERN_INDEXES:
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON books ({columns})'))
+    create_search_index(connection)
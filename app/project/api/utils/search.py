@@ -0,0 +1,112 @@
+import re
+import logging
+
+from sqlalchemy import event, func, text, table, column, literal_column, or_
+from sqlalchemy.exc import OperationalError
+
+from project.api.models.authors import Author
+from project.api.models.books import Book
+
+
+## Full-text search over book titles and author names. The index lives outside the ORM
+## models and is maintained by the database itself:
+##  - PostgreSQL: a generated tsvector column with a GIN index
+##  - SQLite: an external content FTS5 table kept in sync by triggers
+## Other dialects fall back to an (unranked, unindexed) LIKE scan.
+
+SEARCHED_COLUMNS = {
+    Book.__table__: ('title',),
+    Author.__table__: ('first_name', 'last_name'),
+}
+
+MAX_TOKENS = 8
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_tokens(q):
+    "Words of the query - everything else (operators, quotes...) is dropped"
+    return TOKEN_RE.findall(q or '')[:MAX_TOKENS]
+
+
+def _postgresql_ddl(name, cols):
+    document = " || ' ' || ".join(f"coalesce({col}, '')" for col in cols)
+    return [
+        f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS search tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_search ON {name} USING gin (search)",
+    ]
+
+
+def _sqlite_ddl(name, cols):
+    fts, names = f'{name}_fts', ', '.join(cols)
+    new, old = ', '.join(f'new.{col}' for col in cols), ', '.join(f'old.{col}' for col in cols)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{name}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {name} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",  # rows inserted before the index
+    ]
+
+
+def create_search_index(connection, tables=None):
+    "Idempotent: also used to index a database created before the search endpoints"
+    for tbl in tables or SEARCHED_COLUMNS:
+        cols = SEARCHED_COLUMNS[tbl]
+        if connection.dialect.name == 'postgresql':
+            statements = _postgresql_ddl(tbl.name, cols)
+        elif connection.dialect.name == 'sqlite':
+            statements = _sqlite_ddl(tbl.name, cols)
+        else:
+            statements = []
+
+        try:
+            for statement in statements:
+                connection.execute(text(statement))
+
+        except OperationalError as ex:  # e.g. SQLite built without FTS5
+            logging.error(f"Intercepted Exception: {ex}")
+
+
+def _drop_search_index(connection, tbl):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f'DROP TABLE IF EXISTS {tbl.name}_fts'))
+
+
+for _tbl in SEARCHED_COLUMNS:
+    event.listen(_tbl, 'after_create',
+                 lambda target, connection, **kw: create_search_index(connection, [target]))
+    event.listen(_tbl, 'before_drop',
+                 lambda target, connection, **kw: _drop_search_index(connection, target))
+
+
+def search_query(query, model, tokens):
+    """
+    Narrows query (on model) to the rows matching every token - the last one as a
+    prefix, for type-ahead - ordered by relevance, best first
+    """
+    name = model.__tablename__
+    dialect = query.session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in tokens))
+        document = literal_column(f'{name}.search')
+        return query.filter(document.op('@@')(tsquery)) \
+                    .order_by(func.ts_rank(document, tsquery).desc(), model.id)
+
+    if dialect == 'sqlite':
+        fts = table(f'{name}_fts', column('rowid'), column('rank'))
+        match = ' '.join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+        return query.join(fts, fts.c.rowid == model.id) \
+                    .filter(text(f'{name}_fts MATCH :match').bindparams(match=match)) \
+                    .order_by(fts.c.rank, model.id)
+
+    cols = [func.lower(getattr(model, col)) for col in SEARCHED_COLUMNS[model.__table__]]
+    for token in tokens:
+        query = query.filter(or_(*(col.contains(token.lower(), autoescape=True) for col in cols)))
+    return query.order_by(model.id)
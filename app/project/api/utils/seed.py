@@ -0,0 +1,158 @@
+import io
+import csv
+import random
+
+from sqlalchemy import select, text
+
+from project.api.utils.database import db
+from project.api.models.authors import Author
+from project.api.models.books import Book
+from project.api.models.users import User
+from project.api.models.change_counters import ChangeCounter
+from project.api.models.catalog_stats import record_inserts
+
+
+SEED_PASSWORD = 'seed-password'
+
+FIRST_NAMES = ('Ada', 'Albert', 'Alice', 'Anna', 'Arthur', 'Boris', 'Charles', 'Clara',
+               'David', 'Edith', 'Elena', 'Emile', 'Franz', 'George', 'Hannah', 'Henri',
+               'Isaac', 'Jane', 'Jorge', 'Karen', 'Leo', 'Lucia', 'Marcel', 'Maria',
+               'Naomi', 'Oscar', 'Pablo', 'Rosa', 'Simone', 'Toni', 'Ursula', 'Victor',
+               'Virginia', 'Walter', 'Yukio', 'Zadie')
+
+LAST_NAMES = ('Achebe', 'Atwood', 'Austen', 'Borges', 'Bronte', 'Calvino', 'Camus',
+              'Dickens', 'Eco', 'Eliot', 'Faulkner', 'Flaubert', 'Hugo', 'Ishiguro',
+              'Joyce', 'Kafka', 'Le Guin', 'Mann', 'Marquez', 'Mishima', 'Morrison',
+              'Murakami', 'Nabokov', 'Orwell', 'Proust', 'Rushdie', 'Sand', 'Smith',
+              'Tolstoy', 'Twain', 'Woolf', 'Yourcenar', 'Zola')
+
+TITLE_ADJECTIVES = ('Silent', 'Lost', 'Golden', 'Hidden', 'Broken', 'Endless', 'Last',
+                    'Burning', 'Quiet', 'Crimson', 'Distant', 'Winter', 'Secret', 'Little')
+
+TITLE_NOUNS = ('River', 'Garden', 'Mountain', 'City', 'Letter', 'Island', 'Voyage',
+               'House', 'Shadow', 'Kingdom', 'Mirror', 'Orchard', 'Harbour', 'Clock')
+
+
+## Deterministic row generators - same seed, same data set
+
+def _author_rows(rnd, count):
+    for _ in range(count):
+        yield {'first_name': rnd.choice(FIRST_NAMES), 'last_name': rnd.choice(LAST_NAMES)}
+
+
+def _book_rows(rnd, author_ids, books_per_author):
+    for author_id in author_ids:
+        for _ in range(books_per_author):
+            title = f'The {rnd.choice(TITLE_ADJECTIVES)} {rnd.choice(TITLE_NOUNS)}'
+            if rnd.random() < 0.3:
+                title += f' {rnd.choice(("II", "III", "Revisited", "Returns"))}'
+            yield {'title': title, 'year': rnd.randint(1850, 2020), 'author_id': author_id}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+## Writers
+
+def _copy_rows(connection, table, rows):
+    "COPY ... FROM STDIN (CSV) through the DBAPI connection of the current transaction"
+    names = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[name] is None else row[name] for name in names])
+    buffer.seek(0)
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {table.name} ({", ".join(names)}) FROM STDIN WITH (FORMAT csv)',
+                           buffer)
+    finally:
+        cursor.close()
+
+
+def _insert_rows(connection, table, rows):
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        _copy_rows(connection, table, rows)
+    else:
+        connection.execute(table.insert(), rows)  # executemany
+
+
+def _insert_authors(connection, rows):
+    "Inserts a chunk of authors, returns their ids (in rows order)"
+    table = Author.__table__
+    if connection.dialect.name == 'postgresql':
+        # ids drawn from the sequence first => concurrent inserts can't get mixed in
+        ids = [id for id, in connection.execute(
+            text("SELECT nextval(pg_get_serial_sequence('authors', 'id')) "
+                 "FROM generate_series(1, :count)"), count=len(rows))]
+        _insert_rows(connection, table, [dict(row, id=id) for row, id in zip(rows, ids)])
+        return ids
+
+    if connection.dialect.name == 'sqlite':
+        # the insert holds the database write lock until the commit => the newest ids are ours
+        _insert_rows(connection, table, rows)
+        newest = connection.execute(select([table.c.id]).order_by(table.c.id.desc())
+                                    .limit(len(rows)))
+        return sorted(id for id, in newest)
+
+    return [connection.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+
+def seed_db(authors, books_per_author, users, seed=42, chunk_size=10000,
+            password=SEED_PASSWORD, hash_each=False, user_prefix='user', progress=None):
+    """
+    Bulk loads a synthetic catalog in the current DB: COPY on PostgreSQL, executemany
+    elsewhere, one commit per chunk of authors (with their books) or users so that memory
+    and transaction size stay bounded. Passwords are hashed once and the hash shared by
+    every user unless hash_each (one pbkdf2 call per user - slow by design).
+    progress(inserted) is called after each commit. Returns the rows inserted per table.
+    """
+    rnd = random.Random(seed)
+    author_chunk = max(1, chunk_size // max(1, books_per_author))
+    inserted = {'authors': 0, 'books': 0, 'users': 0}
+
+    try:
+        for chunk in _chunks(_author_rows(rnd, authors), author_chunk):
+            connection = db.session.connection()
+            author_ids = _insert_authors(connection, chunk)
+            record_inserts(connection, 'authors', chunk)
+            books = 0
+            for books_chunk in _chunks(_book_rows(rnd, author_ids, books_per_author), chunk_size):
+                _insert_rows(connection, Book.__table__, books_chunk)
+                record_inserts(connection, 'books', books_chunk)
+                books += len(books_chunk)
+
+            # Core inserts bypass the ORM flush hooks
+            ChangeCounter.bump(connection, ['authors', 'books'])
+            db.session.commit()
+            inserted['authors'] += len(chunk)
+            inserted['books'] += books
+            if progress is not None:
+                progress(inserted)
+
+        shared_hash = User.generate_hash(password)
+        user_rows = ({'username': f'{user_prefix}{ix}', 'email': f'{user_prefix}{ix}@example.org',
+                      'password': User.generate_hash(password) if hash_each else shared_hash,
+                      'isVerified': True}
+                     for ix in range(users))
+        for chunk in _chunks(user_rows, chunk_size):
+            _insert_rows(db.session.connection(), User.__table__, chunk)
+            db.session.commit()
+            inserted['users'] += len(chunk)
+            if progress is not None:
+                progress(inserted)
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return inserted
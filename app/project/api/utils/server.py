@@ -0,0 +1,97 @@
+import os
+import glob
+import logging
+import tempfile
+
+from project.api.utils.database import db
+from project.api.utils.metrics import mark_process_dead
+
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'gevent': 'gevent',      # cooperative (greenlet) workers, needs gevent and psycogreen
+}
+
+
+def _green_psycopg(server, worker):
+    # psycopg2 is a C extension, gevent's monkey-patching does not reach its socket waits:
+    # without the wait callback one query blocks every greenlet of the worker. Installed
+    # before the worker loads the app => every connection of the pool is green.
+    from psycogreen.gevent import patch_psycopg  # optional dependency, gevent workers only
+
+    patch_psycopg()
+    logging.info(f"worker {worker.pid}: psycopg2 patched for gevent")
+
+
+def _post_fork(app):
+    def post_fork(server, worker):
+        # connections opened by the master (create_all at startup) must not be shared
+        # between processes: drop the inherited pool, each worker opens its own
+        with app.app_context():
+            db.get_engine().dispose()
+        logging.info(f"worker {worker.pid}: SQLAlchemy engine disposed after fork")
+    return post_fork
+
+
+def gunicorn_options(bind='0.0.0.0:5000', workers=2, threads=1, worker_class='sync',
+                     timeout=30, graceful_timeout=30, max_requests=0, pidfile=None,
+                     preload=False):
+    "gunicorn settings of serve() - preload is forced off for the gevent workers"
+    if threads > 1 and worker_class == 'sync':
+        worker_class = 'gthread'
+    if worker_class == 'gevent':
+        preload = False  # the app must be imported after the worker monkey-patched the stdlib
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': WORKER_CLASSES[worker_class],
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'pidfile': pidfile,
+        'preload_app': preload,
+    }
+    if worker_class == 'gevent':
+        options['post_fork'] = _green_psycopg
+    return options
+
+
+def serve(create_app, preload=False, **kwargs):
+    """
+    Runs create_app() under gunicorn (prefork), kwargs: see gunicorn_options.
+    Graceful reload: send SIGHUP to the master (pid in pidfile), workers are replaced
+    once their in-flight requests end and import the code anew.
+    With preload, the app is imported once in the master and shared copy-on-write, but
+    SIGHUP then restarts the workers from the master's already imported app: deploying
+    new code takes a binary upgrade (SIGUSR2 to the master, then SIGQUIT to the old one).
+    """
+    from gunicorn.app.base import BaseApplication  # optional dependency, serve only
+
+    options = gunicorn_options(preload=preload, **kwargs)
+    preload = options['preload_app']
+
+    # per-process metrics snapshots, summed by /metrics (see utils/metrics.py)
+    metrics_dir = os.environ.setdefault('YABOOK_METRICS_DIR',
+                                        tempfile.mkdtemp(prefix='yabook-metrics-'))
+    for path in glob.glob(os.path.join(metrics_dir, 'metrics_*.json')):
+        os.remove(path)  # left over by a previous run
+    options['child_exit'] = lambda server, worker: mark_process_dead(metrics_dir, worker.pid)
+
+    app = create_app() if preload else None
+    if preload:  # never with gevent => no _green_psycopg to replace
+        options['post_fork'] = _post_fork(app)
+
+    class YabookApplication(BaseApplication):
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app if preload else create_app()
+
+    YabookApplication().run()
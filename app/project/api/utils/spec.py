@@ -0,0 +1,68 @@
+import hashlib
+import threading
+
+from flask import current_app, request
+from flask_swagger import swagger
+
+from project.api.utils.etag import conditional_response, make_etag
+from project.api.utils.json_encoding import json_provider
+
+
+## OpenAPI spec: flask_swagger parses the YAML docstring of every route, that is done
+## once per process (lazily, or at startup with YABOOK_SPEC_EAGER). The serialized bytes
+## are kept split around the only per-request field, info.base (the host url).
+
+HOST_PLACEHOLDER = '__YABOOK_HOST_URL__'
+
+
+class SpecDocument(object):
+
+    def __init__(self, app):
+        swag = swagger(app, prefix=app.config['URL_PREFIX'])
+        swag['info']['base'] = HOST_PLACEHOLDER
+        swag['info']['version'] = app.config['API_VER']
+        swag['info']['title'] = app.config['APP_NAME']
+
+        with app.app_context():  # encoder selected by the app config
+            body = json_provider.dumps(swag)
+        self.head, self.tail = body.split(json_provider.dumps(HOST_PLACEHOLDER), 1)
+        self.digest = hashlib.sha1(body).hexdigest()
+
+    def render(self, host_url):
+        return self.head + json_provider.dumps(host_url) + self.tail
+
+
+class ApiSpec(object):
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        "To be called once every route is registered"
+        app.extensions['yabook_spec'] = None
+        if app.config.get('YABOOK_SPEC_EAGER', False):
+            app.extensions['yabook_spec'] = SpecDocument(app)
+
+    @property
+    def document(self):
+        app = current_app._get_current_object()
+        document = app.extensions.get('yabook_spec')
+        if document is None:
+            with self._lock:  # one build, even when the first requests are concurrent
+                document = app.extensions.get('yabook_spec')
+                if document is None:
+                    document = app.extensions['yabook_spec'] = SpecDocument(app)
+        return document
+
+    def response(self):
+        document = self.document
+        host_url = request.host_url  # "http://localhost:5000/"
+        return conditional_response(
+            make_etag('spec', document.digest, host_url),
+            lambda: current_app.response_class(document.render(host_url),
+                                               mimetype='application/json'))
+
+
+api_spec = ApiSpec()
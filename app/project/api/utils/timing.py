@@ -0,0 +1,100 @@
+import time
+import random
+import logging
+
+from contextlib import contextmanager
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+## Per-request cost accounting: DB time and query count (engine events), serialization
+## time (schema dump / row serializers) and total time, sent as a Server-Timing header
+## and optionally logged for a sample of the requests
+
+def _timing():
+    if has_app_context():
+        return g.get('_timing')
+    return None
+
+
+@contextmanager
+def timed(key):
+    "Adds the elapsed time to key - re-entrant, nested dumps are only counted once"
+    timing = _timing()
+    if timing is None or timing['depth'].get(key):
+        yield
+        return
+
+    timing['depth'][key] = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing[key] += time.perf_counter() - start
+        timing['depth'][key] = 0
+
+
+class TimedSchemaMixin(object):
+    "Put it first in the bases of a marshmallow schema to account its dump time"
+
+    def dump(self, obj, *, many=None):
+        with timed('dump'):
+            return super().dump(obj, many=many)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_timing_start', []).append(time.perf_counter())
+
+
+def _statement_done(conn):
+    start = conn.info['_timing_start'].pop()
+    timing = _timing()
+    if timing is not None:
+        timing['db'] += time.perf_counter() - start
+        timing['queries'] += 1
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _statement_done(conn)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute: its start would be left
+    # on the (pooled) connection and popped by the next statement
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('_timing_start'):
+        _statement_done(conn)
+
+
+def start_timing():
+    g._timing = {'start': time.perf_counter(), 'db': 0.0, 'queries': 0, 'dump': 0.0,
+                 'depth': {}}
+
+
+def finish_timing(response):
+    timing = g.pop('_timing', None)
+    if timing is None:
+        return response
+
+    total = time.perf_counter() - timing['start']
+    g.request_duration = total
+    if current_app.config.get('YABOOK_SERVER_TIMING', True):
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={timing["db"] * 1000:.2f};desc="{timing["queries"]} queries"',
+            f'dump;dur={timing["dump"] * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+    sample = float(current_app.config.get('YABOOK_TIMING_LOG_SAMPLE', 0.0))
+    if sample > 0 and random.random() < sample:
+        logging.getLogger('yabook.timing').info(
+            f"{request.method} {request.path} endpoint={request.endpoint} "
+            f"status={response.status_code} total_ms={total * 1000:.2f} "
+            f"db_ms={timing['db'] * 1000:.2f} queries={timing['queries']} "
+            f"dump_ms={timing['dump'] * 1000:.2f}")
+
+    return response